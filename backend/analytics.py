@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import Date, ForeignKey, Index, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from config import settings
+from db import (
+    AsyncSessionLocal,
+    Base,
+    Category,
+    Product,
+    Purchased,
+    dialect_insert,
+    product_category,
+)
+from instrumentation import traced
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_WATERMARK = "purchased_rollups"
+
+
+class ProductSalesDaily(Base):
+    """Продажи товара за день: накапливаются инкрементально из purchased"""
+
+    __tablename__ = "product_sales_daily"
+
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    quantity: Mapped[int] = mapped_column(default=0)
+    revenue: Mapped[float] = mapped_column(default=0.0)
+
+    __table_args__ = (Index("ix_product_sales_daily_day", "day"),)
+
+
+class CategorySalesDaily(Base):
+    """Продажи категории за день"""
+
+    __tablename__ = "category_sales_daily"
+
+    category_id: Mapped[int] = mapped_column(
+        ForeignKey("categories.id"), primary_key=True
+    )
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    quantity: Mapped[int] = mapped_column(default=0)
+    revenue: Mapped[float] = mapped_column(default=0.0)
+
+    __table_args__ = (Index("ix_category_sales_daily_day", "day"),)
+
+
+class RollupWatermark(Base):
+    """Последний purchased.id, уже учтённый в витринах"""
+
+    __tablename__ = "rollup_watermarks"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    last_id: Mapped[int] = mapped_column(default=0)
+
+
+@traced
+async def refresh_rollups(db: AsyncSession) -> int:
+    """
+    Добавляет в витрины покупки с id выше сохранённого high-water mark
+    Берутся только покупки старше ANALYTICS_SETTLE_SECONDS: меньший id
+    незафиксированной транзакции не должен оказаться ниже отметки.
+    Параллельные запуски сериализуются блокировкой строки отметки.
+    Цена покупки в purchased не хранится, выручка считается по цене товара
+    на момент обновления витрины.
+    :param db: Асинхронная сессия
+    :return: Число учтённых покупок
+    """
+    await db.execute(
+        dialect_insert(db, RollupWatermark)
+        .values(name=ROLLUP_WATERMARK, last_id=0)
+        .on_conflict_do_nothing()
+    )
+    result = await db.execute(
+        select(RollupWatermark)
+        .where(RollupWatermark.name == ROLLUP_WATERMARK)
+        .with_for_update()
+    )
+    watermark = result.scalar_one()
+
+    settled = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.ANALYTICS_SETTLE_SECONDS
+    )
+    result = await db.execute(
+        select(func.max(Purchased.id), func.count(Purchased.id)).where(
+            Purchased.id > watermark.last_id, Purchased.purchase_date <= settled
+        )
+    )
+    high, count = result.one()
+    if high is None:
+        await db.commit()
+        return 0
+
+    batch = (Purchased.id > watermark.last_id, Purchased.id <= high)
+    day = func.date(Purchased.purchase_date)
+    quantity = func.sum(Purchased.quantity)
+    revenue = func.sum(Purchased.quantity * Product.price)
+
+    for table, key, source in (
+        (
+            ProductSalesDaily,
+            ProductSalesDaily.product_id,
+            select(Purchased.product_id, day, quantity, revenue)
+            .join(Product, Product.id == Purchased.product_id)
+            .where(*batch)
+            .group_by(Purchased.product_id, day),
+        ),
+        (
+            CategorySalesDaily,
+            CategorySalesDaily.category_id,
+            select(product_category.c.category_id, day, quantity, revenue)
+            .join(Product, Product.id == Purchased.product_id)
+            .join(
+                product_category, product_category.c.product_id == Purchased.product_id
+            )
+            .where(*batch)
+            .group_by(product_category.c.category_id, day),
+        ),
+    ):
+        stmt = dialect_insert(db, table).from_select(
+            [key.key, "day", "quantity", "revenue"], source
+        )
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[key, table.day],
+                set_={
+                    "quantity": table.quantity + stmt.excluded.quantity,
+                    "revenue": table.revenue + stmt.excluded.revenue,
+                },
+            )
+        )
+
+    watermark.last_id = high
+    await db.commit()
+    return count
+
+
+async def run_rollup_refresher(interval: float) -> None:
+    """Периодически обновляет витрины, пока задачу не отменят"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                count = await refresh_rollups(db)
+            if count:
+                logger.info("Витрины продаж: учтено покупок %d", count)
+        except Exception:
+            logger.exception("Не удалось обновить витрины продаж")
+        await asyncio.sleep(interval)
+
+
+def _since(days: int) -> date:
+    return datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+
+
+@traced
+async def get_bestsellers(
+    db: AsyncSession, days: int = 7, limit: int = 10
+) -> list[dict]:
+    """
+    Самые продаваемые товары за последние days дней
+    :return: Товары по убыванию проданного количества
+    """
+    quantity = func.sum(ProductSalesDaily.quantity).label("quantity")
+    result = await db.execute(
+        select(
+            Product.id,
+            Product.name,
+            quantity,
+            func.sum(ProductSalesDaily.revenue).label("revenue"),
+        )
+        .join(Product, Product.id == ProductSalesDaily.product_id)
+        .where(ProductSalesDaily.day >= _since(days))
+        .group_by(Product.id, Product.name)
+        .order_by(quantity.desc(), Product.id)
+        .limit(limit)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+@traced
+async def get_category_revenue(
+    db: AsyncSession, days: int = 30, limit: int = 10
+) -> list[dict]:
+    """
+    Выручка по категориям за последние days дней
+    :return: Категории по убыванию выручки
+    """
+    revenue = func.sum(CategorySalesDaily.revenue).label("revenue")
+    result = await db.execute(
+        select(
+            Category.id,
+            Category.name,
+            func.sum(CategorySalesDaily.quantity).label("quantity"),
+            revenue,
+        )
+        .join(Category, Category.id == CategorySalesDaily.category_id)
+        .where(CategorySalesDaily.day >= _since(days))
+        .group_by(Category.id, Category.name)
+        .order_by(revenue.desc(), Category.id)
+        .limit(limit)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+@traced
+async def get_sales_series(
+    db: AsyncSession,
+    product_id: int | None = None,
+    category_id: int | None = None,
+    days: int = 30,
+) -> list[dict]:
+    """
+    Продажи товара или категории по дням
+    :return: Точки ряда (day, quantity, revenue) по возрастанию даты
+    """
+    if product_id is not None:
+        table, key = ProductSalesDaily, ProductSalesDaily.product_id == product_id
+    else:
+        table, key = CategorySalesDaily, CategorySalesDaily.category_id == category_id
+    result = await db.execute(
+        select(table.day, table.quantity, table.revenue)
+        .where(key, table.day >= _since(days))
+        .order_by(table.day)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+@traced
+async def get_purchase_history(
+    db: AsyncSession, user_id: int, limit: int = 50, before: int | None = None
+) -> tuple[list[dict], int | None]:
+    """
+    История покупок пользователя, новые сначала (keyset по purchased.id)
+    :return: Покупки и курсор следующей страницы
+    """
+    query = (
+        select(
+            Purchased.id,
+            Purchased.product_id,
+            Product.name,
+            Purchased.quantity,
+            Purchased.purchase_date,
+        )
+        .join(Product, Product.id == Purchased.product_id)
+        .where(Purchased.user_id == user_id)
+    )
+    if before is not None:
+        query = query.where(Purchased.id < before)
+    # Забираем на одну строку больше, чтобы понять, есть ли следующая страница
+    result = await db.execute(query.order_by(Purchased.id.desc()).limit(limit + 1))
+    rows = [dict(row) for row in result.mappings()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    return rows, next_cursor
+
+
+async def _refresh_once() -> int:
+    async with AsyncSessionLocal() as db:
+        return await refresh_rollups(db)
+
+
+def main() -> None:
+    """Разовое обновление витрин: python analytics.py"""
+    argparse.ArgumentParser(description="Обновление витрин продаж").parse_args()
+    print(f"Учтено покупок: {asyncio.run(_refresh_once())}")
+
+
+if __name__ == "__main__":
+    main()
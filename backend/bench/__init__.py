@@ -0,0 +1,26 @@
+"""
+Нагрузочные сценарии для backend/main.py
+
+Приложение запускается в том же процессе (ASGI без сети), база заполняется
+синтетическими данными через пакетные пути, результаты пишутся в JSON.
+
+    cd backend
+    python -m bench run --scenario browse --duration 20 --output baseline.json
+    python -m bench run --scenario write --output write.json
+    python -m bench run --output current.json
+    python -m bench compare baseline.json current.json --threshold 0.1
+    python -m bench run --scenario auth --caches off --output no-cache.json
+    python -m bench run --scenario auth --output cache.json
+    python -m bench compare no-cache.json cache.json
+    python -m bench startup --repeat 5 --output startup.json
+    python -m bench scaling --workers 1,2,4,8 --output scaling.json
+    python -m bench payload --products 10000 --output payload.json
+
+Каталог на 1M товаров (--preset large; засев — минуты, дальше --reuse):
+
+    python -m bench run --database-url "$PG_URL" --preset large --scenario search
+    python -m bench run --database-url "$PG_URL" --preset large --reuse \
+        --scenario deep_pages
+
+По умолчанию используется временная SQLite; PostgreSQL — через --database-url.
+"""
@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+DEFAULT_DATABASE = Path(tempfile.gettempdir()) / "bench.db"
+# Готовые размеры набора данных (--preset); large — каталог на 1M товаров
+# для поиска и дальних страниц
+PRESETS = {
+    "large": {
+        "users": 10000,
+        "products": 1_000_000,
+        "comment_products": 1000,
+        "purchases": 200_000,
+    },
+}
+
+
+def _configure_environment(
+    database_url: str | None,
+    caches: str = "on",
+    jwt_claims: bool = False,
+    reset: bool = False,
+) -> None:
+    # Настройки читаются при импорте config.py, поэтому окружение задаётся
+    # до импорта модулей приложения; явные переменные окружения важнее,
+    # кроме переключателей кешей (--caches, --jwt-claims)
+    if caches == "off":
+        # Кеш без записей: каждое обращение идёт в БД, как до кеширования
+        os.environ["PRINCIPAL_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["CATALOG_CACHE_MAX_ENTRIES"] = "0"
+    if jwt_claims:
+        os.environ["JWT_EMBED_PRINCIPAL"] = "1"
+    if database_url is None:
+        # Файл по умолчанию переживает прогон, чтобы работал --reuse
+        if reset:
+            DEFAULT_DATABASE.unlink(missing_ok=True)
+        database_url = f"sqlite+aiosqlite:///{DEFAULT_DATABASE}"
+    os.environ["DATABASE_URL"] = database_url
+    defaults = {
+        "SECRET_KEY": "bench-secret-key",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+        # Фоновое обновление витрин исказило бы замеры
+        "ANALYTICS_REFRESH_INTERVAL": "0",
+        "SLOW_QUERY_SECONDS": "0",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+async def _prepare(args, main) -> None:
+    # Вызывается внутри lifespan: для засева нужен пул потоков bcrypt
+    from bench.dataset import (
+        BENCH_PASSWORD,
+        DatasetConfig,
+        is_empty,
+        seed_dataset,
+    )
+
+    dataset = DatasetConfig(
+        users=args.users,
+        categories=args.categories,
+        products=args.products,
+        comment_products=args.comment_products,
+        comments_per_product=args.comments_per_product,
+        carts=args.carts,
+        purchases=args.purchases,
+        seed=args.seed,
+    )
+    if await is_empty():
+        print("Заполнение базы...", file=sys.stderr)
+        await seed_dataset(dataset, await main.password_hasher.hash(BENCH_PASSWORD))
+    elif not args.reuse:
+        raise SystemExit(
+            "База не пуста: --reuse, чтобы использовать данные как есть, "
+            "или --reset, чтобы удалить схему"
+        )
+
+
+async def _seed(args) -> None:
+    import main
+    from bench.dataset import drop_schema
+
+    if args.reset:
+        await drop_schema()
+    async with main.app.router.lifespan_context(main.app):
+        await _prepare(args, main)
+
+
+async def _run(args) -> dict:
+    from httpx import ASGITransport, AsyncClient
+
+    import main
+    from bench.dataset import drop_schema, load_state
+    from bench.runner import RunConfig, run_scenario
+    from bench.scenarios import SCENARIOS
+    from db import engine
+
+    if args.reset:
+        await drop_schema()
+    config = RunConfig(
+        concurrency=args.concurrency,
+        duration=args.duration,
+        warmup=args.warmup,
+        seed=args.seed,
+        hot_stock_shards=args.hot_stock_shards,
+    )
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+
+    # Lifespan приложения: миграции, прогрев, пул потоков bcrypt
+    async with main.app.router.lifespan_context(main.app):
+        await _prepare(args, main)
+        state = await load_state()
+
+        transport = ASGITransport(app=main.app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            scenarios = {}
+            for name in names:
+                print(f"Сценарий {name}...", file=sys.stderr)
+                scenarios[name] = await run_scenario(
+                    client, state, SCENARIOS[name], config
+                )
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "dialect": engine.dialect.name,
+            "python": platform.python_version(),
+            "seed": args.seed,
+            "concurrency": config.concurrency,
+            "duration": config.duration,
+            "warmup": config.warmup,
+            "sizes": state.sizes,
+            "caches": args.caches,
+            "jwt_claims": args.jwt_claims,
+        },
+        "scenarios": scenarios,
+    }
+
+
+async def _payload(args) -> dict:
+    from httpx import ASGITransport, AsyncClient
+
+    import main
+    from bench.dataset import drop_schema
+    from bench.payload import run_payload
+
+    if args.reset:
+        await drop_schema()
+    async with main.app.router.lifespan_context(main.app):
+        await _prepare(args, main)
+        transport = ASGITransport(app=main.app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_payload(client, args.repeat)
+
+
+def _print_summary(result: dict) -> None:
+    for name, run in result["scenarios"].items():
+        print(
+            f"\n{name}: {run['throughput_rps']} req/s, исключений: {run['exceptions']}"
+        )
+        for endpoint, stats in run["endpoints"].items():
+            print(
+                f"  {endpoint:<40} n={stats['count']:<6} err={stats['errors']:<4} "
+                f"p50={stats['p50_ms']:.1f} p95={stats['p95_ms']:.1f} "
+                f"p99={stats['p99_ms']:.1f} мс"
+            )
+        if "consistency" in run:
+            print(f"  остаток: {run['consistency']}")
+
+
+def _add_database_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--database-url", help="По умолчанию — временная SQLite, пересоздаётся"
+    )
+    parser.add_argument(
+        "--reset", action="store_true", help="Удалить схему перед прогоном"
+    )
+    parser.add_argument(
+        "--reuse", action="store_true", help="Использовать данные в базе"
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument(
+        "--preset",
+        choices=["large"],
+        help="Готовые размеры набора данных (PRESETS), важнее --products и др.",
+    )
+    # Размеры набора данных (см. bench.dataset.DatasetConfig)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--comment-products", type=int, default=200)
+    parser.add_argument("--comments-per-product", type=int, default=30)
+    parser.add_argument("--carts", type=int, default=300)
+    parser.add_argument("--purchases", type=int, default=20000)
+
+
+def main() -> None:
+    """
+    Нагрузочные прогоны и сравнение:
+    python -m bench run|startup|scaling|payload|compare
+    """
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Прогон сценариев")
+    run.add_argument("--scenario", default="all")
+    run.add_argument("--duration", type=float, default=20.0)
+    run.add_argument("--warmup", type=float, default=3.0)
+    run.add_argument("--concurrency", type=int, default=32)
+    run.add_argument("--hot-stock-shards", type=int, default=0)
+    # Сравнение до/после кеширования: один прогон с --caches off, другой
+    # с on, затем compare
+    run.add_argument(
+        "--caches",
+        choices=["on", "off"],
+        default="on",
+        help="Кеш пользователей и каталога; off — все чтения из БД",
+    )
+    run.add_argument(
+        "--jwt-claims",
+        action="store_true",
+        help="JWT_EMBED_PRINCIPAL: авторизация по claims без обращения к БД",
+    )
+    _add_database_arguments(run)
+
+    startup = commands.add_parser(
+        "startup", help="Холодный старт до первого обслуженного запроса"
+    )
+    startup.add_argument("--repeat", type=int, default=5)
+    _add_database_arguments(startup)
+
+    scaling = commands.add_parser(
+        "scaling", help="Чтение каталога при разном числе воркеров serve.py"
+    )
+    cpus = os.cpu_count() or 1
+    scaling.add_argument(
+        "--workers",
+        default=",".join(str(2**i) for i in range(cpus.bit_length())),
+        help="Список значений WEB_WORKERS через запятую",
+    )
+    scaling.add_argument("--clients", type=int, default=cpus)
+    scaling.add_argument("--concurrency", type=int, default=16)
+    scaling.add_argument("--duration", type=float, default=10.0)
+    scaling.add_argument("--warmup", type=float, default=2.0)
+    _add_database_arguments(scaling)
+
+    payload = commands.add_parser(
+        "payload", help="Размер и сериализация страницы каталога по форматам"
+    )
+    payload.add_argument("--repeat", type=int, default=20)
+    _add_database_arguments(payload)
+
+    compare = commands.add_parser("compare", help="Сравнение двух результатов")
+    compare.add_argument("baseline", type=Path)
+    compare.add_argument("current", type=Path)
+    compare.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+    if getattr(args, "preset", None):
+        for size, value in PRESETS[args.preset].items():
+            setattr(args, size, value)
+
+    if args.command == "compare":
+        from bench.compare import compare_results, format_rows
+
+        rows = compare_results(
+            json.loads(args.baseline.read_text()),
+            json.loads(args.current.read_text()),
+            args.threshold,
+        )
+        print(format_rows(rows))
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+        return
+
+    _configure_environment(
+        args.database_url,
+        caches=getattr(args, "caches", "on"),
+        jwt_claims=getattr(args, "jwt_claims", False),
+        reset=args.reset,
+    )
+    if args.command == "startup":
+        from bench.startup import run_startup
+
+        asyncio.run(_seed(args))
+        result = {"startup": run_startup(args.repeat)}
+        print(
+            json.dumps(
+                {mode: r["median_ms"] for mode, r in result["startup"].items()},
+                ensure_ascii=False,
+                indent=2,
+            )
+        )
+    elif args.command == "scaling":
+        from bench.scaling import run_scaling
+
+        asyncio.run(_seed(args))
+        result = {
+            # Рост ограничен числом ядер: клиенты работают на той же машине
+            "meta": {
+                "cpus": os.cpu_count(),
+                "database": os.environ["DATABASE_URL"].split("://")[0],
+                "clients": args.clients,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+            },
+            "scaling": run_scaling(
+                [int(n) for n in args.workers.split(",")],
+                clients=args.clients,
+                concurrency=args.concurrency,
+                duration=args.duration,
+                warmup=args.warmup,
+                seed=args.seed,
+            ),
+        }
+        print(json.dumps(result["scaling"], ensure_ascii=False, indent=2))
+    elif args.command == "payload":
+        result = {"payload": asyncio.run(_payload(args))}
+        print(json.dumps(result["payload"], ensure_ascii=False, indent=2))
+    else:
+        result = asyncio.run(_run(args))
+        _print_summary(result)
+    if args.output:
+        args.output.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
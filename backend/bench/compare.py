@@ -0,0 +1,77 @@
+LATENCY_METRICS = ("p95_ms", "p99_ms")
+# Эндпоинты с малым числом запросов дают шумные перцентили
+MIN_SAMPLES = 20
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list[dict]:
+    """
+    Сравнивает два результата прогона по эндпоинтам
+    :param baseline: Базовый результат (JSON из run)
+    :param current: Текущий результат
+    :param threshold: Допустимое относительное ухудшение (0.1 — 10%)
+    :return: Строки сравнения; regression=True — ухудшение сверх порога
+    """
+    rows = []
+    for scenario, base_run in baseline["scenarios"].items():
+        current_run = current["scenarios"].get(scenario)
+        if current_run is None:
+            continue
+        for endpoint, base in base_run["endpoints"].items():
+            now = current_run["endpoints"].get(endpoint)
+            if now is None or min(base["count"], now["count"]) < MIN_SAMPLES:
+                continue
+            for metric in (*LATENCY_METRICS, "throughput_rps"):
+                if not base[metric]:
+                    continue
+                change = (now[metric] - base[metric]) / base[metric]
+                # Для латентности плохо — рост, для пропускной способности — падение
+                worse = -change if metric == "throughput_rps" else change
+                rows.append(
+                    {
+                        "scenario": scenario,
+                        "endpoint": endpoint,
+                        "metric": metric,
+                        "baseline": base[metric],
+                        "current": now[metric],
+                        "change": round(change, 4),
+                        "regression": worse > threshold,
+                    }
+                )
+            if now["errors"] > base["errors"]:
+                rows.append(
+                    {
+                        "scenario": scenario,
+                        "endpoint": endpoint,
+                        "metric": "errors",
+                        "baseline": base["errors"],
+                        "current": now["errors"],
+                        "change": None,
+                        "regression": True,
+                    }
+                )
+        consistency = current_run.get("consistency")
+        if consistency is not None and not consistency["ok"]:
+            rows.append(
+                {
+                    "scenario": scenario,
+                    "endpoint": "-",
+                    "metric": "consistency",
+                    "baseline": None,
+                    "current": consistency,
+                    "change": None,
+                    "regression": True,
+                }
+            )
+    return rows
+
+
+def format_rows(rows: list[dict]) -> str:
+    lines = []
+    for row in rows:
+        change = "" if row["change"] is None else f"{row['change']:+.1%}"
+        mark = "РЕГРЕССИЯ" if row["regression"] else ""
+        lines.append(
+            f"{row['scenario']:<10} {row['endpoint']:<40} {row['metric']:<15} "
+            f"{row['baseline']!s:>10} -> {row['current']!s:<10} {change:>8} {mark}"
+        )
+    return "\n".join(lines)
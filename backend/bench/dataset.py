@@ -0,0 +1,241 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Iterable, Iterator
+
+from sqlalchemy import func, insert, select, text
+
+from analytics import refresh_rollups
+from db import (
+    AsyncSessionLocal,
+    Base,
+    Cart,
+    Category,
+    Comment,
+    Product,
+    Purchased,
+    User,
+    engine,
+)
+from importer import import_products
+
+BENCH_PASSWORD = "bench-password"
+INSERT_CHUNK_SIZE = 1000
+WORDS = tuple(
+    (
+        "ноутбук телефон чехол кабель зарядка наушники колонка планшет монитор "
+        "клавиатура мышь роутер камера часы браслет фонарь рюкзак термос чайник "
+        "пылесос утюг лампа apple samsung xiaomi lenovo asus sony bosch philips "
+        "чёрный белый синий красный мини про макс лайт плюс ультра"
+    ).split()
+)
+
+
+@dataclass
+class DatasetConfig:
+    users: int = 1000
+    categories: int = 50
+    products: int = 10000
+    comment_products: int = 200
+    comments_per_product: int = 30
+    carts: int = 300
+    purchases: int = 20000
+    hot_stock: int = 100000
+    seed: int = 42
+
+
+@dataclass
+class BenchState:
+    """Идентификаторы засеянных данных, из которых сценарии строят запросы"""
+
+    user_ids: list[int]
+    usernames: list[str]
+    product_ids: list[int]
+    category_ids: list[int]
+    commented_product_ids: list[int]
+    comment_ids: list[int]
+    hot_product_id: int
+    words: tuple[str, ...] = WORDS
+    password: str = BENCH_PASSWORD
+    sizes: dict = field(default_factory=dict)
+
+
+def _chunks(rows: Iterable[dict], size: int = INSERT_CHUNK_SIZE) -> Iterator[list]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _product_rows(config: DatasetConfig, rng: random.Random):
+    for i in range(config.products):
+        words = rng.sample(WORDS, 3)
+        yield (
+            i + 1,
+            {
+                "name": f"{' '.join(words)} {i}",
+                "description": " ".join(rng.choices(WORDS, k=12)),
+                "price": round(rng.uniform(10, 5000), 2),
+                # Первый товар — «горячий»: на нём сценарий checkout проверяет oversell
+                "stock": config.hot_stock if i == 0 else rng.randint(0, 500),
+                "category_ids": "|".join(
+                    str(rng.randint(1, config.categories))
+                    for _ in range(rng.randint(1, 3))
+                ),
+            },
+        )
+
+
+async def _ids(column) -> list[int]:
+    async with engine.connect() as conn:
+        return list((await conn.execute(select(column).order_by(column))).scalars())
+
+
+async def _insert_comments(
+    config: DatasetConfig, rng: random.Random, user_ids: list[int], product_ids
+):
+    now = datetime.now(timezone.utc)
+    async with engine.begin() as conn:
+        for product_id in product_ids:
+            # Деревья: корни и ответы по уровням, id родителей берутся из RETURNING
+            parents: list[int] = []
+            remaining = config.comments_per_product
+            depth = 0
+            while remaining > 0 and depth < 4:
+                count = (
+                    max(remaining // 3, 1)
+                    if depth == 0
+                    else min(remaining, len(parents) * 2)
+                )
+                rows = [
+                    {
+                        "text": " ".join(rng.choices(WORDS, k=8)),
+                        "user_id": rng.choice(user_ids),
+                        "product_id": product_id,
+                        "parent_id": rng.choice(parents) if parents else None,
+                        "created_at": now,
+                    }
+                    for _ in range(count)
+                ]
+                result = await conn.execute(
+                    insert(Comment).returning(Comment.id, sort_by_parameter_order=True),
+                    rows,
+                )
+                parents = list(result.scalars())
+                remaining -= count
+                depth += 1
+
+
+async def seed_dataset(config: DatasetConfig, password_hash: str) -> None:
+    """
+    Заполняет пустую базу синтетическими данными
+    :param config: Размеры набора данных
+    :param password_hash: bcrypt-хеш BENCH_PASSWORD (общий для всех пользователей)
+    """
+    rng = random.Random(config.seed)
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(Category),
+            [
+                {"name": f"category-{i}", "description": f"Категория {i}"}
+                for i in range(1, config.categories + 1)
+            ],
+        )
+        for chunk in _chunks(
+            {
+                "username": f"user{i}",
+                "full_name": f"User {i}",
+                "email": f"user{i}@example.com",
+                "hashed_password": password_hash,
+                "disabled": False,
+            }
+            for i in range(1, config.users + 1)
+        ):
+            await conn.execute(insert(User), chunk)
+
+    async with AsyncSessionLocal() as db:
+        report = await import_products(db, _product_rows(config, rng))
+    if report.failed:
+        raise RuntimeError(f"Не удалось засеять товары: {report.errors[:5]}")
+
+    user_ids = await _ids(User.id)
+    product_ids = await _ids(Product.id)
+    await _insert_comments(
+        config,
+        rng,
+        user_ids,
+        rng.sample(product_ids, min(config.comment_products, len(product_ids))),
+    )
+
+    since = datetime.now(timezone.utc) - timedelta(days=30)
+    async with engine.begin() as conn:
+        cart_rows = {
+            (user_id, rng.choice(product_ids[1:] or product_ids)): rng.randint(1, 3)
+            for user_id in rng.sample(user_ids, min(config.carts, len(user_ids)))
+            for _ in range(rng.randint(1, 5))
+        }
+        for chunk in _chunks(
+            {"user_id": u, "product_id": p, "quantity": q}
+            for (u, p), q in cart_rows.items()
+        ):
+            await conn.execute(insert(Cart), chunk)
+        for chunk in _chunks(
+            {
+                "user_id": rng.choice(user_ids),
+                "product_id": rng.choice(product_ids),
+                "quantity": rng.randint(1, 3),
+                "purchase_date": since
+                + timedelta(seconds=rng.randint(0, 30 * 24 * 3600 - 3600)),
+            }
+            for _ in range(config.purchases)
+        ):
+            await conn.execute(insert(Purchased), chunk)
+
+    async with AsyncSessionLocal() as db:
+        await refresh_rollups(db)
+
+
+async def load_state() -> BenchState:
+    """Читает идентификаторы засеянных данных для построения запросов"""
+    async with engine.connect() as conn:
+        users = (
+            await conn.execute(select(User.id, User.username).order_by(User.id))
+        ).all()
+        commented = (
+            await conn.execute(
+                select(Comment.product_id).distinct().order_by(Comment.product_id)
+            )
+        ).scalars()
+        hot_product_id = (
+            await conn.execute(select(Product.id).where(Product.name.like("% 0")))
+        ).scalar_one()
+        sizes = {
+            model.__tablename__: (
+                await conn.execute(select(func.count()).select_from(model))
+            ).scalar_one()
+            for model in (User, Product, Category, Comment, Cart, Purchased)
+        }
+    return BenchState(
+        user_ids=[user.id for user in users],
+        usernames=[user.username for user in users],
+        product_ids=await _ids(Product.id),
+        category_ids=await _ids(Category.id),
+        commented_product_ids=list(commented),
+        comment_ids=await _ids(Comment.id),
+        hot_product_id=hot_product_id,
+        sizes=sizes,
+    )
+
+
+async def is_empty() -> bool:
+    async with engine.connect() as conn:
+        return not (
+            await conn.execute(select(func.count()).select_from(Product))
+        ).scalar_one()
+
+
+async def drop_schema() -> None:
+    """Удаляет все таблицы приложения (только по явному --reset)"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
@@ -0,0 +1,110 @@
+"""
+Размер ответа и время сериализации для страницы каталога на 10k товаров
+
+Тело берётся из /products/all (весь каталог засеянного набора). Отдельно
+замеряется каждый шаг: приведение к схеме ответа, кодирование в JSON
+(stdlib для сравнения, orjson) или msgpack и сжатие gzip/brotli с уровнями
+из настроек. В конце — те же варианты через HTTP целиком.
+"""
+
+import gzip
+import json
+import statistics
+import time
+from functools import partial
+
+import brotli
+import httpx
+import msgpack
+import orjson
+from pydantic import TypeAdapter
+
+from config import settings
+from models import ProductOut
+
+SERIALIZERS = {
+    # Так кодирует starlette.responses.JSONResponse
+    "json": lambda content: json.dumps(
+        content, ensure_ascii=False, separators=(",", ":")
+    ).encode(),
+    "orjson": orjson.dumps,
+    "msgpack": msgpack.packb,
+}
+COMPRESSORS = {
+    "identity": lambda body: body,
+    "gzip": lambda body: gzip.compress(body, settings.RESPONSE_GZIP_LEVEL),
+    "br": lambda body: brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY),
+}
+HTTP_VARIANTS = {
+    "json": {"Accept-Encoding": "identity"},
+    "json+gzip": {"Accept-Encoding": "gzip"},
+    "json+br": {"Accept-Encoding": "br"},
+    "msgpack": {"Accept": "application/msgpack", "Accept-Encoding": "identity"},
+    "msgpack+br": {"Accept": "application/msgpack", "Accept-Encoding": "br"},
+}
+
+
+def _cpu_ms(func, repeat: int):
+    # Процессорное время: замер не зависит от планировщика и других задач
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        result = func()
+        timings.append(time.process_time() - started)
+    return result, round(statistics.median(timings) * 1000, 3)
+
+
+async def run_payload(client: httpx.AsyncClient, repeat: int) -> dict:
+    """
+    Размер и время кодирования ответа каталога по форматам и сжатию
+    :param client: HTTP-клиент приложения
+    :param repeat: Повторов каждого замера (берётся медиана)
+    :return: Байты и миллисекунды по шагам и по вариантам HTTP-ответа
+    """
+    response = await client.get("/products/all")
+    response.raise_for_status()
+    products = response.json()
+
+    adapter = TypeAdapter(list[ProductOut])
+    validated = adapter.validate_python(products)
+    content, dump_ms = _cpu_ms(
+        lambda: adapter.dump_python(validated, mode="json"), repeat
+    )
+
+    encoded = {}
+    for serializer, dumps in SERIALIZERS.items():
+        body, serialize_ms = _cpu_ms(partial(dumps, content), repeat)
+        for encoding, compress in COMPRESSORS.items():
+            # stdlib json — только точка отсчёта, сжимать его незачем
+            if serializer == "json" and encoding != "identity":
+                continue
+            compressed, compress_ms = _cpu_ms(partial(compress, body), repeat)
+            encoded[f"{serializer}+{encoding}"] = {
+                "bytes": len(compressed),
+                "serialize_ms": serialize_ms,
+                "compress_ms": compress_ms,
+                "total_ms": round(serialize_ms + compress_ms, 3),
+            }
+
+    http = {}
+    for variant, headers in HTTP_VARIANTS.items():
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await client.get("/products/all", headers=headers)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+        http[variant] = {
+            # Байты «по проводу», до распаковки клиентом
+            "bytes": response.num_bytes_downloaded,
+            "median_ms": round(statistics.median(latencies) * 1000, 3),
+        }
+
+    return {
+        "products": len(products),
+        "gzip_level": settings.RESPONSE_GZIP_LEVEL,
+        "brotli_quality": settings.RESPONSE_BROTLI_QUALITY,
+        "schema_dump_ms": dump_ms,
+        "encoded": encoded,
+        "http": http,
+    }
@@ -0,0 +1,162 @@
+import asyncio
+import math
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+
+from bench.dataset import BenchState
+from bench.scenarios import Sample, Scenario, Worker, hot_stock_snapshot
+
+
+@dataclass
+class RunConfig:
+    concurrency: int = 32
+    duration: float = 20.0
+    warmup: float = 3.0
+    seed: int = 42
+    # Шарды остатка горячего товара для сценария checkout (0 — одна строка)
+    hot_stock_shards: int = 0
+
+
+@dataclass
+class Recorder:
+    """Собирает замеры; во время прогрева замеры отбрасываются"""
+
+    enabled: bool = False
+    samples: list[Sample] = field(default_factory=list)
+    exceptions: int = 0
+
+    def record(self, sample: Sample) -> None:
+        if self.enabled:
+            self.samples.append(sample)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    # Метод ближайшего ранга: результат — одно из измеренных значений
+    rank = max(math.ceil(q * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    """
+    Сводка по эндпоинтам: число запросов, ошибки, пропускная способность
+    и перцентили латентности в миллисекундах
+    :param samples: Замеры прогона
+    :param elapsed: Длительность измеряемой части прогона, с
+    """
+    by_endpoint: dict[str, list[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+
+    endpoints = {}
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = sorted(sample.seconds * 1000 for sample in items)
+        statuses: dict[str, int] = defaultdict(int)
+        for sample in items:
+            statuses[str(sample.status)] += 1
+        endpoints[endpoint] = {
+            "count": len(items),
+            # Ошибки — 5xx и сбои транспорта (status 0); 4xx — ожидаемые
+            # ответы бизнес-логики (нет на складе, пустая корзина)
+            "errors": sum(1 for s in items if s.status == 0 or s.status >= 500),
+            "statuses": dict(sorted(statuses.items())),
+            "throughput_rps": round(len(items) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(_percentile(latencies, 0.50), 3),
+            "p95_ms": round(_percentile(latencies, 0.95), 3),
+            "p99_ms": round(_percentile(latencies, 0.99), 3),
+            "max_ms": round(latencies[-1], 3),
+            "mean_bytes": round(sum(s.size for s in items) / len(items)),
+        }
+    return endpoints
+
+
+async def _worker(
+    worker: Worker, scenario: Scenario, deadline: float, recorder, background: bool
+):
+    while time.perf_counter() < deadline:
+        operation = scenario.pick(worker.rng, background)
+        try:
+            await operation(worker)
+        except httpx.HTTPError:
+            pass
+        except Exception:
+            # Исключение приложения пробрасывается ASGITransport: учитываем
+            # как ошибку и продолжаем, чтобы один сбой не обрывал прогон
+            if recorder.enabled:
+                recorder.exceptions += 1
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    state: BenchState,
+    scenario: Scenario,
+    config: RunConfig,
+) -> dict:
+    """
+    Прогон одного сценария: прогрев, затем замер в течение config.duration
+    :param client: HTTP-клиент приложения
+    :param state: Идентификаторы засеянных данных
+    :param scenario: Сценарий нагрузки
+    :param config: Параметры прогона
+    """
+    before = None
+    if scenario.name == "checkout":
+        response = await client.put(
+            f"/products/{state.hot_product_id}/stock-shards",
+            json={"shards": config.hot_stock_shards},
+        )
+        response.raise_for_status()
+        before = await hot_stock_snapshot(state)
+
+    recorder = Recorder()
+    workers = [
+        Worker(
+            client=client,
+            # Своя последовательность у каждого воркера: прогоны воспроизводимы
+            rng=random.Random(config.seed * 1000 + i),
+            state=state,
+            record=recorder.record,
+        )
+        for i in range(config.concurrency)
+    ]
+
+    started = time.perf_counter()
+    measured_from = started + config.warmup
+    deadline = measured_from + config.duration
+    background = min(scenario.background_workers, config.concurrency - 1)
+    tasks = [
+        asyncio.create_task(
+            _worker(worker, scenario, deadline, recorder, i < background)
+        )
+        for i, worker in enumerate(workers)
+    ]
+    await asyncio.sleep(max(measured_from - time.perf_counter(), 0))
+    recorder.enabled = True
+    measured_from = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - measured_from
+
+    result = {
+        "description": scenario.description,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": len(recorder.samples),
+        "exceptions": recorder.exceptions,
+        "throughput_rps": round(len(recorder.samples) / elapsed, 2),
+        "endpoints": summarize(recorder.samples, elapsed),
+    }
+    if before is not None:
+        # Остаток не ушёл в минус и уменьшился ровно на число проданных единиц
+        stock, sold = await hot_stock_snapshot(state)
+        sold_in_run = sold - before[1]
+        result["consistency"] = {
+            "hot_stock_shards": config.hot_stock_shards,
+            "stock_before": before[0],
+            "stock_after": stock,
+            "sold": sold_in_run,
+            "ok": stock >= 0 and before[0] - stock == sold_in_run,
+        }
+    return result
@@ -0,0 +1,146 @@
+"""
+Масштабирование чтения каталога по числу воркеров serve.py
+
+Для каждого значения WEB_WORKERS запускается настоящий сервер (serve.py)
+на свободном порту, нагрузку по HTTP дают несколько процессов-клиентов:
+один клиентский процесс сам упёрся бы в одно ядро раньше сервера.
+"""
+
+import asyncio
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+READY_TIMEOUT = 60.0
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(base_url: str, server: subprocess.Popen) -> None:
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py завершился с кодом {server.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health/ready").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Сервер не стал готов за отведённое время")
+
+
+async def _client(
+    base_url: str, concurrency: int, seconds: float, warmup: float, seed: int
+):
+    rng = random.Random(seed)
+    latencies: list[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        categories = [c["id"] for c in (await client.get("/categories")).json()]
+        started = time.perf_counter()
+        measured_from = started + warmup
+        deadline = measured_from + seconds
+
+        async def loop():
+            nonlocal errors
+            while (now := time.perf_counter()) < deadline:
+                if categories and rng.random() < 0.3:
+                    url = f"/categories/{rng.choice(categories)}/products"
+                    params = {"limit": 24}
+                else:
+                    url = "/products"
+                    params = {"limit": 24, "sort": rng.choice(["id", "price", "name"])}
+                try:
+                    response = await client.get(url, params=params)
+                    failed = response.status_code >= 500
+                except httpx.TransportError:
+                    failed = True
+                if now >= measured_from:
+                    latencies.append(time.perf_counter() - now)
+                    errors += failed
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def _client_process(args) -> tuple[list[float], int]:
+    return asyncio.run(_client(*args))
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[max(math.ceil(q * len(sorted_values)), 1) - 1]
+
+
+def run_scaling(
+    worker_counts: list[int],
+    clients: int,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int,
+) -> dict:
+    """
+    Пропускная способность чтения каталога при разном числе воркеров
+    :param worker_counts: Значения WEB_WORKERS
+    :param clients: Число клиентских процессов
+    :param concurrency: Одновременных запросов на клиентский процесс
+    :param duration: Длительность замера, с
+    :param warmup: Прогрев перед замером, с
+    :param seed: Зерно генераторов клиентов
+    """
+    results = {}
+    for workers in worker_counts:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            "WEB_WORKERS": str(workers),
+            "WEB_HOST": "127.0.0.1",
+            "WEB_PORT": str(port),
+        }
+        print(f"Воркеров: {workers}...", file=sys.stderr)
+        server = subprocess.Popen(
+            [sys.executable, "serve.py"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(base_url, server)
+            jobs = [
+                (base_url, concurrency, duration, warmup, seed * 1000 + i)
+                for i in range(clients)
+            ]
+            with multiprocessing.get_context("spawn").Pool(clients) as pool:
+                outcomes = pool.map(_client_process, jobs)
+        finally:
+            server.terminate()
+            server.wait()
+
+        latencies = sorted(s for outcome in outcomes for s in outcome[0])
+        results[str(workers)] = {
+            "requests": len(latencies),
+            "errors": sum(outcome[1] for outcome in outcomes),
+            "throughput_rps": round(len(latencies) / duration, 2),
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        }
+
+    base = results[str(worker_counts[0])]["throughput_rps"]
+    for result in results.values():
+        result["speedup"] = round(result["throughput_rps"] / base, 2) if base else None
+    return results
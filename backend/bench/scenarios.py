@@ -0,0 +1,378 @@
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+from sqlalchemy import func, select
+
+from bench.dataset import BenchState
+from db import Product, Purchased, engine, product_stock
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    status: int
+    seconds: float
+    size: int
+
+
+@dataclass
+class Worker:
+    """Состояние одного виртуального клиента"""
+
+    client: httpx.AsyncClient
+    rng: random.Random
+    state: BenchState
+    record: Callable[[Sample], None]
+    scratch: dict = field(default_factory=dict)
+
+    async def request(
+        self, endpoint: str, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        """
+        Выполняет запрос и записывает его время
+        :param endpoint: Метка эндпоинта в отчёте (метод и шаблон пути)
+        """
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.record(Sample(endpoint, 0, time.perf_counter() - started, 0))
+            raise
+        self.record(
+            Sample(
+                endpoint,
+                response.status_code,
+                time.perf_counter() - started,
+                len(response.content),
+            )
+        )
+        return response
+
+    def user(self) -> tuple[int, str]:
+        i = self.rng.randrange(len(self.state.user_ids))
+        return self.state.user_ids[i], self.state.usernames[i]
+
+    def product_id(self) -> int:
+        return self.rng.choice(self.state.product_ids)
+
+
+# Операция: один шаг виртуального клиента (один или несколько запросов)
+Operation = Callable[[Worker], Awaitable[None]]
+
+
+async def browse_products(w: Worker):
+    params = {
+        "limit": 50,
+        "sort": w.rng.choice(["id", "price", "name"]),
+        "order": w.rng.choice(["asc", "desc"]),
+    }
+    # Иногда листаем дальше по курсору предыдущей страницы
+    cursor = w.scratch.get("cursor")
+    if cursor and w.rng.random() < 0.5:
+        params = {**w.scratch["params"], "cursor": cursor}
+    response = await w.request("GET /products", "GET", "/products", params=params)
+    if response.status_code == 200:
+        w.scratch["cursor"] = response.json()["next_cursor"]
+        w.scratch["params"] = {k: params[k] for k in ("limit", "sort", "order")}
+
+
+async def list_categories(w: Worker):
+    await w.request("GET /categories", "GET", "/categories")
+
+
+async def category_products(w: Worker):
+    category_id = w.rng.choice(w.state.category_ids)
+    await w.request(
+        "GET /categories/{category_id}/products",
+        "GET",
+        f"/categories/{category_id}/products",
+        params={"limit": 24},
+    )
+
+
+def _search_query(w: Worker) -> str:
+    q = " ".join(w.rng.sample(w.state.words, w.rng.randint(1, 2)))
+    # Автодополнение: последнее слово обрезано
+    if w.rng.random() < 0.5:
+        q = q[: max(len(q) - 2, 2)]
+    return q
+
+
+async def search(w: Worker):
+    params = {"q": _search_query(w)}
+    await w.request("GET /products/search", "GET", "/products/search", params=params)
+
+
+async def search_deep_page(w: Worker):
+    # Те же запросы, что в search, но дальние страницы через OFFSET
+    params = {"q": _search_query(w), "offset": w.rng.randrange(100, 1001, 100)}
+    await w.request(
+        "GET /products/search?offset", "GET", "/products/search", params=params
+    )
+
+
+async def browse_deep_page(w: Worker):
+    # Листание по курсору без возврата к началу: страницы уходят всё дальше,
+    # а стоимость запроса от номера страницы не зависит (в отличие от OFFSET)
+    cursor = w.scratch.get("deep_cursor")
+    params = {"limit": 20, "sort": "id"}
+    if cursor:
+        params["cursor"] = cursor
+    response = await w.request(
+        "GET /products?cursor", "GET", "/products", params=params
+    )
+    if response.status_code == 200:
+        w.scratch["deep_cursor"] = response.json()["next_cursor"]
+
+
+async def product_comments(w: Worker):
+    product_id = w.rng.choice(w.state.commented_product_ids or w.state.product_ids)
+    await w.request(
+        "GET /products/{product_id}/comments",
+        "GET",
+        f"/products/{product_id}/comments",
+        params={"max_depth": 5},
+    )
+
+
+async def post_comment(w: Worker):
+    product_id = w.rng.choice(w.state.commented_product_ids or w.state.product_ids)
+    user_id, _ = w.user()
+    # Половина — ответы в существующие ветки
+    parent_id = w.rng.choice(w.state.comment_ids) if w.rng.random() < 0.5 else None
+    body = {
+        "text": "bench",
+        "user_id": user_id,
+        "product_id": product_id,
+        "parent_id": parent_id,
+    }
+    await w.request("POST /comments", "POST", "/comments", json=body)
+
+
+async def add_to_cart(w: Worker):
+    user_id, _ = w.user()
+    body = {"user_id": user_id, "product_id": w.product_id(), "quantity": 1}
+    await w.request("POST /cart/add", "POST", "/cart/add", json=body)
+
+
+async def cart_batch(w: Worker):
+    user_id, _ = w.user()
+    operations = [
+        {
+            "op": w.rng.choice(["add", "add", "set", "remove"]),
+            "product_id": w.product_id(),
+            "quantity": w.rng.randint(1, 3),
+        }
+        for _ in range(w.rng.randint(2, 8))
+    ]
+    await w.request(
+        "POST /cart/batch",
+        "POST",
+        "/cart/batch",
+        json={"user_id": user_id, "operations": operations},
+    )
+
+
+async def checkout(w: Worker):
+    user_id, _ = w.user()
+    await w.request("POST /checkout", "POST", "/checkout", json={"user_id": user_id})
+
+
+async def login(w: Worker):
+    _, username = w.user()
+    response = await w.request(
+        "POST /token",
+        "POST",
+        "/token",
+        data={"username": username, "password": w.state.password},
+    )
+    if response.status_code == 200:
+        w.scratch["tokens"] = response.json()
+
+
+async def me(w: Worker):
+    tokens = w.scratch.get("tokens")
+    if tokens is None:
+        return await login(w)
+    await w.request(
+        "GET /me/user",
+        "GET",
+        "/me/user",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+    )
+
+
+async def refresh(w: Worker):
+    tokens = w.scratch.get("tokens")
+    if tokens is None:
+        return await login(w)
+    await w.request(
+        "POST /refresh",
+        "POST",
+        "/refresh",
+        params={"refresh_token": tokens["refresh_token"]},
+    )
+
+
+def _unique_name(prefix: str) -> str:
+    # Не из rng воркера: с --reuse имена прошлых прогонов уже заняты
+    return f"bench-{prefix}-{uuid.uuid4().hex}"
+
+
+async def create_product(w: Worker):
+    body = {
+        "name": _unique_name("product"),
+        "description": "bench",
+        "price": round(w.rng.uniform(1, 1000), 2),
+        "stock": w.rng.randint(0, 100),
+        "category_ids": w.rng.sample(w.state.category_ids, w.rng.randint(0, 3)),
+    }
+    await w.request("POST /products/", "POST", "/products/", json=body)
+
+
+async def create_category(w: Worker):
+    body = {"name": _unique_name("category"), "description": "bench"}
+    await w.request("POST /categories/", "POST", "/categories/", json=body)
+
+
+async def create_user(w: Worker):
+    body = {
+        "username": _unique_name("user"),
+        "email": "bench@example.com",
+        "hashed_password": w.state.password,
+    }
+    await w.request("PUT /create_user", "PUT", "/create_user", json=body)
+
+
+async def add_product_categories(w: Worker):
+    product_id = w.product_id()
+    body = {"category_ids": w.rng.sample(w.state.category_ids, w.rng.randint(1, 5))}
+    await w.request(
+        "PATCH /products/{product_id}/categories",
+        "PATCH",
+        f"/products/{product_id}/categories",
+        json=body,
+    )
+
+
+async def buy_hot_product(w: Worker):
+    # Все покупают один товар: проверка блокировок и отсутствия oversell
+    user_id, _ = w.user()
+    operation = {"op": "set", "product_id": w.state.hot_product_id, "quantity": 1}
+    await w.request(
+        "POST /cart/batch",
+        "POST",
+        "/cart/batch",
+        json={"user_id": user_id, "operations": [operation]},
+    )
+    await w.request("POST /checkout", "POST", "/checkout", json={"user_id": user_id})
+
+
+async def hot_stock_snapshot(state: BenchState) -> tuple[int, int]:
+    """Остаток горячего товара (сумма шардов) и число его проданных единиц"""
+    async with engine.connect() as conn:
+        stock = (
+            await conn.execute(
+                select(product_stock).where(Product.id == state.hot_product_id)
+            )
+        ).scalar_one()
+        sold = (
+            await conn.execute(
+                select(func.coalesce(func.sum(Purchased.quantity), 0)).where(
+                    Purchased.product_id == state.hot_product_id
+                )
+            )
+        ).scalar_one()
+    return stock, sold
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    operations: list[tuple[float, Operation]]
+    # Фоновая нагрузка: столько клиентов из concurrency выполняют только её
+    background: list[tuple[float, Operation]] = field(default_factory=list)
+    background_workers: int = 0
+
+    def pick(self, rng: random.Random, background: bool = False) -> Operation:
+        weights, operations = zip(*(self.background if background else self.operations))
+        return rng.choices(operations, weights=weights)[0]
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario(
+            "browse",
+            "Каталог: страницы, категории, поиск, комментарии",
+            [
+                (40, browse_products),
+                (10, list_categories),
+                (20, category_products),
+                (20, search),
+                (10, product_comments),
+            ],
+        ),
+        Scenario(
+            "search",
+            "Поиск: первая страница против дальних через OFFSET",
+            [(50, search), (50, search_deep_page)],
+        ),
+        Scenario(
+            "deep_pages",
+            "Каталог по курсору всё глубже; сравнить с первыми страницами browse",
+            [(100, browse_deep_page)],
+        ),
+        Scenario(
+            "cart",
+            "Корзина: добавление, пакетные изменения, оформление",
+            [
+                (40, add_to_cart),
+                (30, cart_batch),
+                (20, browse_products),
+                (10, checkout),
+            ],
+        ),
+        Scenario(
+            "login",
+            "Шторм входов: bcrypt, авторизованные запросы и фоновое чтение каталога",
+            [(60, login), (30, me), (10, refresh)],
+            # Отдельные клиенты читают каталог в том же прогоне: p95/p99
+            # GET /products показывают, не страдают ли остальные эндпоинты
+            # от очереди bcrypt
+            background=[(100, browse_products)],
+            background_workers=4,
+        ),
+        Scenario(
+            "auth",
+            "Авторизованные запросы с уже выданным токеном (кеш пользователей, claims)",
+            # Вход — только первый запрос клиента, дальше /me/user и /refresh
+            [(90, me), (10, refresh)],
+        ),
+        Scenario(
+            "comments",
+            "Обсуждения: чтение деревьев и ответы",
+            [(70, product_comments), (30, post_comment)],
+        ),
+        Scenario(
+            "write",
+            "Запись в каталог и регистрация: товары, категории, пользователи, связи",
+            [
+                (40, create_product),
+                (30, add_product_categories),
+                (20, create_user),
+                (10, create_category),
+            ],
+        ),
+        Scenario(
+            "checkout",
+            "Конкурентная покупка одного товара (oversell, шардирование остатка)",
+            [(100, buy_hot_product)],
+        ),
+    )
+}
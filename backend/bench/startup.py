@@ -0,0 +1,93 @@
+"""
+Холодный старт: импорт приложения, lifespan и первые запросы в новом процессе
+
+Запускается из python -m bench startup отдельным процессом на каждый замер:
+только так импорт и первые обращения к БД и bcrypt действительно холодные.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+FIRST_REQUESTS = (
+    ("POST /token", "POST", "/token"),
+    ("GET /products", "GET", "/products"),
+    ("GET /categories", "GET", "/categories"),
+)
+
+
+async def _serve_first_requests(app, password: str) -> dict:
+    from httpx import ASGITransport, AsyncClient
+
+    timings = {}
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["lifespan"] = time.perf_counter() - started
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Второй запрос того же эндпоинта — для сравнения с первым
+            for attempt in ("first", "second"):
+                if attempt == "second":
+                    timings["first_requests_served"] = time.perf_counter() - started
+                for endpoint, method, url in FIRST_REQUESTS:
+                    kwargs = {}
+                    if url == "/token":
+                        kwargs["data"] = {"username": "user1", "password": password}
+                    request_started = time.perf_counter()
+                    response = await client.request(method, url, **kwargs)
+                    response.raise_for_status()
+                    timings[f"{attempt} {endpoint}"] = (
+                        time.perf_counter() - request_started
+                    )
+    return timings
+
+
+def measure() -> dict:
+    """Один замер в текущем процессе (должен быть новым)"""
+    started = time.perf_counter()
+    import main
+    from bench.dataset import BENCH_PASSWORD
+
+    import_seconds = time.perf_counter() - started
+    timings = asyncio.run(_serve_first_requests(main.app, BENCH_PASSWORD))
+    return {"import": import_seconds, **timings}
+
+
+def run_startup(repeat: int) -> dict:
+    """
+    Замеры холодного старта с прогревом (STARTUP_WARMUP=1) и без него
+    :param repeat: Число процессов на каждый режим
+    :return: Медианы по режимам и все замеры (в секундах)
+    """
+    result = {}
+    for mode, warmup in (("warmup", "1"), ("no_warmup", "0")):
+        env = {**os.environ, "STARTUP_WARMUP": warmup}
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, "-m", "bench.startup"],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            run = json.loads(completed.stdout)
+            run["process"] = time.perf_counter() - started
+            runs.append(run)
+        result[mode] = {
+            "median_ms": {
+                key: round(statistics.median(run[key] for run in runs) * 1000, 3)
+                for key in runs[0]
+            },
+            "runs": runs,
+        }
+    return result
+
+
+if __name__ == "__main__":
+    json.dump(measure(), sys.stdout)
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Protocol
+
+# Маркер промаха: None — допустимое закешированное значение (негативный кеш)
+MISSING: Any = object()
+
+
+class LRUCache:
+    """
+    Внутрипроцессный LRU-кеш с TTL
+    :param max_entries: Максимальное число записей
+    :param ttl: Время жизни записи в секундах
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SharedCache(Protocol):
+    """Общий для процессов уровень кеша (например, Redis)"""
+
+    async def get(self, key: str) -> Any: ...
+
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    async def delete(self, *keys: str) -> None: ...
+
+    async def clear(self) -> None: ...
+
+
+class InMemorySharedCache:
+    """Локальная замена общего кеша для разработки и тестов"""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float, Any]] = {}
+
+    async def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._data.pop(key, None)
+            return MISSING
+        return item[1]
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    shared_hits: int = 0
+    misses: int = 0
+    loads: int = 0
+    coalesced: int = 0
+    invalidations: int = 0
+
+
+class ReadThroughCache:
+    """
+    Read-through кеш: LRU в процессе, затем опциональный общий уровень, затем загрузчик.
+    Параллельные промахи по одному ключу схлопываются в одну загрузку (single-flight).
+    :param local: Внутрипроцессный уровень
+    :param shared: Общий уровень (опционально)
+    """
+
+    def __init__(self, local: LRUCache, shared: SharedCache | None = None):
+        self.local = local
+        self.shared = shared
+        self.stats = CacheStats()
+        self._inflight: dict[str, asyncio.Future] = {}
+        # Поколение растёт при каждой инвалидации; загрузка, начатая
+        # до инвалидации, не должна положить в кеш устаревшие данные
+        self._generation = 0
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        store_if: Callable[[Any], bool] | None = None,
+    ) -> Any:
+        """
+        Значение из кеша или от загрузчика
+        :param key: Ключ
+        :param loader: Загрузчик при промахе
+        :param store_if: Класть ли загруженное значение в кеш (по умолчанию — всегда)
+        """
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.stats.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value, loaded = await self._load(key, loader)
+            if generation == self._generation and (store_if is None or store_if(value)):
+                self.local.set(key, value)
+                if loaded and self.shared is not None:
+                    await self.shared.set(key, value, self.local.ttl)
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже получит вызывающий; помечаем его прочитанным
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def _load(
+        self, key: str, loader: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, bool]:
+        if self.shared is not None:
+            value = await self.shared.get(key)
+            if value is not MISSING:
+                self.stats.shared_hits += 1
+                return value, False
+
+        self.stats.misses += 1
+        value = await loader()
+        self.stats.loads += 1
+        return value, True
+
+    async def invalidate(self) -> None:
+        self._generation += 1
+        self.local.clear()
+        if self.shared is not None:
+            await self.shared.clear()
+        self.stats.invalidations += 1
+
+    async def invalidate_keys(self, *keys: str) -> None:
+        """Удаляет отдельные ключи из обоих уровней, не трогая остальные"""
+        self._generation += 1
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None:
+            await self.shared.delete(*keys)
+        self.stats.invalidations += 1
+
+    def clear_local(self) -> None:
+        """Сбрасывает только локальный уровень: общий очищает тот, кто писал"""
+        self._generation += 1
+        self.local.clear()
+        self.stats.invalidations += 1
+
+    def discard(self, key: str) -> None:
+        """Удаляет ключ из локального уровня; можно вызывать из синхронных хуков"""
+        self._generation += 1
+        self.local.delete(key)
+        self.stats.invalidations += 1
+
+    def snapshot(self) -> dict:
+        lookups = self.stats.hits + self.stats.shared_hits + self.stats.misses
+        return {
+            **asdict(self.stats),
+            "entries": len(self.local),
+            "hit_ratio": (self.stats.hits + self.stats.shared_hits) / lookups
+            if lookups
+            else 0.0,
+        }
@@ -1,4 +1,7 @@
-from pydantic import Field
+import functools
+import os
+
+from pydantic import Field, ValidationError
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,10 +17,129 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(..., alias="ACCESS_TOKEN_EXPIRE_MINUTES")
     REFRESH_TOKEN_EXPIRE_DAYS: int = Field(..., alias="REFRESH_TOKEN_EXPIRE_DAYS")
     DATABASE_URL: str = Field(..., alias="DATABASE_URL")
+    # Реплики для чтения каталога и комментариев: URL через запятую (пусто —
+    # всё читается с primary), период проверки здоровья и допустимое
+    # отставание репликации в секундах (PostgreSQL, 0 — не проверять)
+    DATABASE_REPLICA_URLS: str = Field("", alias="DATABASE_REPLICA_URLS")
+    REPLICA_HEALTH_INTERVAL: float = Field(5.0, alias="REPLICA_HEALTH_INTERVAL", gt=0)
+    REPLICA_MAX_LAG_SECONDS: float = Field(5.0, alias="REPLICA_MAX_LAG_SECONDS", ge=0)
+
+    # Пул соединений и драйвер
+    DB_POOL_SIZE: int = Field(5, alias="DB_POOL_SIZE", ge=1)
+    DB_MAX_OVERFLOW: int = Field(10, alias="DB_MAX_OVERFLOW", ge=0)
+    # Общий лимит соединений всех воркеров (0 — без лимита): пул каждого
+    # воркера урезается до DB_CONNECTION_BUDGET // WEB_WORKERS
+    DB_CONNECTION_BUDGET: int = Field(0, alias="DB_CONNECTION_BUDGET", ge=0)
+    DB_POOL_TIMEOUT: float = Field(30.0, alias="DB_POOL_TIMEOUT", gt=0)
+    DB_POOL_RECYCLE: int = Field(-1, alias="DB_POOL_RECYCLE")
+    DB_POOL_PRE_PING: bool = Field(False, alias="DB_POOL_PRE_PING")
+    DB_STATEMENT_CACHE_SIZE: int = Field(100, alias="DB_STATEMENT_CACHE_SIZE", ge=0)
+    DB_CONNECT_TIMEOUT: float = Field(10.0, alias="DB_CONNECT_TIMEOUT", gt=0)
+    DB_COMMAND_TIMEOUT: float | None = Field(None, alias="DB_COMMAND_TIMEOUT")
+    # Применять миграции схемы при старте (иначе: python migrations.py upgrade)
+    DB_MIGRATE_ON_STARTUP: bool = Field(True, alias="DB_MIGRATE_ON_STARTUP")
+
+    # Старт приложения: сколько соединений открыть заранее (не больше
+    # DB_POOL_SIZE), прогрев bcrypt и частых запросов, бюджет времени старта
+    # (превышение — предупреждение в журнале, 0 — без проверки)
+    STARTUP_POOL_PREWARM: int = Field(2, alias="STARTUP_POOL_PREWARM", ge=0)
+    STARTUP_WARMUP: bool = Field(True, alias="STARTUP_WARMUP")
+    STARTUP_BUDGET_SECONDS: float = Field(10.0, alias="STARTUP_BUDGET_SECONDS", ge=0)
+
+    # Инструментирование: порог медленного SQL (0 — выключено), запись его
+    # параметров, заголовок Server-Timing и период замера задержки event loop
+    SLOW_QUERY_SECONDS: float = Field(0.5, alias="SLOW_QUERY_SECONDS", ge=0)
+    SLOW_QUERY_LOG_PARAMS: bool = Field(True, alias="SLOW_QUERY_LOG_PARAMS")
+    SERVER_TIMING: bool = Field(False, alias="SERVER_TIMING")
+
+    # Сжатие ответов (brotli/gzip по Accept-Encoding) от заданного размера тела
+    RESPONSE_COMPRESSION: bool = Field(True, alias="RESPONSE_COMPRESSION")
+    RESPONSE_COMPRESSION_MIN_SIZE: int = Field(
+        1024, alias="RESPONSE_COMPRESSION_MIN_SIZE", ge=0
+    )
+    RESPONSE_GZIP_LEVEL: int = Field(5, alias="RESPONSE_GZIP_LEVEL", ge=1, le=9)
+    RESPONSE_BROTLI_QUALITY: int = Field(
+        4, alias="RESPONSE_BROTLI_QUALITY", ge=0, le=11
+    )
+    EVENT_LOOP_MONITOR_INTERVAL: float = Field(
+        0.5, alias="EVENT_LOOP_MONITOR_INTERVAL", ge=0
+    )
+
+    # Сервер (serve.py): адрес, число процессов-воркеров (0 — по числу CPU)
+    # и сколько ждать завершения запросов при остановке или перезапуске воркера
+    WEB_HOST: str = Field("0.0.0.0", alias="WEB_HOST")
+    WEB_PORT: int = Field(8000, alias="WEB_PORT")
+    WEB_WORKERS: int = Field(0, alias="WEB_WORKERS", ge=0)
+    WEB_GRACEFUL_SHUTDOWN_SECONDS: float = Field(
+        30.0, alias="WEB_GRACEFUL_SHUTDOWN_SECONDS", gt=0
+    )
+
+    # Оформление заказа
+    CHECKOUT_MAX_RETRIES: int = Field(3, alias="CHECKOUT_MAX_RETRIES", ge=0)
+
+    # Витрины продаж: период обновления (0 — только вручную) и задержка,
+    # после которой покупка считается зафиксированной
+    ANALYTICS_REFRESH_INTERVAL: float = Field(60.0, alias="ANALYTICS_REFRESH_INTERVAL")
+    ANALYTICS_SETTLE_SECONDS: float = Field(60.0, alias="ANALYTICS_SETTLE_SECONDS")
+
+    # Кеш каталога
+    CATALOG_CACHE_TTL: float = Field(30.0, alias="CATALOG_CACHE_TTL")
+    CATALOG_CACHE_MAX_ENTRIES: int = Field(4096, alias="CATALOG_CACHE_MAX_ENTRIES")
+    CATALOG_CACHE_SHARED: bool = Field(False, alias="CATALOG_CACHE_SHARED")
+
+    # HTTP-кеширование каталога: как часто воркер перечитывает версию каталога,
+    # на сколько секунд допустимо отставание остатков в ответах с ETag
+    # (покупки не меняют версию, чтобы не упираться в одну строку) и сколько
+    # секунд ответ хранится в proxy_cache nginx (0 — не кешировать)
+    CATALOG_VERSION_TTL: float = Field(1.0, alias="CATALOG_VERSION_TTL", ge=0)
+    CATALOG_STOCK_STALENESS_SECONDS: int = Field(
+        10, alias="CATALOG_STOCK_STALENESS_SECONDS", gt=0
+    )
+    CATALOG_PROXY_CACHE_SECONDS: int = Field(
+        1, alias="CATALOG_PROXY_CACHE_SECONDS", ge=0
+    )
+
+    # Кеш пользователей для аутентификации и режим JWT с claims пользователя
+    PRINCIPAL_CACHE_TTL: float = Field(10.0, alias="PRINCIPAL_CACHE_TTL")
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = Field(10000, alias="PRINCIPAL_CACHE_MAX_ENTRIES")
+    JWT_EMBED_PRINCIPAL: bool = Field(False, alias="JWT_EMBED_PRINCIPAL")
+
+    # Пул потоков для bcrypt
+    PASSWORD_HASH_WORKERS: int = Field(
+        os.cpu_count() or 1, alias="PASSWORD_HASH_WORKERS", ge=1
+    )
+    PASSWORD_HASH_QUEUE_LIMIT: int = Field(32, alias="PASSWORD_HASH_QUEUE_LIMIT", ge=0)
+
+    @property
+    def replica_urls(self) -> list[str]:
+        return [
+            url.strip() for url in self.DATABASE_REPLICA_URLS.split(",") if url.strip()
+        ]
+
+    @property
+    def web_workers(self) -> int:
+        return self.WEB_WORKERS or os.cpu_count() or 1
+
+
+class ConfigError(RuntimeError):
+    """Настройки не прошли проверку (нет переменной окружения, неверный тип)"""
+
+
+@functools.cache
+def get_settings() -> Settings:
+    """
+    Настройки читаются при первом обращении, а не при импорте config.py:
+    ошибка конфигурации — исключение с понятным текстом, а не exit(1)
+    посреди импорта (что ломало инструменты, импортирующие модули)
+    """
+    try:
+        return Settings()  # type: ignore
+    except ValidationError as e:
+        raise ConfigError(f"Ошибка конфигурации: {e}") from e
 
 
-try:
-    settings = Settings()  # type: ignore
-except Exception as e:
-    print(f"Ошибка конфигурации: {e}")
-    exit(1)
+def __getattr__(name: str):
+    # from config import settings — ленивый атрибут модуля
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,29 +1,292 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import (
+    create_async_engine,
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+)
 from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     UniqueConstraint,
+    case,
+    delete,
+    event,
+    exists,
+    insert,
+    inspect,
+    literal,
     select,
     func,
+    text,
     Table,
     Integer,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import (
+    Mapped,
+    Session,
+    aliased,
+    load_only,
+    relationship,
+    mapped_column,
 )
-from sqlalchemy.orm import Mapped, relationship, mapped_column, selectinload
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.exc import IntegrityError
-from models import CommentSchema, UserReqst
-from typing import Sequence
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql.expression import CompoundSelect, Select
+from models import CartOperation, CommentSchema, UserReqst
+from typing import Any, AsyncIterator
+import asyncio
+import base64
+import contextlib
+import itertools
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from cache import InMemorySharedCache, LRUCache, ReadThroughCache
 from config import settings
+from instrumentation import instrument_engine, traced
+from metrics import PoolMetrics
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = settings.DATABASE_URL
-engine = create_async_engine(DATABASE_URL)
+pool_metrics = PoolMetrics()
+
+
+# Ключ в info записи пула: сколько заняло открытие соединения внутри _do_get
+CONNECT_SECONDS_KEY = "connect_seconds"
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время ожидания свободного соединения и открытия нового"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            pool_metrics.wait_seconds.observe(time.perf_counter() - started)
+            raise
+        # Соединение сверх занятых открывается прямо в _do_get; это время
+        # пишется в connect_seconds и в ожидание очереди не входит
+        connect_seconds = connection.info.pop(CONNECT_SECONDS_KEY, 0.0)
+        pool_metrics.wait_seconds.observe(
+            time.perf_counter() - started - connect_seconds
+        )
+        pool_metrics.checkouts += 1
+        if self.overflow() > 0:
+            pool_metrics.overflow_checkouts += 1
+        return connection
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        connection = super()._create_connection()
+        elapsed = time.perf_counter() - started
+        pool_metrics.connect_seconds.observe(elapsed)
+        connection.info[CONNECT_SECONDS_KEY] = elapsed
+        return connection
+
+
+def _pool_limits() -> tuple[int, int]:
+    # Каждый воркер — отдельный процесс со своим пулом; вместе они
+    # не должны превышать DB_CONNECTION_BUDGET (max_connections сервера БД)
+    pool_size, max_overflow = settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+    if settings.DB_CONNECTION_BUDGET:
+        per_worker = max(settings.DB_CONNECTION_BUDGET // settings.web_workers, 1)
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+    return pool_size, max_overflow
+
+
+POOL_SIZE, MAX_OVERFLOW = _pool_limits()
+
+
+def _engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (
+        None,
+        "",
+        ":memory:",
+    ):
+        # SQLite в памяти живёт в одном соединении (StaticPool), пул не настраивается
+        return {}
+
+    options: dict = {
+        "poolclass": InstrumentedPool,
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if parsed.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "timeout": settings.DB_CONNECT_TIMEOUT,
+            "command_timeout": settings.DB_COMMAND_TIMEOUT,
+            # Кеш подготовленных выражений адаптера SQLAlchemy и самого asyncpg
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    created = create_async_engine(url, **_engine_options(url))
+    instrument_engine(
+        created.sync_engine,
+        settings.SLOW_QUERY_SECONDS,
+        settings.SLOW_QUERY_LOG_PARAMS,
+    )
+    return created
+
+
+engine = _create_engine(DATABASE_URL)
+
+# Отставание реплики PostgreSQL; реплика, проигравшая весь полученный WAL,
+# не отстаёт, даже если последняя транзакция была давно
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+REPLICA_CHECK_TIMEOUT = 2.0
+
+
+class ReplicaSet:
+    """
+    Реплики для чтения: выдаются по кругу (round-robin) из здоровых
+    :param urls: URL реплик; пустой список — все запросы идут на primary
+    """
+
+    def __init__(self, urls: list[str]):
+        self.engines = [_create_engine(url) for url in urls]
+        self.healthy = [True] * len(self.engines)
+        self._counter = itertools.count()
+
+    def pick(self) -> AsyncEngine | None:
+        """Следующая здоровая реплика или None, если таких нет"""
+        healthy = [e for e, ok in zip(self.engines, self.healthy) if ok]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def _is_healthy(self, replica: AsyncEngine) -> bool:
+        try:
+            async with asyncio.timeout(REPLICA_CHECK_TIMEOUT):
+                async with replica.connect() as conn:
+                    if (
+                        replica.dialect.name != "postgresql"
+                        or not settings.REPLICA_MAX_LAG_SECONDS
+                    ):
+                        await conn.execute(select(1))
+                        return True
+                    lag = (await conn.execute(REPLICA_LAG_SQL)).scalar_one()
+                    return lag is None or lag <= settings.REPLICA_MAX_LAG_SECONDS
+        except (TimeoutError, OSError, DBAPIError):
+            return False
+
+    async def check(self) -> None:
+        """Проверяет доступность и отставание всех реплик"""
+        results = await asyncio.gather(*(self._is_healthy(e) for e in self.engines))
+        for i, ok in enumerate(results):
+            if ok != self.healthy[i]:
+                logger.warning(
+                    "Реплика %s: %s",
+                    self.engines[i].url.render_as_string(hide_password=True),
+                    "снова доступна" if ok else "исключена (недоступна или отстаёт)",
+                )
+            self.healthy[i] = ok
+
+    def status(self) -> list[dict]:
+        return [
+            {"url": e.url.render_as_string(hide_password=True), "healthy": ok}
+            for e, ok in zip(self.engines, self.healthy)
+        ]
+
+
+replicas = ReplicaSet(settings.replica_urls)
+
+
+def _is_read_only(clause) -> bool:
+    return (
+        isinstance(clause, (Select, CompoundSelect)) and clause._for_update_arg is None
+    )
+
+
+class RoutingSession(Session):
+    """
+    Сессия, которая читает с реплики, выбранной при создании (info["replica"])
+    INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE, flush и прочие выражения идут
+    на primary; после первого такого запроса сессия остаётся на primary
+    до конца (read-your-writes в рамках запроса).
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is None or self.info.get("primary"):
+            return engine.sync_engine
+        if self._flushing or not _is_read_only(clause):
+            self.info["primary"] = True
+            return engine.sync_engine
+        return replica.sync_engine
+
+
 AsyncSessionLocal = async_sessionmaker(
-    engine, expire_on_commit=False, class_=AsyncSession
+    engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
 )
 Base = declarative_base()
 
 
+@event.listens_for(engine.sync_engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite проверяет внешние ключи только по запросу; на них опирается add_to_cart
+    if engine.dialect.name == "sqlite":
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+# Кеш каталога (продукты и категории); сбрасывается при любой записи в каталог,
+# а в других воркерах — как только они увидят новую версию каталога.
+# Покупки версию не меняют, поэтому TTL не дольше допустимого отставания остатков
+catalog_cache = ReadThroughCache(
+    LRUCache(
+        max_entries=settings.CATALOG_CACHE_MAX_ENTRIES,
+        ttl=min(settings.CATALOG_CACHE_TTL, settings.CATALOG_STOCK_STALENESS_SECONDS),
+    ),
+    shared=InMemorySharedCache() if settings.CATALOG_CACHE_SHARED else None,
+)
+# Версия каталога для ETag: читается из БД не чаще раза в CATALOG_VERSION_TTL,
+# после записи в этом процессе — сразу
+CATALOG_VERSION_KEY = "catalog:version"
+catalog_version_cache = ReadThroughCache(
+    LRUCache(max_entries=1, ttl=settings.CATALOG_VERSION_TTL)
+)
+# Последняя версия, которую видел этот процесс
+_seen_catalog_version: int | None = None
+# Кеш пользователей для аутентификации (только в процессе, короткий TTL)
+principal_cache = ReadThroughCache(
+    LRUCache(
+        max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+        ttl=settings.PRINCIPAL_CACHE_TTL,
+    )
+)
+# Ключ session.info: пользователи, изменённые в текущей транзакции
+FORGET_PRINCIPALS_KEY = "forget_principals"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -47,6 +310,8 @@ product_category = Table(
     Base.metadata,
     Column("product_id", Integer, ForeignKey("products.id"), primary_key=True),
     Column("category_id", Integer, ForeignKey("categories.id"), primary_key=True),
+    # Обратный индекс для фильтрации каталога по категории
+    Index("ix_product_category_category_id_product_id", "category_id", "product_id"),
 )
 
 
@@ -58,6 +323,9 @@ class Product(Base):
     description: Mapped[str] = mapped_column()
     price: Mapped[float] = mapped_column()
     stock: Mapped[int] = mapped_column(default=0)
+    # Число шардов остатка; 0 — остаток хранится в stock,
+    # иначе в product_stock_shards, а stock не используется
+    stock_shards: Mapped[int] = mapped_column(default=0, server_default="0")
 
     # Отношения
     categories: Mapped[list["Category"]] = relationship(
@@ -69,6 +337,47 @@ class Product(Base):
         back_populates="product", cascade="all, delete-orphan"
     )
 
+    # Индексы под ключи сортировки каталога (id всегда добавляется как tie-breaker)
+    __table_args__ = (Index("ix_products_price_id", "price", "id"),)
+
+
+class ProductStockShard(Base):
+    """Часть остатка популярного товара: списания расходятся по N строкам"""
+
+    __tablename__ = "product_stock_shards"
+
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    shard: Mapped[int] = mapped_column(primary_key=True)
+    stock: Mapped[int] = mapped_column(default=0)
+
+
+class CatalogVersion(Base):
+    """
+    Счётчик изменений каталога (одна строка): растёт в транзакции каждой
+    записи в товары и категории, из него строится ETag ответов каталога
+    """
+
+    __tablename__ = "catalog_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(default=0)
+    updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True))
+
+
+# Фактический остаток товара с учётом шардирования (для выборок из products)
+product_stock = case(
+    (
+        Product.stock_shards > 0,
+        select(func.coalesce(func.sum(ProductStockShard.stock), 0))
+        .where(ProductStockShard.product_id == Product.id)
+        .correlate(Product)
+        .scalar_subquery(),
+    ),
+    else_=Product.stock,
+)
+
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -78,12 +387,12 @@ class Comment(Base):
     created_at: Mapped[DateTime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     product_id: Mapped[int] = mapped_column(ForeignKey("products.id"))
 
     # Parent-child relationship
     parent_id: Mapped[int | None] = mapped_column(
-        ForeignKey("comments.id"), nullable=True
+        ForeignKey("comments.id"), nullable=True, index=True
     )
 
     # Relationships
@@ -94,6 +403,14 @@ class Comment(Base):
     )
     parent: Mapped["Comment"] = relationship(back_populates="replies", remote_side=[id])
 
+    # created_at приходит из INSERT ... RETURNING вместо отдельного SELECT
+    __mapper_args__ = {"eager_defaults": True}
+
+    # Корневые комментарии товара выбираются по (product_id, parent_id IS NULL, id)
+    __table_args__ = (
+        Index("ix_comments_product_id_parent_id_id", "product_id", "parent_id", "id"),
+    )
+
 
 class Category(Base):
     __tablename__ = "categories"
@@ -101,6 +418,9 @@ class Category(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     name: Mapped[str] = mapped_column(unique=True, index=True)
     description: Mapped[str] = mapped_column()
+    # Число товаров в категории; обновляется вместе со связями в product_category,
+    # чтобы навигация по категориям не делала GROUP BY по таблице связей
+    product_count: Mapped[int] = mapped_column(default=0, server_default="0")
 
     # Связь с товарами (многие-ко-многим)
     products: Mapped[list["Product"]] = relationship(
@@ -137,6 +457,14 @@ class Purchased(Base):
         DateTime(timezone=True), server_default=func.now()
     )
 
+    __mapper_args__ = {"eager_defaults": True}
+    # История покупок пользователя листается по (user_id, id);
+    # отчёты за период фильтруют по purchase_date
+    __table_args__ = (
+        Index("ix_purchased_user_id_id", "user_id", "id"),
+        Index("ix_purchased_purchase_date", "purchase_date"),
+    )
+
     # Отношения
     user: Mapped["User"] = relationship(back_populates="purchases")
     product: Mapped["Product"] = relationship(back_populates="purchased")
@@ -152,48 +480,672 @@ async def get_async_db():
         yield db
 
 
+async def get_read_db():
+    """
+    Сессия для эндпоинтов чтения (каталог, поиск, комментарии, профили):
+    запросы идут на одну из реплик, если они настроены
+    """
+    async with AsyncSessionLocal(info={"replica": replicas.pick()}) as db:
+        yield db
+
+
+async def run_replica_health_checks(interval: float) -> None:
+    """Периодически проверяет реплики, пока задачу не отменят"""
+    while True:
+        await replicas.check()
+        await asyncio.sleep(interval)
+
+
+async def save(db: AsyncSession, *instances) -> None:
+    """
+    Сохраняет объекты и фиксирует транзакцию без последующего refresh()
+    id и серверные значения по умолчанию (модели с eager_defaults) приходят
+    в том же INSERT ... RETURNING, а expire_on_commit=False сохраняет их в объекте.
+    При IntegrityError транзакция откатывается, исключение пробрасывается.
+    """
+    db.add_all(instances)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+
+
+@traced
 async def get_user_by_username(db: AsyncSession, username: str) -> User | None:
-    result = await db.execute(select(User).where(User.username == username))
+    # Для входа нужны только эти колонки; профиль отдаётся через get_principal
+    result = await db.execute(
+        select(User)
+        .options(load_only(User.id, User.username, User.hashed_password, User.disabled))
+        .where(User.username == username)
+    )
     return result.scalar_one_or_none()
 
 
+PRINCIPAL_COLUMNS = (
+    User.id,
+    User.username,
+    User.full_name,
+    User.email,
+    User.disabled,
+)
+
+
+@traced
+async def get_principal(db: AsyncSession, username: str) -> dict | None:
+    """
+    Получает пользователя для аутентификации через кеш (без хеша пароля)
+    :param db: Асинхронная сессия
+    :param username: Имя пользователя (claim sub)
+    :return: Колонки пользователя или None
+    """
+
+    async def load() -> dict | None:
+        result = await db.execute(
+            select(*PRINCIPAL_COLUMNS).where(User.username == username)
+        )
+        row = result.mappings().first()
+        return dict(row) if row else None
+
+    return await principal_cache.get_or_load(f"user:{username}", load)
+
+
+@traced
+async def get_user_profile(db: AsyncSession, username: str) -> dict | None:
+    """
+    Публичный профиль пользователя: обычный запрос, без principal_cache
+    Сессия может читать с реплики; отстающая строка не должна попасть в кеш
+    аутентификации (например, уже отключённый пользователь).
+    :param db: Асинхронная сессия
+    :param username: Имя пользователя
+    :return: Колонки пользователя или None
+    """
+    result = await db.execute(
+        select(*PRINCIPAL_COLUMNS).where(User.username == username)
+    )
+    row = result.mappings().first()
+    return dict(row) if row else None
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _forget_principal(mapper, connection, target: User):
+    # Новый, изменённый или отключённый пользователь не должен ждать конца TTL.
+    # Сброс при flush не спасает от чтения старой строки до commit, поэтому
+    # ключи сбрасываются ещё раз после commit (_forget_principals_on_commit)
+    state = inspect(target)
+    keys = {f"user:{target.username}"}
+    keys.update(
+        f"user:{username}" for username in state.attrs.username.history.deleted or ()
+    )
+    for key in keys:
+        principal_cache.discard(key)
+    if state.session is not None:
+        state.session.info.setdefault(FORGET_PRINCIPALS_KEY, set()).update(keys)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _forget_principals_on_commit(session: Session):
+    for key in session.info.pop(FORGET_PRINCIPALS_KEY, ()):
+        principal_cache.discard(key)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _drop_forgotten_principals(session: Session):
+    session.info.pop(FORGET_PRINCIPALS_KEY, None)
+
+
+@traced
+async def get_cached_product(db: AsyncSession, product_id: int) -> dict | None:
+    """
+    Получает продукт через кеш каталога
+    Отсутствие продукта тоже кешируется, но только если его видел primary:
+    отстающая реплика ещё может не знать о новом товаре.
+    Проверки существования перед записью делаются запросом в транзакции.
+    :param db: Асинхронная сессия
+    :param product_id: ID продукта
+    :return: Колонки продукта или None
+    """
+
+    async def load() -> dict | None:
+        result = await db.execute(
+            select(*PRODUCT_COLUMNS).where(Product.id == product_id)
+        )
+        row = result.mappings().first()
+        return dict(row) if row else None
+
+    info = db.sync_session.info
+    on_replica = info.get("replica") is not None and not info.get("primary")
+    return await catalog_cache.get_or_load(
+        f"product:{product_id}",
+        load,
+        store_if=(lambda product: product is not None) if on_replica else None,
+    )
+
+
+async def _load_product(db: AsyncSession, product_id: int) -> dict | None:
+    # Запрос в текущей транзакции (на primary), мимо кеша каталога
+    result = await db.execute(select(*PRODUCT_COLUMNS).where(Product.id == product_id))
+    row = result.mappings().first()
+    return dict(row) if row else None
+
+
+@traced
+async def get_cached_categories(db: AsyncSession) -> dict[int, dict]:
+    """
+    Получает все категории через кеш каталога
+    :param db: Асинхронная сессия
+    :return: Словарь {id: колонки категории}
+    """
+
+    async def load() -> dict[int, dict]:
+        result = await db.execute(
+            select(
+                Category.id,
+                Category.name,
+                Category.description,
+                Category.product_count,
+            ).order_by(Category.id)
+        )
+        return {row["id"]: dict(row) for row in result.mappings()}
+
+    return await catalog_cache.get_or_load("categories", load)
+
+
+async def _attach_categories(
+    db: AsyncSession, category_ids: list[int]
+) -> list[Category]:
+    # Категории читаются в транзакции записи, а не из кеша: кеш другого
+    # воркера может ещё не знать о только что созданной категории
+    result = await db.execute(
+        select(Category).where(Category.id.in_(dict.fromkeys(category_ids)))
+    )
+    return list(result.scalars())
+
+
+async def bump_category_counts(db: AsyncSession, counts: dict[int, int]) -> None:
+    """
+    Увеличивает счётчики товаров категорий в текущей транзакции
+    Вызывается вместе с добавлением связей, поэтому откатывается вместе с ними.
+    :param db: Асинхронная сессия
+    :param counts: Прирост {category_id: число новых товаров}
+    """
+    counts = {category_id: n for category_id, n in counts.items() if n}
+    if not counts:
+        return
+    await db.execute(
+        update(Category)
+        .where(Category.id.in_(counts))
+        .values(product_count=Category.product_count + case(counts, value=Category.id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Пересчёт product_count всех категорий по таблице связей (бэкфилл и ремонт)
+RECOUNT_CATEGORIES = update(Category).values(
+    product_count=select(func.count())
+    .where(product_category.c.category_id == Category.id)
+    .scalar_subquery()
+)
+
+
+@traced
+async def recount_categories(db: AsyncSession) -> None:
+    """Пересчитывает product_count всех категорий по таблице связей"""
+    await db.execute(RECOUNT_CATEGORIES.execution_options(synchronize_session=False))
+    await bump_catalog_version(db)
+    await db.commit()
+    await invalidate_catalog()
+
+
+async def bump_catalog_version(db: AsyncSession) -> None:
+    """
+    Увеличивает версию каталога в текущей транзакции
+    Вызывается перед commit() каждой записи в каталог; строка создаётся
+    при первом вызове.
+    """
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        dialect_insert(db, CatalogVersion)
+        .values(id=1, version=1, updated_at=now)
+        .on_conflict_do_update(
+            index_elements=[CatalogVersion.id],
+            set_={"version": CatalogVersion.version + 1, "updated_at": now},
+        )
+    )
+
+
+async def get_catalog_version() -> tuple[int, datetime | None]:
+    """
+    Текущая версия каталога и время последнего изменения
+    Читается с primary: реплика может отставать от записи. Если версия
+    изменилась (запись в другом воркере), локальный кеш каталога сбрасывается,
+    чтобы тело ответа не было старее ETag.
+    """
+
+    async def load() -> tuple[int, datetime | None]:
+        global _seen_catalog_version
+        async with engine.connect() as conn:
+            row = (
+                await conn.execute(
+                    select(CatalogVersion.version, CatalogVersion.updated_at).where(
+                        CatalogVersion.id == 1
+                    )
+                )
+            ).first()
+        version, updated_at = (row.version, row.updated_at) if row else (0, None)
+        if _seen_catalog_version is not None and version != _seen_catalog_version:
+            catalog_cache.clear_local()
+        _seen_catalog_version = version
+        # SQLite возвращает время без часового пояса
+        if updated_at is not None and updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return version, updated_at
+
+    return await catalog_version_cache.get_or_load(CATALOG_VERSION_KEY, load)
+
+
+async def invalidate_catalog() -> None:
+    """Сбрасывает кеш каталога и версию для ETag после записи в каталог"""
+    await catalog_cache.invalidate()
+    catalog_version_cache.discard(CATALOG_VERSION_KEY)
+
+
+@traced
+async def get_product_detail(
+    db: AsyncSession, product_id: int, product: dict | None = None
+) -> dict | None:
+    """
+    Карточка продукта с категориями: колонки продукта из кеша каталога
+    и одна проекция (id, name) категорий через таблицу связей
+    :param db: Асинхронная сессия
+    :param product_id: ID продукта
+    :param product: Колонки продукта, уже прочитанные в транзакции записи
+    :return: Продукт со списком categories или None
+    """
+    if product is None:
+        product = await get_cached_product(db, product_id)
+    if product is None:
+        return None
+    result = await db.execute(
+        select(Category.id, Category.name)
+        .join(product_category, product_category.c.category_id == Category.id)
+        .where(product_category.c.product_id == product_id)
+        .order_by(Category.id)
+    )
+    return {**product, "categories": [dict(row) for row in result.mappings()]}
+
+
+def dialect_insert(db: AsyncSession, entity):
+    # ON CONFLICT есть только в диалектных insert(); в тестах используется SQLite
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(entity)
+    return postgresql.insert(entity)
+
+
+def _cart_upsert(
+    db: AsyncSession, user_id: int, quantities: dict[int, int], increment: bool
+):
+    # Одна многострочная вставка: строки берутся из products, так что
+    # несуществующие товары и товары без остатка просто не попадают в выборку
+    quantity = case(quantities, value=Product.id)
+    stmt = dialect_insert(db, Cart).from_select(
+        ["user_id", "product_id", "quantity"],
+        select(literal(user_id), Product.id, quantity).where(
+            Product.id.in_(quantities), product_stock >= quantity
+        ),
+    )
+    if not increment:
+        return stmt.on_conflict_do_update(
+            index_elements=[Cart.user_id, Cart.product_id],
+            set_={"quantity": stmt.excluded.quantity},
+        ).returning(Cart)
+
+    stock = (
+        select(product_stock)
+        .where(Product.id == stmt.excluded.product_id)
+        .scalar_subquery()
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Cart.user_id, Cart.product_id],
+        set_={"quantity": Cart.quantity + stmt.excluded.quantity},
+        where=Cart.quantity + stmt.excluded.quantity <= stock,
+    ).returning(Cart)
+
+
+@traced
 async def add_to_cart(
     db: AsyncSession, user_id: int, product_id: int, quantity: int = 1
 ) -> Cart:
-    user = await db.execute(select(User).filter(User.id == user_id))
-    user = user.scalars().first()
-
-    product = await db.execute(select(Product).filter(Product.id == product_id))
-    product = product.scalars().first()
+    """
+    Добавляет товар в корзину одним запросом
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE ... RETURNING: существование
+    пользователя проверяет внешний ключ, существование товара и остаток —
+    условия самого запроса, поэтому параллельные добавления не теряются.
+    :param db: Асинхронная сессия
+    :param user_id: ID пользователя
+    :param product_id: ID товара
+    :param quantity: Сколько добавить к текущему количеству
+    :return: Запись корзины с итоговым количеством
+    """
+    if quantity <= 0:
+        raise ValueError("Количество должно быть положительным числом")
 
-    if not user or not product:
+    stmt = _cart_upsert(db, user_id, {product_id: quantity}, increment=True)
+    try:
+        result = await db.scalars(stmt, execution_options={"populate_existing": True})
+        cart_item = result.first()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise ValueError("Пользователь или товар не найдены")
 
-    # Проверяем наличие товара в корзине
-    cart_item = await db.execute(
-        select(Cart)
-        .filter(Cart.user_id == user_id)
-        .filter(Cart.product_id == product_id)
-    )
-    cart_item = cart_item.scalars().first()
+    if cart_item is None:
+        # Строка не вставлена и не обновлена: выясняем причину только в этом случае
+        if await _load_product(db, product_id) is None:
+            raise ValueError("Пользователь или товар не найдены")
+        raise ValueError("Недостаточно товара на складе")
+    return cart_item
 
-    if cart_item:
-        # Обновляем количество
-        cart_item.quantity += quantity
-    else:
-        # Создаем новую запись
-        cart_item = Cart(user_id=user_id, product_id=product_id, quantity=quantity)
-        db.add(cart_item)
+
+@traced
+async def apply_cart_batch(
+    db: AsyncSession, user_id: int, operations: list[CartOperation]
+) -> list[Cart]:
+    """
+    Применяет набор изменений корзины в одной транзакции
+    Операции сворачиваются по товару в порядке следования, после чего
+    выполняются не более чем одна вставка-добавление, одна вставка-замена
+    и одно удаление. Если хоть одну операцию выполнить нельзя, откатывается всё.
+    :param db: Асинхронная сессия
+    :param user_id: ID пользователя
+    :param operations: Операции add / set / remove
+    :return: Корзина пользователя после изменений
+    """
+    # product_id -> (заменить?, количество)
+    final: dict[int, tuple[bool, int]] = {}
+    for operation in operations:
+        if operation.op == "remove":
+            final[operation.product_id] = (True, 0)
+            continue
+        if operation.quantity <= 0:
+            raise ValueError("Количество должно быть положительным числом")
+        if operation.op == "set":
+            final[operation.product_id] = (True, operation.quantity)
+        else:
+            replace, current = final.get(operation.product_id, (False, 0))
+            final[operation.product_id] = (replace, current + operation.quantity)
+
+    added = {pid: q for pid, (replace, q) in final.items() if not replace}
+    replaced = {pid: q for pid, (replace, q) in final.items() if replace and q}
+    removed = [pid for pid, (replace, q) in final.items() if replace and not q]
 
     try:
+        if removed:
+            await db.execute(
+                delete(Cart).where(
+                    Cart.user_id == user_id, Cart.product_id.in_(removed)
+                )
+            )
+        applied: set[int] = set()
+        for quantities, increment in ((added, True), (replaced, False)):
+            if quantities:
+                result = await db.scalars(
+                    _cart_upsert(db, user_id, quantities, increment),
+                    execution_options={"populate_existing": True},
+                )
+                applied.update(item.product_id for item in result)
+
+        failed = (added.keys() | replaced.keys()) - applied
+        if failed:
+            await db.rollback()
+            raise ValueError(
+                "Товары не найдены или их недостаточно на складе: "
+                + ", ".join(map(str, sorted(failed)))
+            )
+
+        result = await db.scalars(
+            select(Cart).where(Cart.user_id == user_id).order_by(Cart.id)
+        )
+        cart = list(result)
         await db.commit()
-        await db.refresh(cart_item)
     except IntegrityError:
         await db.rollback()
-        raise ValueError("Ошибка при добавлении в корзину")
-    return cart_item
+        raise ValueError("Пользователь или товар не найдены")
+    return cart
+
+
+# SQLSTATE ошибок, после которых транзакцию можно безопасно повторить
+RETRYABLE_SQLSTATES = {"40001", "40P01"}  # serialization_failure, deadlock_detected
+
+
+def _is_retryable(error: DBAPIError) -> bool:
+    code = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+    if code in RETRYABLE_SQLSTATES:
+        return True
+    # SQLite сообщает о конкурентной записи так
+    return "database is locked" in str(error.orig)
+
+
+async def _take_from_shards(
+    db: AsyncSession, product_id: int, shards: int, quantity: int
+) -> bool:
+    # Обычно хватает одного случайного шарда: покупатели расходятся по разным строкам
+    shard = random.randrange(shards)
+    result = await db.execute(
+        update(ProductStockShard)
+        .where(
+            ProductStockShard.product_id == product_id,
+            ProductStockShard.shard == shard,
+            ProductStockShard.stock >= quantity,
+        )
+        .values(stock=ProductStockShard.stock - quantity)
+        .returning(ProductStockShard.shard)
+    )
+    if result.first() is not None:
+        return True
+
+    # Запасной путь: блокируем все шарды по порядку и собираем количество из нескольких
+    result = await db.execute(
+        select(ProductStockShard.shard, ProductStockShard.stock)
+        .where(ProductStockShard.product_id == product_id)
+        .order_by(ProductStockShard.shard)
+        .with_for_update()
+    )
+    take: dict[int, int] = {}
+    remaining = quantity
+    for shard, stock in result:
+        if remaining == 0:
+            break
+        if stock > 0:
+            take[shard] = min(stock, remaining)
+            remaining -= take[shard]
+    if remaining:
+        return False
+
+    taken = case(take, value=ProductStockShard.shard)
+    await db.execute(
+        update(ProductStockShard)
+        .where(
+            ProductStockShard.product_id == product_id,
+            ProductStockShard.shard.in_(take),
+        )
+        .values(stock=ProductStockShard.stock - taken)
+    )
+    return True
+
+
+async def _checkout_once(db: AsyncSession, user_id: int) -> dict:
+    # Снимок корзины, строки блокируются до конца транзакции
+    result = await db.execute(
+        select(Cart.product_id, Cart.quantity)
+        .where(Cart.user_id == user_id)
+        .order_by(Cart.product_id)
+        .with_for_update()
+    )
+    quantities = {product_id: quantity for product_id, quantity in result}
+    if not quantities:
+        raise ValueError("Корзина пуста")
+
+    result = await db.execute(
+        select(Product.id, Product.price, Product.stock_shards).where(
+            Product.id.in_(quantities)
+        )
+    )
+    prices, sharded = {}, {}
+    for product_id, price, shards in result:
+        prices[product_id] = price
+        if shards:
+            sharded[product_id] = shards
+    plain = {pid: q for pid, q in quantities.items() if pid not in sharded}
+
+    reserved: set[int] = set()
+    if plain:
+        # Товары блокируются в порядке id: параллельные оформления не дают дедлоков
+        await db.execute(
+            select(Product.id)
+            .where(Product.id.in_(plain))
+            .order_by(Product.id)
+            .with_for_update()
+        )
+        # Одно условное списание на все товары: остаток не уходит в минус
+        quantity = case(plain, value=Product.id)
+        result = await db.execute(
+            update(Product)
+            .where(Product.id.in_(plain), Product.stock >= quantity)
+            .values(stock=Product.stock - quantity)
+            .returning(Product.id)
+        )
+        reserved.update(result.scalars())
+    # Строку шардированного товара не блокируем, списываем с шардов
+    for product_id in sorted(sharded):
+        if await _take_from_shards(
+            db, product_id, sharded[product_id], quantities[product_id]
+        ):
+            reserved.add(product_id)
+
+    if missing := quantities.keys() - reserved:
+        raise ValueError(
+            "Недостаточно товара на складе: " + ", ".join(map(str, sorted(missing)))
+        )
+
+    result = await db.scalars(
+        insert(Purchased).returning(Purchased),
+        [
+            {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+            for product_id, quantity in quantities.items()
+        ],
+    )
+    purchases = list(result)
+    # Удаляем только оплаченные строки: добавленное параллельно остаётся в корзине
+    await db.execute(
+        delete(Cart).where(Cart.user_id == user_id, Cart.product_id.in_(quantities))
+    )
+    return {
+        "items": purchases,
+        "total": sum(prices[p.product_id] * p.quantity for p in purchases),
+    }
+
+
+@traced
+async def checkout(db: AsyncSession, user_id: int) -> dict:
+    """
+    Оформляет корзину пользователя в покупки одной транзакцией
+    Остатки списываются одним условным UPDATE ... WHERE stock >= quantity,
+    поэтому товар не продаётся сверх остатка даже при высокой конкуренции.
+    У шардированных товаров списание идёт со случайного шарда.
+    Сериализационные ошибки и дедлоки повторяются до CHECKOUT_MAX_RETRIES раз.
+    :param db: Асинхронная сессия
+    :param user_id: ID пользователя
+    :return: Созданные покупки и сумма заказа
+    """
+    for attempt in range(settings.CHECKOUT_MAX_RETRIES + 1):
+        try:
+            order = await _checkout_once(db, user_id)
+            await db.commit()
+            # Версию каталога покупка не меняет (см. http_cache), но
+            # закешированные остатки купленных товаров устарели
+            await catalog_cache.invalidate_keys(
+                "products:all",
+                *(f"product:{p.product_id}" for p in order["items"]),
+            )
+            return order
+        except ValueError:
+            await db.rollback()
+            raise
+        except DBAPIError as e:
+            await db.rollback()
+            if not _is_retryable(e) or attempt == settings.CHECKOUT_MAX_RETRIES:
+                raise
+            await asyncio.sleep(random.uniform(0, 0.01 * 2**attempt))
+    raise AssertionError("unreachable")
+
+
+def split_stock(total: int, shards: int) -> list[int]:
+    """
+    Делит остаток поровну между шардами; остаток от деления — первым шардам
+    :param total: Общий остаток
+    :param shards: Число шардов
+    :return: Остаток каждого шарда по порядку
+    """
+    base, extra = divmod(total, shards)
+    return [base + (shard < extra) for shard in range(shards)]
+
+
+@traced
+async def set_stock_sharding(db: AsyncSession, product_id: int, shards: int) -> dict:
+    """
+    Включает, меняет или выключает шардирование остатка товара
+    Текущий остаток равномерно распределяется по шардам (или собирается
+    обратно в products.stock при shards=0).
+    :param db: Асинхронная сессия
+    :param product_id: ID товара
+    :param shards: Число шардов, 0 — выключить
+    :return: Новое состояние остатка
+    """
+    if shards < 0:
+        raise ValueError("Число шардов не может быть отрицательным")
+
+    result = await db.execute(
+        select(Product).where(Product.id == product_id).with_for_update()
+    )
+    product = result.scalar_one_or_none()
+    if product is None:
+        raise ValueError(f"Product with ID {product_id} not found")
+
+    total = product.stock
+    if product.stock_shards:
+        result = await db.execute(
+            select(ProductStockShard.stock)
+            .where(ProductStockShard.product_id == product_id)
+            .order_by(ProductStockShard.shard)
+            .with_for_update()
+        )
+        total = sum(result.scalars())
+        await db.execute(
+            delete(ProductStockShard).where(ProductStockShard.product_id == product_id)
+        )
+
+    if shards:
+        await db.execute(
+            insert(ProductStockShard),
+            [
+                {"product_id": product_id, "shard": shard, "stock": stock}
+                for shard, stock in enumerate(split_stock(total, shards))
+            ],
+        )
+        product.stock = 0
+    else:
+        product.stock = total
+    product.stock_shards = shards
+    await bump_catalog_version(db)
+    await db.commit()
+    await invalidate_catalog()
+    return {"product_id": product_id, "stock_shards": shards, "stock": total}
 
 
+@traced
 async def create_test_user(db: AsyncSession, user: UserReqst):
     test_user = User(
         username=user.username,
@@ -202,16 +1154,14 @@ async def create_test_user(db: AsyncSession, user: UserReqst):
         hashed_password=user.hashed_password,
         disabled=user.disabled,
     )
-    db.add(test_user)
     try:
-        await db.commit()
-        await db.refresh(test_user)
+        await save(db, test_user)
     except IntegrityError:
-        await db.rollback()
         raise ValueError("Ошибка при создании пользователя")
     return test_user
 
 
+@traced
 async def create_product(
     db: AsyncSession,
     name: str,
@@ -237,35 +1187,33 @@ async def create_product(
     if stock < 0:
         raise ValueError("Остаток не может быть отрицательным")
 
-    # Создаем новый продукт
-    new_product = Product(name=name, description=description, price=price, stock=stock)
+    # Категории получаем до добавления продукта в сессию,
+    # иначе чтение категорий сбросит его в БД раньше времени
+    categories = await _attach_categories(db, category_ids) if category_ids else []
+    await bump_category_counts(db, {c.id: 1 for c in categories})
+    await bump_catalog_version(db)
+
+    # Создаем новый продукт и связываем его с категориями
+    new_product = Product(
+        name=name,
+        description=description,
+        price=price,
+        stock=stock,
+        categories=categories,
+    )
 
     try:
-        # Добавляем продукт в сессию
-        db.add(new_product)
-
-        # Получаем категории, если указаны
-        if category_ids:
-            categories = await db.execute(
-                select(Category).filter(Category.id.in_(category_ids))
-            )
-            categories = categories.scalars().all()
-
-            # Связываем категории с продуктом
-            new_product.categories.extend(categories)
-
-        # Фиксируем изменения
-        await db.commit()
-        await db.refresh(new_product)
-
+        await save(db, new_product)
     except IntegrityError as e:
-        await db.rollback()
-        if "UNIQUE constraint failed: products.name" in str(e):
+        # Сообщения SQLite и PostgreSQL о нарушении уникальности названия
+        if "products.name" in str(e) or "ix_products_name" in str(e):
             raise ValueError(f"Продукт с названием '{name}' уже существует")
         raise ValueError(f"Продукт {name} создать не удалось")
+    await invalidate_catalog()
     return new_product
 
 
+@traced
 async def create_category(
     db: AsyncSession, name: str, description: str | None = None
 ) -> Category:
@@ -277,35 +1225,188 @@ async def create_category(
     :return: Созданная категория
     """
     # Проверяем существование категории с таким именем
-    existing_category = await db.execute(select(Category).filter(Category.name == name))
-    if existing_category.scalars().first():
+    # (гонки с устаревшим кешем ловит уникальный индекс ниже)
+    categories = await get_cached_categories(db)
+    if any(c["name"] == name for c in categories.values()):
         raise ValueError(f"Категория '{name}' уже существует")
 
     # Создаем новую категорию
     new_category = Category(name=name, description=description)
+    await bump_catalog_version(db)
 
     try:
-        db.add(new_category)
-        await db.commit()
-        await db.refresh(new_category)
+        await save(db, new_category)
     except IntegrityError:
-        await db.rollback()
         raise ValueError("Ошибка при создании категории")
+    await invalidate_catalog()
 
     return new_category
 
 
-async def get_all_products(db: AsyncSession) -> Sequence[Product]:
+@traced
+async def get_all_products(db: AsyncSession) -> list[dict]:
     """
-    Получает все продукты из базы данных
+    Получает все продукты из базы данных (через кеш каталога)
     :param db: Асинхронная сессия SQLAlchemy
     :return: Список продуктов
     """
-    query = select(Product)
-    result = await db.execute(query)
-    return result.scalars().all()
+
+    async def load() -> list[dict]:
+        result = await db.execute(select(*PRODUCT_COLUMNS).order_by(Product.id))
+        return [dict(row) for row in result.mappings()]
+
+    return await catalog_cache.get_or_load("products:all", load)
+
+
+# Колонки, по которым разрешена keyset-сортировка каталога
+PRODUCT_SORT_COLUMNS = {
+    "id": Product.id,
+    "price": Product.price,
+    "name": Product.name,
+}
+PRODUCT_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    product_stock.label("stock"),
+)
+PRODUCT_STREAM_BATCH_SIZE = 1000
+
+
+# Типы значений ключа сортировки в курсоре (bool — подкласс int, отсекается отдельно)
+PRODUCT_SORT_TYPES = {
+    "id": (int,),
+    "price": (int, float),
+    "name": (str,),
+}
+
+
+def _encode_cursor(sort: str, sort_value: Any, product_id: int) -> str:
+    # Ключ сортировки входит в курсор: с другим sort курсор недействителен
+    raw = json.dumps([sort, sort_value, product_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, sort_value, product_id = json.loads(
+            base64.urlsafe_b64decode(padded)
+        )
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный курсор")
+    if cursor_sort != sort:
+        raise ValueError("Курсор выдан для другой сортировки")
+    if (
+        not isinstance(product_id, int)
+        or isinstance(sort_value, bool)
+        or not isinstance(sort_value, PRODUCT_SORT_TYPES[sort])
+    ):
+        raise ValueError("Некорректный курсор")
+    return sort_value, product_id
+
+
+def _filter_products(
+    query,
+    category_id: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock: bool = False,
+):
+    if category_id is not None:
+        query = query.join(
+            product_category, product_category.c.product_id == Product.id
+        ).where(product_category.c.category_id == category_id)
+    if min_price is not None:
+        query = query.where(Product.price >= min_price)
+    if max_price is not None:
+        query = query.where(Product.price <= max_price)
+    if in_stock:
+        query = query.where(product_stock > 0)
+    return query
+
+
+@traced
+async def get_products_page(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: str | None = None,
+    sort: str = "id",
+    descending: bool = False,
+    category_id: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock: bool = False,
+) -> tuple[list[dict], str | None]:
+    """
+    Получает страницу каталога с keyset-пагинацией
+    :param db: Асинхронная сессия
+    :param limit: Размер страницы
+    :param cursor: Курсор, полученный с предыдущей страницы
+    :param sort: Ключ сортировки (id, price, name)
+    :param descending: Сортировка по убыванию
+    :param category_id: Фильтр по категории
+    :param min_price: Минимальная цена
+    :param max_price: Максимальная цена
+    :param in_stock: Только товары в наличии
+    :return: Список продуктов и курсор следующей страницы (None, если это последняя)
+    """
+    sort_column = PRODUCT_SORT_COLUMNS.get(sort)
+    if sort_column is None:
+        raise ValueError(f"Неизвестный ключ сортировки '{sort}'")
+
+    query = _filter_products(
+        select(*PRODUCT_COLUMNS), category_id, min_price, max_price, in_stock
+    )
+
+    # Сортировка по (ключ, id) даёт стабильный порядок даже при равных значениях
+    key = (sort_column,) if sort_column is Product.id else (sort_column, Product.id)
+    if cursor is not None:
+        sort_value, last_id = _decode_cursor(cursor, sort)
+        bound = (last_id,) if len(key) == 1 else (sort_value, last_id)
+        if descending:
+            query = query.where(tuple_(*key) < tuple_(*bound))
+        else:
+            query = query.where(tuple_(*key) > tuple_(*bound))
+    query = query.order_by(*(c.desc() if descending else c.asc() for c in key))
+
+    # Забираем на одну строку больше, чтобы понять, есть ли следующая страница
+    result = await db.execute(query.limit(limit + 1))
+    rows = [dict(row) for row in result.mappings()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort, last[sort], last["id"])
+    return rows, next_cursor
+
+
+async def stream_products(
+    category_id: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock: bool = False,
+) -> AsyncIterator[dict]:
+    """
+    Построчно выгружает каталог через серверный курсор
+    Открывает собственную сессию: ответ стримится уже после того,
+    как зависимости запроса (get_async_db) завершены.
+    :return: Асинхронный итератор продуктов в порядке id
+    """
+    query = _filter_products(
+        select(*PRODUCT_COLUMNS), category_id, min_price, max_price, in_stock
+    ).order_by(Product.id)
+    async with AsyncSessionLocal(info={"replica": replicas.pick()}) as db:
+        result = await db.stream(
+            query.execution_options(yield_per=PRODUCT_STREAM_BATCH_SIZE)
+        )
+        async for row in result.mappings():
+            yield dict(row)
 
 
+@traced
 async def create_reply_comment_or_comment(db: AsyncSession, CommentDTO: CommentSchema):
     if CommentDTO.parent_id is None:
         new_comment = Comment(
@@ -314,49 +1415,200 @@ async def create_reply_comment_or_comment(db: AsyncSession, CommentDTO: CommentS
             product_id=CommentDTO.product_id,
         )
     else:
+        # Внешний ключ не проверяет, что ответ относится к тому же товару,
+        # а дерево комментариев строится по product_id
+        parent_product_id = await db.scalar(
+            select(Comment.product_id).where(Comment.id == CommentDTO.parent_id)
+        )
+        if parent_product_id != CommentDTO.product_id:
+            raise ValueError("Родительский комментарий у этого товара не найден")
         new_comment = Comment(
             text=CommentDTO.text,
             user_id=CommentDTO.user_id,
             product_id=CommentDTO.product_id,
             parent_id=CommentDTO.parent_id,
         )
-    db.add(new_comment)
     try:
-        await db.commit()
-        await db.refresh(new_comment)
-        return new_comment
+        await save(db, new_comment)
     except IntegrityError:
-        await db.rollback()
-        raise ValueError("Ошибка при создании коментария")
+        raise ValueError("Пользователь или товар не найдены")
+    return new_comment
 
 
+@traced
+async def get_comment_tree(
+    db: AsyncSession,
+    product_id: int,
+    limit: int = 20,
+    after: int | None = None,
+    max_depth: int = 5,
+) -> tuple[list[dict], int | None]:
+    """
+    Получает страницу веток комментариев товара одним рекурсивным запросом
+    :param db: Асинхронная сессия
+    :param product_id: ID товара
+    :param limit: Сколько корневых комментариев вернуть
+    :param after: ID последнего корневого комментария предыдущей страницы
+    :param max_depth: Максимальная глубина ответов (0 — только корневые)
+    :return: Деревья комментариев и курсор следующей страницы
+    """
+    roots = select(Comment.id).where(
+        Comment.product_id == product_id, Comment.parent_id.is_(None)
+    )
+    if after is not None:
+        roots = roots.where(Comment.id > after)
+    roots = roots.order_by(Comment.id)
+    # Есть ли корень за страницей — отдельная проба с LIMIT 1: лишний корень
+    # в рекурсии подтянул бы всё своё поддерево
+    has_more = exists(roots.offset(limit).limit(1)).label("has_more")
+    roots = roots.limit(limit)
+
+    columns = (
+        Comment.id,
+        Comment.text,
+        Comment.created_at,
+        Comment.user_id,
+        Comment.parent_id,
+    )
+    tree = (
+        select(*columns, literal(0).label("depth"))
+        .where(Comment.id.in_(roots.scalar_subquery()))
+        .cte("comment_tree", recursive=True)
+    )
+    reply = aliased(Comment)
+    tree = tree.union_all(
+        select(
+            reply.id,
+            reply.text,
+            reply.created_at,
+            reply.user_id,
+            reply.parent_id,
+            tree.c.depth + 1,
+        )
+        .join(tree, reply.parent_id == tree.c.id)
+        .where(tree.c.depth < max_depth)
+    )
+    result = await db.execute(select(tree, has_more).order_by(tree.c.depth, tree.c.id))
+
+    # Строки идут по уровням, поэтому родитель всегда собран раньше ответов
+    nodes: dict[int, dict] = {}
+    top_level: list[dict] = []
+    more = False
+    for row in result.mappings():
+        node = {**row, "replies": []}
+        more = node.pop("has_more")
+        nodes[node["id"]] = node
+        if node["depth"] == 0:
+            top_level.append(node)
+        else:
+            nodes[node["parent_id"]]["replies"].append(node)
+
+    next_cursor = top_level[-1]["id"] if more else None
+    return top_level, next_cursor
+
+
+@traced
 async def add_categories_to_product(
     db: AsyncSession, product_id: int, category_ids: list[int]
-) -> Product:
-    # Получаем продукт с предзагруженными категориями
-    product = await db.get(
-        Product, product_id, options=[selectinload(Product.categories)]
-    )
-    if not product:
+) -> dict:
+    """
+    Добавляет продукту категории
+    Связи вставляются одним INSERT ... ON CONFLICT DO NOTHING без загрузки
+    коллекции Product.categories; несуществующие категории пропускаются.
+    :param db: Асинхронная сессия
+    :param product_id: ID продукта
+    :param category_ids: ID добавляемых категорий
+    :return: Карточка продукта с категориями
+    """
+    product = await _load_product(db, product_id)
+    if product is None:
         raise ValueError(f"Product with ID {product_id} not found")
 
-    # Получаем запрашиваемые категории
-    stmt = select(Category).where(Category.id.in_(category_ids))
-    result = await db.execute(stmt)
-    categories = result.scalars().all()
-
-    # Фильтруем новые категории
-    existing_category_ids = {c.id for c in product.categories}
-    new_categories = [c for c in categories if c.id not in existing_category_ids]
-
-    # Добавляем связи
-    if new_categories:
-        product.categories.extend(new_categories)
+    # Существование категорий проверяется в той же транзакции, что и вставка
+    existing = set(
+        (
+            await db.execute(
+                select(Category.id).where(Category.id.in_(dict.fromkeys(category_ids)))
+            )
+        ).scalars()
+    )
+    links = [
+        {"product_id": product_id, "category_id": category_id}
+        for category_id in dict.fromkeys(category_ids)
+        if category_id in existing
+    ]
+    if links:
         try:
+            # RETURNING отдаёт только новые связи, уже существующие не считаются
+            result = await db.execute(
+                dialect_insert(db, product_category)
+                .values(links)
+                .on_conflict_do_nothing()
+                .returning(product_category.c.category_id)
+            )
+            added = list(result.scalars())
+            if added:
+                await bump_category_counts(db, dict.fromkeys(added, 1))
+                await bump_catalog_version(db)
             await db.commit()
-            await db.refresh(product, ["categories"])
-        except Exception as e:
+        except DBAPIError as e:
             await db.rollback()
-            raise RuntimeError(f"Error adding categories: {str(e)}")
+            raise RuntimeError(f"Error adding categories: {e.orig}")
+        if added:
+            await invalidate_catalog()
+
+    return await get_product_detail(db, product_id, product)
+
+
+def pool_status() -> dict:
+    """Текущее состояние пула соединений и накопленные метрики"""
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, InstrumentedPool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=MAX_OVERFLOW,
+        )
+    if replicas.engines:
+        status["replicas"] = replicas.status()
+    return {**status, **pool_metrics.snapshot()}
+
+
+async def ping() -> None:
+    """Проверка доступности БД (readiness)"""
+    async with engine.connect() as conn:
+        await conn.execute(select(1))
 
-    return product
+
+async def prewarm_pool(connections: int) -> int:
+    """
+    Открывает соединения заранее, чтобы первые запросы не ждали подключения
+    :param connections: Сколько соединений открыть (не больше размера пула)
+    :return: Сколько соединений открыто
+    """
+    if isinstance(engine.pool, InstrumentedPool):
+        connections = min(connections, engine.pool.size())
+    else:
+        connections = min(connections, 1)
+    if connections <= 0:
+        return 0
+    async with contextlib.AsyncExitStack() as stack:
+        # Соединения удерживаются одновременно, иначе пул выдал бы одно и то же
+        opened = await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(connections))
+        )
+        await asyncio.gather(*(conn.execute(select(1)) for conn in opened))
+    return connections
+
+
+async def warm_up_queries(db: AsyncSession) -> None:
+    """
+    Выполняет частые запросы по одному разу: SQLAlchemy кеширует
+    скомпилированные выражения, а кеш каталога заполняется до первого клиента
+    """
+    await get_cached_categories(db)
+    await get_products_page(db)
+    await get_user_by_username(db, "")
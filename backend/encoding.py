@@ -0,0 +1,236 @@
+"""
+Согласование представления ответа: формат (Accept) и сжатие (Accept-Encoding)
+
+EncodingMiddleware выбирает представление один раз на запрос и кладёт его
+в contextvar: по нему APIResponse кодирует тело в JSON (orjson) или
+msgpack, а http_cache добавляет представление в ETag. Тела от
+RESPONSE_COMPRESSION_MIN_SIZE байт сжимаются brotli или gzip.
+"""
+
+import asyncio
+import zlib
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+import brotli
+import msgpack
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+JSON = "json"
+MSGPACK = "msgpack"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+IDENTITY = "identity"
+# В порядке предпочтения сервера при равных q
+ENCODINGS = ("br", "gzip")
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/msgpack",
+    "application/x-ndjson",
+    "text/",
+)
+# Тела крупнее сжимаются в потоке, чтобы не держать event loop
+THREAD_COMPRESSION_BYTES = 256 * 1024
+
+
+@dataclass(frozen=True)
+class Representation:
+    """Выбранное представление ответа"""
+
+    format: str = JSON
+    encoding: str = IDENTITY
+
+    @property
+    def tag(self) -> str:
+        """Суффикс ETag: у каждого представления свой ETag"""
+        parts = [p for p in (self.format, self.encoding) if p not in (JSON, IDENTITY)]
+        return "".join(f"-{p}" for p in parts)
+
+
+representation: ContextVar[Representation] = ContextVar(
+    "representation", default=Representation()
+)
+
+
+def _parse_qvalues(header: str) -> dict[str, float]:
+    values = {}
+    for item in header.split(","):
+        name, *params = item.strip().split(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        values[name.strip().lower()] = q
+    return values
+
+
+def negotiate_format(accept: str | None) -> str:
+    """
+    msgpack — только если клиент явно предпочитает его JSON
+    :param accept: Заголовок Accept
+    """
+    if not accept:
+        return JSON
+    values = _parse_qvalues(accept)
+    msgpack_q = max(values.get(t, 0.0) for t in MSGPACK_MEDIA_TYPES)
+    json_q = values.get("application/json", 0.0)
+    return MSGPACK if msgpack_q > 0 and msgpack_q >= json_q else JSON
+
+
+def negotiate_encoding(accept_encoding: str | None, available=ENCODINGS) -> str:
+    """
+    Кодирование с наибольшим q из поддерживаемых, иначе identity
+    :param accept_encoding: Заголовок Accept-Encoding
+    :param available: Поддерживаемые кодирования в порядке предпочтения
+    """
+    if not accept_encoding:
+        return IDENTITY
+    values = _parse_qvalues(accept_encoding)
+    wildcard = values.get("*", 0.0)
+    best, best_q = IDENTITY, 0.0
+    for encoding in available:
+        q = values.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class APIResponse(ORJSONResponse):
+    """
+    Ответ по умолчанию: orjson, а при Accept: application/msgpack — msgpack
+    Формат берётся из представления, выбранного EncodingMiddleware.
+    """
+
+    def render(self, content) -> bytes:
+        # media_type читается в init_headers уже после render
+        if representation.get().format == MSGPACK:
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+            return msgpack.packb(content)
+        return super().render(content)
+
+    def init_headers(self, headers=None) -> None:
+        super().init_headers(headers)
+        MutableHeaders(raw=self.raw_headers).add_vary_header("Accept")
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=brotli_quality)
+            self.compress, self.finish = compressor.process, compressor.finish
+        else:
+            # wbits=31 — формат gzip (заголовок и CRC)
+            compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self.compress, self.finish = compressor.compress, compressor.flush
+
+
+class EncodingMiddleware:
+    """
+    ASGI-middleware: выбирает представление ответа и сжимает тело
+    :param compression: Сжимать ответы (иначе только выбор формата)
+    :param minimum_size: Тела меньше не сжимаются
+    :param gzip_level: Уровень gzip (1–9)
+    :param brotli_quality: Качество brotli (0–11)
+    """
+
+    def __init__(
+        self,
+        app,
+        compression: bool = True,
+        minimum_size: int = 1024,
+        gzip_level: int = 5,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.compression = compression
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = IDENTITY
+        if self.compression:
+            encoding = negotiate_encoding(headers.get("accept-encoding"))
+        token = representation.set(
+            Representation(negotiate_format(headers.get("accept")), encoding)
+        )
+        try:
+            if self.compression:
+                # Vary нужен и несжатым ответам: иначе прокси отдаст их всем
+                send = self._compressing_send(send, encoding)
+            await self.app(scope, receive, send)
+        finally:
+            representation.reset(token)
+
+    def _compressing_send(self, send, encoding: str):
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                # Заголовки отправляются вместе с первым куском тела:
+                # до него неизвестно, сжимать ли ответ
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(scope=start)
+                content_type = headers.get("content-type", "")
+                headers.add_vary_header("Accept-Encoding")
+                if (
+                    encoding == IDENTITY
+                    or "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                if more_body:
+                    # Потоковый ответ: длина заранее неизвестна
+                    del headers["Content-Length"]
+                else:
+                    body = await self._compress_all(compressor, body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.finish()
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": more_body}
+            )
+
+        return send_compressed
+
+    @staticmethod
+    async def _compress_all(compressor: _Compressor, body: bytes) -> bytes:
+        def compress() -> bytes:
+            return compressor.compress(body) + compressor.finish()
+
+        if len(body) >= THREAD_COMPRESSION_BYTES:
+            return await asyncio.to_thread(compress)
+        return compress()
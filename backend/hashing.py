@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# bcrypt-хеш строки "warmup" с той же стоимостью (12), что у новых паролей
+WARMUP_HASH = "$2b$12$pwusRdTLh50rmD/7Vf68lu76ecal1cVPqcj24wD5S9i1ct689dhs."
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь хеширования переполнена, запрос нужно отклонить"""
+
+
+class PasswordHasher:
+    """
+    Выполняет bcrypt в ограниченном пуле потоков, не блокируя event loop
+    bcrypt отпускает GIL, поэтому потоки дают реальный параллелизм.
+    :param workers: Размер пула потоков
+    :param queue_limit: Сколько задач может ждать свободный поток;
+        сверх этого новые задачи отклоняются с PasswordHasherBusy
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+
+    async def _run(self, func, *args):
+        if self.pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise PasswordHasherBusy("Сервис перегружен, повторите попытку позже")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def warmup(self) -> None:
+        """
+        Загружает backend bcrypt и запускает все потоки пула до первого входа:
+        passlib выбирает backend при первом хеше, потоки создаются по требованию
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self._executor, self.context.verify, "warmup", WARMUP_HASH
+                )
+                for _ in range(self.workers)
+            )
+        )
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
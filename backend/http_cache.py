@@ -0,0 +1,87 @@
+"""
+HTTP-кеширование ответов каталога: ETag, Last-Modified и условные запросы
+
+Валидаторы строятся из версии каталога (db.CatalogVersion) без обращения
+к товарам: ответ 304 отдаётся до запросов каталога к БД. Воркер, увидевший
+новую версию, сбрасывает свой кеш каталога, поэтому тело не старее ETag.
+
+Покупки версию не меняют, поэтому в ETag входит ещё и «эпоха остатков»
+длиной CATALOG_STOCK_STALENESS_SECONDS. Страницы /products и
+/categories/{id}/products читаются из БД, и по ответу 304 клиент хранит
+остаток не дольше одной эпохи. /products/all, /categories и поиск без
+PostgreSQL берутся из кеша каталога с TTL не больше эпохи: запись, взятая в
+конце эпохи, отдаётся и в следующей, так что отставание — до двух эпох
+(плюс отставание реплики). ETag сильный, поэтому различается для каждого
+представления (формат и сжатие, см. encoding.py).
+"""
+
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from config import settings
+from db import get_catalog_version
+from encoding import representation
+
+CATALOG_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+class NotModified(Exception):
+    """Ответ не изменился: обработчик в main.py отдаёт 304 с этими заголовками"""
+
+    def __init__(self, headers: dict[str, str]):
+        self.headers = headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Слабое сравнение (RFC 9110, 13.1.2): префикс W/ не учитывается
+    if header.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in header.split(",")
+    )
+
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # В заголовке точность до секунды
+    return last_modified.replace(microsecond=0) <= since
+
+
+async def catalog_validators(request: Request, response: Response) -> None:
+    """
+    Зависимость маршрутов каталога: выставляет ETag, Last-Modified и
+    Cache-Control, на совпавший условный запрос отвечает 304
+    If-None-Match важнее If-Modified-Since (RFC 9110, 13.2.2).
+    """
+    version, updated_at = await get_catalog_version()
+    period = settings.CATALOG_STOCK_STALENESS_SECONDS
+    epoch = int(time.time() // period)
+    epoch_started = datetime.fromtimestamp(epoch * period, timezone.utc)
+    last_modified = max(updated_at, epoch_started) if updated_at else epoch_started
+
+    headers = {
+        "ETag": f'"c{version}-s{epoch}{representation.get().tag}"',
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+        # Микрокеш nginx (proxy_cache): клиентам по-прежнему max-age=0
+        "X-Accel-Expires": str(settings.CATALOG_PROXY_CACHE_SECONDS),
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, headers["ETag"])
+    elif (since := request.headers.get("if-modified-since")) is not None:
+        not_modified = _not_modified_since(since, last_modified)
+    else:
+        not_modified = False
+    if not_modified:
+        # Vary у 200 добавляет APIResponse, у 304 его нужно указать явно
+        raise NotModified({**headers, "Vary": "Accept"})
+    response.headers.update(headers)
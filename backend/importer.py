@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from typing import Callable, Iterable, Iterator, TextIO
+
+from pydantic import ValidationError
+from sqlalchemy import case, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import (
+    AsyncSessionLocal,
+    Category,
+    Product,
+    ProductStockShard,
+    bump_catalog_version,
+    bump_category_counts,
+    dialect_insert,
+    invalidate_catalog,
+    product_category,
+    split_stock,
+)
+from instrumentation import traced
+from models import ProductCreateSchema
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+# Ошибки хранятся в отчёте до этого предела, дальше только считаются
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class ImportReport:
+    processed: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def add_error(self, line: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+
+def read_csv(stream: TextIO) -> Iterator[tuple[int, dict]]:
+    """
+    Читает CSV с заголовком name,description,price,stock[,categories][,category_ids]
+    Несколько категорий разделяются символом «|».
+    :return: Пары (номер строки, сырые поля)
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(stream: TextIO) -> Iterator[tuple[int, dict | str]]:
+    """
+    Читает NDJSON: один объект продукта на строку
+    Нераспознанная строка возвращается как текст ошибки.
+    :return: Пары (номер строки, объект или текст ошибки)
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Некорректный JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, "Ожидается JSON-объект"
+            continue
+        yield line_number, row
+
+
+def _split(value, field: str) -> list:
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split("|") if v.strip()]
+    if not isinstance(value, list):
+        raise ValueError(f"{field}: ожидается строка или список")
+    return value
+
+
+def _category_ids(value) -> list[int]:
+    ids = []
+    for item in _split(value, "category_ids"):
+        # bool — подкласс int, но ID категории из него не получится
+        if isinstance(item, bool) or not isinstance(item, (int, str)):
+            raise ValueError(f"category_ids: некорректный ID {item!r}")
+        try:
+            ids.append(int(item))
+        except ValueError:
+            raise ValueError(f"category_ids: некорректный ID {item!r}") from None
+    return ids
+
+
+def _validate(row: dict, category_ids_by_name: dict[str, int]) -> ProductCreateSchema:
+    category_ids = _category_ids(row.get("category_ids"))
+    # Неизвестный ID отклоняет только эту строку, а не всю пачку по FK
+    known_ids = set(category_ids_by_name.values())
+    for category_id in category_ids:
+        if category_id not in known_ids:
+            raise ValueError(f"Категория с ID {category_id} не найдена")
+    for name in _split(row.get("categories"), "categories"):
+        if not isinstance(name, str) or name not in category_ids_by_name:
+            raise ValueError(f"Категория '{name}' не найдена")
+        category_ids.append(category_ids_by_name[name])
+
+    product = ProductCreateSchema(
+        name=row.get("name"),
+        description=row.get("description") or "",
+        price=row.get("price"),
+        stock=row.get("stock") or 0,
+        category_ids=category_ids,
+    )
+    if product.price <= 0:
+        raise ValueError("Цена должна быть положительным числом")
+    if product.stock < 0:
+        raise ValueError("Остаток не может быть отрицательным")
+    return product
+
+
+async def _write_chunk(db: AsyncSession, products: dict[str, ProductCreateSchema]):
+    stmt = dialect_insert(db, Product).values(
+        [
+            {
+                "name": p.name,
+                "description": p.description,
+                "price": p.price,
+                "stock": p.stock,
+            }
+            for p in products.values()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.name],
+        set_={
+            "description": stmt.excluded.description,
+            "price": stmt.excluded.price,
+            # У шардированного товара products.stock не используется:
+            # остаток раскладывается по шардам ниже
+            "stock": case((Product.stock_shards > 0, 0), else_=stmt.excluded.stock),
+        },
+    ).returning(Product.id, Product.name, Product.stock_shards)
+    ids = {}
+    shard_rows = []
+    for product_id, name, shards in await db.execute(stmt):
+        ids[name] = product_id
+        if shards:
+            shard_rows.extend(
+                {"product_id": product_id, "shard": shard, "stock": stock}
+                for shard, stock in enumerate(split_stock(products[name].stock, shards))
+            )
+    if shard_rows:
+        # Обновление на месте, а не пересоздание: параллельные списания
+        # по шардам не теряют строки, которые ждут
+        await db.execute(update(ProductStockShard), shard_rows)
+
+    links = [
+        {"product_id": ids[name], "category_id": category_id}
+        for name, p in products.items()
+        for category_id in dict.fromkeys(p.category_ids or ())
+    ]
+    if links:
+        # RETURNING отдаёт только реально вставленные связи: их и добавляем к счётчикам
+        result = await db.execute(
+            dialect_insert(db, product_category)
+            .values(links)
+            .on_conflict_do_nothing()
+            .returning(product_category.c.category_id)
+        )
+        await bump_category_counts(db, Counter(result.scalars()))
+    await bump_catalog_version(db)
+    await db.commit()
+
+
+def _next_chunk(rows: Iterator, size: int) -> list:
+    return list(islice(rows, size))
+
+
+@traced
+async def import_products(
+    db: AsyncSession,
+    rows: Iterable[tuple[int, dict | str]],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    on_progress: Callable[[ImportReport], None] | None = None,
+) -> ImportReport:
+    """
+    Загружает продукты пачками: INSERT ... ON CONFLICT (name) DO UPDATE на пачку
+    В памяти одновременно находится только одна пачка строк, поэтому
+    потребление памяти не зависит от размера файла. Строки читаются
+    и разбираются в потоке, а не в event loop. Остаток шардированного
+    товара раскладывается по его шардам (как в set_stock_sharding).
+    :param db: Асинхронная сессия
+    :param rows: Пары (номер строки, поля или текст ошибки разбора)
+    :param chunk_size: Размер пачки
+    :param on_progress: Вызывается после каждой пачки
+    :return: Отчёт об импорте
+    """
+    report = ImportReport()
+    # Категории из БД, а не из кеша: кеш воркера может не знать о новых
+    result = await db.execute(select(Category.name, Category.id))
+    category_ids_by_name = {name: category_id for name, category_id in result}
+    await db.commit()
+
+    rows = iter(rows)
+    try:
+        # Чтение и разбор пачки — в потоке: файл загрузки может лежать на
+        # диске, и большой импорт не должен блокировать event loop
+        while chunk := await asyncio.to_thread(_next_chunk, rows, chunk_size):
+            # Повтор имени внутри пачки: побеждает последняя строка
+            products: dict[str, ProductCreateSchema] = {}
+            lines: dict[str, list[int]] = {}
+            for line, row in chunk:
+                report.processed += 1
+                if isinstance(row, str):
+                    report.add_error(line, row)
+                    continue
+                try:
+                    product = _validate(row, category_ids_by_name)
+                except ValidationError as e:
+                    report.add_error(
+                        line,
+                        "; ".join(
+                            f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                            for err in e.errors()
+                        ),
+                    )
+                    continue
+                except (TypeError, ValueError) as e:
+                    # TypeError — поле неожиданного типа в NDJSON
+                    report.add_error(line, str(e))
+                    continue
+                products[product.name] = product
+                lines.setdefault(product.name, []).append(line)
+
+            if products:
+                try:
+                    await _write_chunk(db, products)
+                    report.imported += sum(map(len, lines.values()))
+                except DBAPIError:
+                    await db.rollback()
+                    # Пачка не записалась: повторяем по одной строке, чтобы
+                    # ошибка досталась только виновным строкам
+                    for name, product in products.items():
+                        try:
+                            await _write_chunk(db, {name: product})
+                            report.imported += len(lines[name])
+                        except DBAPIError as e:
+                            await db.rollback()
+                            for line in lines[name]:
+                                report.add_error(line, f"Ошибка записи: {e.orig}")
+
+            logger.info(
+                "Импорт: обработано %d, загружено %d, ошибок %d",
+                report.processed,
+                report.imported,
+                report.failed,
+            )
+            if on_progress is not None:
+                on_progress(report)
+    finally:
+        await invalidate_catalog()
+    return report
+
+
+def open_rows(stream: TextIO, fmt: str) -> Iterator[tuple[int, dict | str]]:
+    if fmt == "csv":
+        return read_csv(stream)
+    if fmt == "ndjson":
+        return read_ndjson(stream)
+    raise ValueError(f"Неизвестный формат '{fmt}'")
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str:
+    if (filename or "").endswith((".ndjson", ".jsonl")) or content_type in (
+        "application/x-ndjson",
+        "application/jsonl",
+    ):
+        return "ndjson"
+    return "csv"
+
+
+async def _import_file(path: str, fmt: str | None, chunk_size: int) -> ImportReport:
+    def progress(report: ImportReport) -> None:
+        print(
+            f"обработано {report.processed}, загружено {report.imported}, "
+            f"ошибок {report.failed}",
+            file=sys.stderr,
+        )
+
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        rows = open_rows(stream, fmt or detect_format(path, None))
+        async with AsyncSessionLocal() as db:
+            return await import_products(db, rows, chunk_size, progress)
+
+
+def main() -> None:
+    """Импорт каталога из файла: python importer.py products.csv"""
+    parser = argparse.ArgumentParser(description="Пакетный импорт продуктов")
+    parser.add_argument("path", help="CSV или NDJSON файл")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    report = asyncio.run(_import_file(args.path, args.format, args.chunk_size))
+    json.dump(asdict(report), sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    if report.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
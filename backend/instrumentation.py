@@ -0,0 +1,299 @@
+import asyncio
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from metrics import (
+    COUNT_BUCKETS,
+    LAG_BUCKETS,
+    Histogram,
+    LabeledHistogram,
+    PoolMetrics,
+    PrometheusWriter,
+)
+
+slow_query_logger = logging.getLogger("db.slow")
+
+# Метка маршрута для запросов, не попавших ни в один маршрут (404):
+# сырой путь в метке раздул бы число рядов
+UNMATCHED_ROUTE = "<unmatched>"
+# Метка запросов вне функций с @traced (миграции, выгрузка каталога)
+UNTRACED_FUNCTION = "<other>"
+MAX_LOGGED_PARAMS = 1000
+
+
+@dataclass
+class RequestStats:
+    """Время и число запросов к БД в рамках одного HTTP-запроса"""
+
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+# Функция db.py (или другого модуля доступа к данным), выполняющая запрос
+current_function: ContextVar[str] = ContextVar(
+    "current_function", default=UNTRACED_FUNCTION
+)
+
+
+class Telemetry:
+    """Накопленные метрики процесса"""
+
+    def __init__(self):
+        self.http_duration = LabeledHistogram(("method", "route", "status"))
+        self.http_db_queries = LabeledHistogram(("method", "route"), COUNT_BUCKETS)
+        self.http_db_seconds = LabeledHistogram(("method", "route"))
+        self.db_query_seconds = LabeledHistogram(("function",))
+        self.db_function_seconds = LabeledHistogram(("function",))
+        self.event_loop_lag = Histogram(LAG_BUCKETS)
+        self.in_progress = 0
+        self.slow_queries = 0
+        self.startup_seconds: dict[str, float] = {}
+
+    def observe_request(
+        self, method: str, route: str, status: int, elapsed: float, stats: RequestStats
+    ) -> None:
+        self.http_duration.observe((method, route, str(status)), elapsed)
+        self.http_db_queries.observe((method, route), stats.queries)
+        self.http_db_seconds.observe((method, route), stats.db_seconds)
+
+
+telemetry = Telemetry()
+
+
+class StartupTimer:
+    """Длительность этапов старта приложения"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        return ", ".join(
+            f"{name} {seconds:.3f} с" for name, seconds in self.phases.items()
+        )
+
+
+def traced(func):
+    """
+    Декоратор для функций доступа к данным: время выполнения функции
+    и её SQL-запросы попадают в метрики с меткой function="модуль.функция"
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_function.set(name)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            telemetry.db_function_seconds.observe(
+                (name,), time.perf_counter() - started
+            )
+            current_function.reset(token)
+
+    return wrapper
+
+
+def instrument_engine(
+    engine: Engine, slow_query_seconds: float, log_parameters: bool
+) -> None:
+    """
+    Подключает к движку счётчики запросов и журнал медленных запросов
+    :param engine: Синхронный движок (AsyncEngine.sync_engine)
+    :param slow_query_seconds: Порог медленного запроса, 0 — не журналировать
+    :param log_parameters: Записывать ли параметры медленных запросов
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        function = current_function.get()
+        telemetry.db_query_seconds.observe((function,), elapsed)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        if slow_query_seconds and elapsed >= slow_query_seconds:
+            telemetry.slow_queries += 1
+            slow_query_logger.warning(
+                "Медленный запрос %.3f с (%s): %s; параметры: %s",
+                elapsed,
+                function,
+                statement,
+                repr(parameters)[:MAX_LOGGED_PARAMS] if log_parameters else "скрыты",
+            )
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: латентность по маршрутам, время и число запросов к БД
+    на HTTP-запрос и, по желанию, заголовок Server-Timing
+    :param server_timing: Добавлять заголовок Server-Timing в ответ
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    db_ms = stats.db_seconds * 1000
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing",
+                        f'db;dur={db_ms:.1f};desc="{stats.queries} queries", '
+                        f"total;dur={total_ms:.1f}",
+                    )
+            await send(message)
+
+        telemetry.in_progress += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            telemetry.in_progress -= 1
+            request_stats.reset(token)
+            # Шаблон пути появляется в scope после сопоставления маршрута
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            telemetry.observe_request(
+                scope["method"], route, status, time.perf_counter() - started, stats
+            )
+
+
+async def monitor_event_loop(interval: float) -> None:
+    """
+    Измеряет задержку event loop: насколько позже запланированного
+    просыпается sleep(interval). Работает, пока задачу не отменят.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        telemetry.event_loop_lag.observe(max(loop.time() - started - interval, 0.0))
+
+
+def render_prometheus(pool_metrics: PoolMetrics, pool: dict) -> str:
+    """
+    Все метрики процесса в текстовом формате Prometheus
+    :param pool_metrics: Счётчики пула соединений
+    :param pool: Текущее состояние пула (db.pool_status())
+    """
+    writer = PrometheusWriter()
+    writer.histogram(
+        "http_request_duration_seconds",
+        "Время обработки HTTP-запроса по маршрутам",
+        telemetry.http_duration,
+    )
+    writer.gauge(
+        "http_requests_in_progress",
+        "HTTP-запросы в обработке",
+        telemetry.in_progress,
+    )
+    writer.histogram(
+        "http_request_db_queries",
+        "Число SQL-запросов на один HTTP-запрос",
+        telemetry.http_db_queries,
+    )
+    writer.histogram(
+        "http_request_db_seconds",
+        "Суммарное время SQL-запросов на один HTTP-запрос",
+        telemetry.http_db_seconds,
+    )
+    writer.histogram(
+        "db_query_duration_seconds",
+        "Время SQL-запросов по функциям доступа к данным",
+        telemetry.db_query_seconds,
+    )
+    writer.histogram(
+        "db_function_duration_seconds",
+        "Время выполнения функций доступа к данным",
+        telemetry.db_function_seconds,
+    )
+    writer.counter(
+        "db_slow_queries_total",
+        "SQL-запросы дольше SLOW_QUERY_SECONDS",
+        telemetry.slow_queries,
+    )
+    writer.histogram(
+        "event_loop_lag_seconds",
+        "Задержка пробуждения event loop",
+        telemetry.event_loop_lag,
+    )
+    writer.gauges(
+        "app_startup_seconds",
+        "Длительность этапов старта приложения",
+        "phase",
+        telemetry.startup_seconds,
+    )
+    writer.counter(
+        "db_pool_checkouts_total",
+        "Выдачи соединений из пула",
+        pool_metrics.checkouts,
+    )
+    writer.counter(
+        "db_pool_overflow_checkouts_total",
+        "Выдачи соединений сверх pool_size",
+        pool_metrics.overflow_checkouts,
+    )
+    writer.counter(
+        "db_pool_timeouts_total",
+        "Таймауты ожидания соединения",
+        pool_metrics.timeouts,
+    )
+    writer.histogram(
+        "db_pool_wait_seconds",
+        "Ожидание свободного соединения",
+        pool_metrics.wait_seconds,
+    )
+    writer.histogram(
+        "db_pool_connect_seconds",
+        "Открытие нового соединения с БД",
+        pool_metrics.connect_seconds,
+    )
+    for key in ("size", "checked_out", "overflow"):
+        if key in pool:
+            writer.gauge(f"db_pool_{key}", f"Пул соединений: {key}", pool[key])
+    return writer.render()
@@ -1,32 +1,113 @@
+import asyncio
+import io
+import json
+import logging
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from fastapi import FastAPI, Depends, HTTPException, status
+from typing import Annotated, Literal
+from fastapi import (
+    FastAPI,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
 from models import (
     AddToCart,
+    CartBatch,
+    CartBatchResult,
     CategoryCreate,
+    CategoryOut,
+    CategoryProductsParams,
     CategoryUpdateRequest,
+    CheckoutRequest,
+    CheckoutResult,
+    CommentOut,
     CommentSchema,
+    CommentTreePage,
+    CommentTreeParams,
     ProductCreateSchema,
+    ProductDetail,
+    ProductFilterParams,
+    ProductOut,
+    ProductPage,
+    ProductPageParams,
+    ProductSearchPage,
+    StockShardingRequest,
+    UserPublic,
     UserReqst,
 )
 from db import (
+    AsyncSessionLocal,
     add_categories_to_product,
     add_to_cart,
+    apply_cart_batch,
+    catalog_cache,
+    checkout,
     create_category,
     create_product,
     create_reply_comment_or_comment,
-    create_tables,
     create_test_user,
     get_all_products,
     get_async_db,
+    get_read_db,
+    get_cached_categories,
+    get_cached_product,
+    get_comment_tree,
+    get_principal,
+    get_user_profile,
+    get_products_page,
     get_user_by_username,
+    pool_metrics,
+    ping,
+    pool_status,
+    prewarm_pool,
+    replicas,
+    run_replica_health_checks,
+    set_stock_sharding,
+    stream_products,
+    warm_up_queries,
 )
 
+from analytics import (
+    get_bestsellers,
+    get_category_revenue,
+    get_purchase_history,
+    get_sales_series,
+    refresh_rollups,
+    run_rollup_refresher,
+)
 from config import settings
+from encoding import APIResponse, EncodingMiddleware
+from hashing import PasswordHasher, PasswordHasherBusy
+from http_cache import NotModified, catalog_validators
+from search import search_products
+from importer import IMPORT_CHUNK_SIZE, detect_format, import_products, open_rows
+from instrumentation import (
+    MetricsMiddleware,
+    StartupTimer,
+    monitor_event_loop,
+    render_prometheus,
+    telemetry,
+)
+from migrations import run_migrations
+
+logger = logging.getLogger(__name__)
+
+READINESS_DB_TIMEOUT = 2.0
 
 # Конфигурация JWT
 SECRET_KEY = settings.SECRET_KEY
@@ -37,16 +118,19 @@ REFRESH_TOKEN_EXPIRE_DAYS = settings.REFRESH_TOKEN_EXPIRE_DAYS
 # User=Model(username="testuser",full_name="Test User",email="test@example.com",hashed_password="$2b$12$SErMU3rgP5PQ0Ji2m83osOaXi5QUQAlMKp0T86rxC0VA5zwY7ITay",disabled=False)
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 async def get_password_hash(password):
-    return pwd_context.hash(password)
+    return await password_hasher.hash(password)
 
 
 async def create_access_token(
@@ -60,6 +144,14 @@ async def create_access_token(
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def access_token_claims(user_id: int, username: str, disabled: bool) -> dict:
+    # В режиме JWT_EMBED_PRINCIPAL токен сам несёт всё нужное для авторизации
+    claims: dict = {"sub": username}
+    if settings.JWT_EMBED_PRINCIPAL:
+        claims.update({"uid": user_id, "disabled": disabled})
+    return claims
+
+
 async def create_refresh_token(username: str):
     expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     return jwt.encode({"sub": username, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
@@ -88,7 +180,12 @@ async def authenticate_user(username: str, password: str, db: AsyncSession):
     return user
 
 
-async def get_current_user(db: AsyncSession, token: str):
+async def get_current_principal(db: AsyncSession, token: str) -> dict:
+    """
+    Авторизует запрос по токену
+    Claims из токена (JWT_EMBED_PRINCIPAL) не требуют обращения к БД,
+    иначе пользователь берётся из кеша principal_cache.
+    """
     payload = await decode_token(token)
 
     if (
@@ -100,15 +197,129 @@ async def get_current_user(db: AsyncSession, token: str):
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
         )
 
-    user = await get_user(db, username)
+    if settings.JWT_EMBED_PRINCIPAL and "uid" in payload:
+        principal = {
+            "id": payload["uid"],
+            "username": username,
+            "disabled": payload.get("disabled", False),
+        }
+    else:
+        principal = await get_principal(db, username)
+        if not principal:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
+            )
+    if principal["disabled"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="User disabled"
+        )
+    return principal
+
+
+async def get_current_user(db: AsyncSession, token: str):
+    principal = await get_current_principal(db, token)
+    if "email" in principal:
+        return principal
+
+    # Профиль не входит в claims токена, берём его из кеша
+    user = await get_principal(db, principal["username"])
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
         )
+    if user["disabled"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="User disabled"
+        )
     return user
 
 
-app = FastAPI()
+async def warm_up(timer: StartupTimer) -> None:
+    """Прогрев до приёма запросов: соединения, bcrypt, частые запросы"""
+    with timer.phase("pool"):
+        await prewarm_pool(settings.STARTUP_POOL_PREWARM)
+    if not settings.STARTUP_WARMUP:
+        return
+    with timer.phase("password_hasher"):
+        await password_hasher.warmup()
+    with timer.phase("queries"):
+        async with AsyncSessionLocal() as db:
+            await warm_up_queries(db)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timer = StartupTimer()
+    if settings.DB_MIGRATE_ON_STARTUP:
+        with timer.phase("migrations"):
+            await run_migrations()
+    await warm_up(timer)
+    telemetry.startup_seconds = {**timer.phases, "total": timer.total}
+    budget = settings.STARTUP_BUDGET_SECONDS
+    if budget and timer.total > budget:
+        logger.warning(
+            "Старт занял %.3f с при бюджете %.1f с: %s",
+            timer.total,
+            budget,
+            timer.report(),
+        )
+    else:
+        logger.info("Старт за %.3f с: %s", timer.total, timer.report())
+    app.state.ready = True
+    background = []
+    if settings.ANALYTICS_REFRESH_INTERVAL > 0:
+        background.append(
+            asyncio.create_task(
+                run_rollup_refresher(settings.ANALYTICS_REFRESH_INTERVAL)
+            )
+        )
+    if replicas.engines:
+        background.append(
+            asyncio.create_task(
+                run_replica_health_checks(settings.REPLICA_HEALTH_INTERVAL)
+            )
+        )
+    if settings.EVENT_LOOP_MONITOR_INTERVAL > 0:
+        background.append(
+            asyncio.create_task(
+                monitor_event_loop(settings.EVENT_LOOP_MONITOR_INTERVAL)
+            )
+        )
+    yield
+    app.state.ready = False
+    for task in background:
+        task.cancel()
+    password_hasher.shutdown()
+
+
+# Ответы сериализуются orjson (или msgpack по Accept); схемы response_model
+# задают набор полей
+app = FastAPI(lifespan=lifespan, default_response_class=APIResponse)
+# Сжатие внутри MetricsMiddleware: его время входит в латентность маршрута
+app.add_middleware(
+    EncodingMiddleware,
+    compression=settings.RESPONSE_COMPRESSION,
+    minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE,
+    gzip_level=settings.RESPONSE_GZIP_LEVEL,
+    brotli_quality=settings.RESPONSE_BROTLI_QUALITY,
+)
+app.add_middleware(MetricsMiddleware, server_timing=settings.SERVER_TIMING)
+# Воркер готов принимать трафик после миграций и прогрева (см. /health/ready)
+app.state.ready = False
+
+
+@app.exception_handler(NotModified)
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=exc.headers)
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
 
 
 @app.post("/token")
@@ -122,7 +333,9 @@ async def login(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
-    access_token = await create_access_token({"sub": user.username})
+    access_token = await create_access_token(
+        access_token_claims(user.id, user.username, user.disabled)
+    )
     refresh_token = await create_refresh_token(user.username)
     return {
         "access_token": access_token,
@@ -132,41 +345,93 @@ async def login(
 
 
 @app.post("/refresh")
-async def refresh(refresh_token: str):
+async def refresh(refresh_token: str, db: AsyncSession = Depends(get_async_db)):
     payload = await decode_token(refresh_token)
     if payload is None or payload.get("sub") is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
         )
-    username = payload.get("sub")
-    new_access_token = create_access_token({"sub": username})
+    user = await get_principal(db, payload["sub"])
+    if not user or user["disabled"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
+    new_access_token = await create_access_token(
+        access_token_claims(user["id"], user["username"], user["disabled"])
+    )
     return {"access_token": new_access_token, "token_type": "bearer"}
 
 
-@app.get("/me/user")
+@app.get("/me/user", response_model=UserPublic)
 async def read_users_me(
     db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
 ):
     return await get_current_user(db, token)
 
 
-@app.get("/users/{username}")
-async def read_user(username: str, db: AsyncSession = Depends(get_async_db)):
-    user = await get_user_by_username(db, username)
+@app.get("/users/{username}", response_model=UserPublic)
+async def read_user(username: str, db: AsyncSession = Depends(get_read_db)):
+    # Профиль без хеша пароля; с реплики, поэтому мимо principal_cache
+    user = await get_user_profile(db, username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
-@app.get("/migrate")
-async def migrate():
-    await create_tables()
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    """Процесс жив и обслуживает event loop; БД не проверяется"""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    """
+    Воркер прогрет и БД отвечает; иначе 503, чтобы балансировщик
+    не направлял запросы на стартующий или останавливающийся воркер
+    """
+    if not app.state.ready:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "starting"},
+        )
+    try:
+        async with asyncio.timeout(READINESS_DB_TIMEOUT):
+            await ping()
+    except (TimeoutError, OSError, DBAPIError) as e:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "database unavailable", "detail": str(e)},
+        )
+    return {"status": "ok"}
+
+
+@app.get("/internal/cache", include_in_schema=False)
+async def cache_stats():
+    return catalog_cache.snapshot()
+
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(
+        render_prometheus(pool_metrics, pool_status()),
+        media_type="text/plain; version=0.0.4",
+    )
 
-@app.put("/create_user")
+
+@app.get("/internal/pool", include_in_schema=False)
+async def pool_stats():
+    return pool_status()
+
+
+@app.put("/create_user", response_model=UserPublic)
 async def update_item(user: UserReqst, db: AsyncSession = Depends(get_async_db)):
     user.hashed_password = await get_password_hash(user.hashed_password)
-    b = await create_test_user(db, user)
+    try:
+        b = await create_test_user(db, user)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     return b
 
 
@@ -186,7 +451,39 @@ async def add_to_cart_endpoint(
         return {"status": "error", "message": str(e)}
 
 
-@app.post("/products/")
+@app.post(
+    "/cart/batch", response_model=CartBatchResult, response_model_exclude_none=True
+)
+async def cart_batch_endpoint(
+    batch: CartBatch, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Применяет несколько операций с корзиной (add / set / remove) одной транзакцией
+    """
+    try:
+        cart = await apply_cart_batch(
+            db=db, user_id=batch.user_id, operations=batch.operations
+        )
+        return {"status": "success", "items": cart}
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+
+@app.post("/checkout", response_model=CheckoutResult, response_model_exclude_none=True)
+async def checkout_endpoint(
+    request: CheckoutRequest, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Оформляет все товары из корзины пользователя в покупки
+    """
+    try:
+        order = await checkout(db=db, user_id=request.user_id)
+        return {"status": "success", **order}
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+
+@app.post("/products/", response_model=ProductDetail)
 async def create_new_product(
     product_data: ProductCreateSchema, db: AsyncSession = Depends(get_async_db)
 ):
@@ -210,7 +507,29 @@ async def create_new_product(
         )
 
 
-@app.post("/categories/")
+@app.post("/products/import")
+async def import_products_file(
+    file: UploadFile,
+    format: Literal["csv", "ndjson"] | None = None,
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Пакетный импорт продуктов из CSV или NDJSON
+
+    Существующие продукты (по названию) обновляются. Строки с ошибками
+    пропускаются и перечисляются в отчёте с номерами строк.
+    """
+    fmt = format or detect_format(file.filename, file.content_type)
+    # Файл читается синхронно, но пачками в потоке (см. import_products)
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return await import_products(db, open_rows(stream, fmt), chunk_size)
+    finally:
+        stream.detach()
+
+
+@app.post("/categories/", response_model=CategoryOut)
 async def create_new_category(
     category_data: CategoryCreate, db: AsyncSession = Depends(get_async_db)
 ):
@@ -223,22 +542,251 @@ async def create_new_category(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.get("/products/all")
-async def get_products_sequence(db: AsyncSession = Depends(get_async_db)):
+@app.get(
+    "/categories",
+    response_model=list[CategoryOut],
+    dependencies=[Depends(catalog_validators)],
+)
+async def list_categories(db: AsyncSession = Depends(get_read_db)):
+    """
+    Категории с числом товаров (из кеша каталога, без GROUP BY по связям)
+    """
+    categories = await get_cached_categories(db)
+    return list(categories.values())
+
+
+@app.get(
+    "/categories/{category_id}/products",
+    response_model=ProductPage,
+    dependencies=[Depends(catalog_validators)],
+)
+async def list_category_products(
+    category_id: int,
+    params: Annotated[CategoryProductsParams, Query()],
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Товары категории с keyset-пагинацией (индекс category_id, product_id)
+
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+    """
+    if category_id not in await get_cached_categories(db):
+        raise HTTPException(status_code=404, detail="Категория не найдена")
+    try:
+        items, next_cursor = await get_products_page(
+            db=db,
+            limit=params.limit,
+            cursor=params.cursor,
+            sort=params.sort,
+            descending=params.order == "desc",
+            category_id=category_id,
+            in_stock=params.in_stock,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get(
+    "/products/all",
+    response_model=list[ProductOut],
+    deprecated=True,
+    dependencies=[Depends(catalog_validators)],
+)
+async def get_products_sequence(db: AsyncSession = Depends(get_read_db)):
     all_products = await get_all_products(db)
     return all_products
 
 
-@app.post("/comments")
+@app.get(
+    "/products",
+    response_model=ProductPage,
+    dependencies=[Depends(catalog_validators)],
+)
+async def list_products(
+    params: Annotated[ProductPageParams, Query()],
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Страница каталога с keyset-пагинацией
+
+    - **cursor**: значение `next_cursor` из предыдущего ответа
+    - **sort**/**order**: ключ и направление сортировки
+    - **category_id**, **min_price**, **max_price**, **in_stock**: фильтры
+    """
+    try:
+        items, next_cursor = await get_products_page(
+            db=db,
+            limit=params.limit,
+            cursor=params.cursor,
+            sort=params.sort,
+            descending=params.order == "desc",
+            category_id=params.category_id,
+            min_price=params.min_price,
+            max_price=params.max_price,
+            in_stock=params.in_stock,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get(
+    "/products/search",
+    response_model=ProductSearchPage,
+    dependencies=[Depends(catalog_validators)],
+)
+async def search_products_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    prefix: bool = True,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Поиск товаров по названию и описанию
+
+    - **q**: поисковый запрос
+    - **prefix**: последнее слово — префикс (автодополнение)
+    """
+    items = await search_products(db, q, limit=limit, offset=offset, prefix=prefix)
+    return {"items": items}
+
+
+@app.get("/products/export")
+async def export_products(params: Annotated[ProductFilterParams, Query()]):
+    """
+    Полная выгрузка каталога в формате NDJSON (один продукт на строку)
+    """
+
+    async def ndjson():
+        async for product in stream_products(
+            category_id=params.category_id,
+            min_price=params.min_price,
+            max_price=params.max_price,
+            in_stock=params.in_stock,
+        ):
+            yield json.dumps(product, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.post(
+    "/comments",
+    response_model=CommentOut,
+    responses={404: {"description": "Пользователь, товар или родитель не найдены"}},
+)
 async def create_comment(
     comment_data: CommentSchema, db: AsyncSession = Depends(get_async_db)
 ):
-    new = await create_reply_comment_or_comment(db, comment_data)
-    return new
+    try:
+        return await create_reply_comment_or_comment(db, comment_data)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@app.get("/products/{product_id}/comments", response_model=CommentTreePage)
+async def get_product_comments(
+    product_id: int,
+    params: Annotated[CommentTreeParams, Query()],
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Ветки комментариев товара
+
+    - **limit**/**after**: пагинация корневых комментариев (`after` — `next_cursor`)
+    - **max_depth**: глубина вложенности ответов
+    """
+    if await get_cached_product(db, product_id) is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    comments, next_cursor = await get_comment_tree(
+        db=db,
+        product_id=product_id,
+        limit=params.limit,
+        after=params.after,
+        max_depth=params.max_depth,
+    )
+    return {"items": comments, "next_cursor": next_cursor}
+
+
+@app.put("/products/{product_id}/stock-shards")
+async def update_stock_sharding(
+    product_id: int,
+    request: StockShardingRequest,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Распределяет остаток популярного товара по N строкам-шардам (0 — выключить),
+    чтобы параллельные покупки не ждали друг друга на одной строке
+    """
+    try:
+        return await set_stock_sharding(
+            db=db, product_id=product_id, shards=request.shards
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@app.get("/analytics/bestsellers")
+async def bestsellers(
+    days: int = Query(7, ge=1, le=366),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+):
+    return await get_bestsellers(db, days=days, limit=limit)
+
+
+@app.get("/analytics/categories/revenue")
+async def category_revenue(
+    days: int = Query(30, ge=1, le=366),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+):
+    return await get_category_revenue(db, days=days, limit=limit)
+
+
+@app.get("/analytics/products/{product_id}/sales")
+async def product_sales(
+    product_id: int,
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(get_read_db),
+):
+    return await get_sales_series(db, product_id=product_id, days=days)
+
+
+@app.get("/analytics/categories/{category_id}/sales")
+async def category_sales(
+    category_id: int,
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(get_read_db),
+):
+    return await get_sales_series(db, category_id=category_id, days=days)
+
+
+@app.get("/users/{user_id}/purchases")
+async def user_purchases(
+    user_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    before: int | None = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    История покупок пользователя, новые сначала (`before` — `next_cursor`)
+    """
+    items, next_cursor = await get_purchase_history(
+        db, user_id=user_id, limit=limit, before=before
+    )
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.post("/internal/analytics/refresh", include_in_schema=False)
+async def refresh_analytics(db: AsyncSession = Depends(get_async_db)):
+    return {"processed": await refresh_rollups(db)}
 
 
 @app.patch(
     "/products/{product_id}/categories",
+    response_model=ProductDetail,
     status_code=status.HTTP_200_OK,
     summary="Добавить категории к продукту",
     responses={
@@ -272,4 +820,5 @@ async def update_product_categories(
 if __name__ == "__main__":
     import uvicorn
 
+    # Один процесс для разработки; в production — python serve.py
     uvicorn.run("main:app", host="0.0.0.0", port=8000)
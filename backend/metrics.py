@@ -0,0 +1,174 @@
+import bisect
+import math
+
+# Границы корзин по умолчанию (секунды)
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами (совместима с форматом Prometheus)
+    :param buckets: Верхние границы корзин по возрастанию
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {
+                ("+Inf" if math.isinf(bound) else str(bound)): total
+                for bound, total in self.cumulative()
+            },
+        }
+
+
+class PoolMetrics:
+    """
+    Счётчики пула соединений: ожидание соединения, открытие новых,
+    выход за pool_size, таймауты
+    """
+
+    def __init__(self):
+        self.wait_seconds = Histogram()
+        self.connect_seconds = Histogram()
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "overflow_checkouts": self.overflow_checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds.snapshot(),
+            "connect_seconds": self.connect_seconds.snapshot(),
+        }
+
+
+# Границы для количества запросов к БД за один HTTP-запрос
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Задержка event loop: интересны миллисекунды
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class LabeledHistogram:
+    """
+    Набор гистограмм, различающихся значениями меток
+    :param labelnames: Имена меток
+    :param buckets: Верхние границы корзин
+    """
+
+    def __init__(
+        self, labelnames: tuple[str, ...], buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series: dict[tuple[str, ...], Histogram] = {}
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        histogram = self.series.get(labels)
+        if histogram is None:
+            histogram = self.series[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, **extra) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusWriter:
+    """Собирает метрики в текстовый формат Prometheus (exposition format 0.0.4)"""
+
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def _header(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def counter(self, name: str, help_text: str, value: float) -> None:
+        self._header(name, "counter", help_text)
+        self.lines.append(f"{name} {_number(value)}")
+
+    def gauge(self, name: str, help_text: str, value: float) -> None:
+        self._header(name, "gauge", help_text)
+        self.lines.append(f"{name} {_number(value)}")
+
+    def gauges(
+        self, name: str, help_text: str, labelname: str, values: dict[str, float]
+    ) -> None:
+        self._header(name, "gauge", help_text)
+        for label, value in values.items():
+            self.lines.append(
+                f"{name}{_labels((labelname,), (label,))} {_number(value)}"
+            )
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        histogram: Histogram | LabeledHistogram,
+    ) -> None:
+        self._header(name, "histogram", help_text)
+        if isinstance(histogram, Histogram):
+            series = [((), (), histogram)]
+        else:
+            series = [
+                (histogram.labelnames, labels, h)
+                for labels, h in sorted(histogram.series.items())
+            ]
+        for names, values, h in series:
+            for bound, total in h.cumulative():
+                self.lines.append(
+                    f"{name}_bucket{_labels(names, values, le=_number(bound))} {total}"
+                )
+            self.lines.append(f"{name}_sum{_labels(names, values)} {_number(h.sum)}")
+            self.lines.append(f"{name}_count{_labels(names, values)} {h.count}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
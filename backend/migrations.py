@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex
+
+import analytics  # noqa: F401  (регистрирует таблицы витрин в Base.metadata)
+from db import RECOUNT_CATEGORIES, Base, engine
+from search import SEARCH_DOCUMENT_INDEX, SEARCH_DOCUMENT_INDEX_SQL
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock: миграции применяет один процесс, остальные ждут
+MIGRATION_LOCK_ID = 0x6D696772
+# Как часто процесс без блокировки проверяет, применены ли миграции, и
+# сколько всего ждёт (построение индексов на большой базе — минуты)
+MIGRATION_WAIT_INTERVAL = 1.0
+MIGRATION_WAIT_TIMEOUT = 1800.0
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Версия схемы
+    :param version: Номер версии (применяются по возрастанию)
+    :param name: Краткое описание
+    :param up: Применяет изменения на переданном соединении
+    :param transactional: False — выполняется в AUTOCOMMIT (CREATE INDEX
+        CONCURRENTLY); такие миграции должны быть идемпотентными
+    """
+
+    version: int
+    name: str
+    up: Callable[[AsyncConnection], Awaitable[None]]
+    transactional: bool = True
+
+
+def _table_columns(conn) -> dict[str, set[str]]:
+    insp = inspect(conn)
+    return {
+        table: {column["name"] for column in insp.get_columns(table)}
+        for table in insp.get_table_names()
+    }
+
+
+def _index_names(conn) -> set[str]:
+    insp = inspect(conn)
+    return {
+        index["name"]
+        for table in insp.get_table_names()
+        for index in insp.get_indexes(table)
+    }
+
+
+async def _create_missing_tables(conn: AsyncConnection) -> None:
+    # create_all пропускает существующие таблицы и создаёт только новые
+    await conn.run_sync(Base.metadata.create_all)
+
+
+async def _add_stock_shards_and_product_count(conn: AsyncConnection) -> None:
+    columns = await conn.run_sync(_table_columns)
+    if "stock_shards" not in columns["products"]:
+        await conn.execute(
+            text(
+                "ALTER TABLE products "
+                "ADD COLUMN stock_shards INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+    if "product_count" not in columns["categories"]:
+        await conn.execute(
+            text(
+                "ALTER TABLE categories "
+                "ADD COLUMN product_count INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+        await conn.execute(RECOUNT_CATEGORIES)
+
+
+def _concurrently(sql: str, dialect_name: str) -> str:
+    # В PostgreSQL индекс строится без блокировки записи в таблицу
+    if dialect_name != "postgresql":
+        return sql
+    return re.sub(
+        r"^CREATE (UNIQUE )?INDEX ", r"CREATE \1INDEX CONCURRENTLY ", sql, count=1
+    )
+
+
+def _applies_to(index, dialect_name: str) -> bool:
+    # Индексы, объявленные через Index(...).ddl_if(dialect=...)
+    ddl_if = getattr(index, "_ddl_if", None)
+    if ddl_if is None or ddl_if.dialect is None:
+        return True
+    if isinstance(ddl_if.dialect, str):
+        return ddl_if.dialect == dialect_name
+    return dialect_name in ddl_if.dialect
+
+
+def declared_indexes(dialect) -> dict[str, str]:
+    """
+    Все индексы, которые ожидает код, в виде {имя: CREATE INDEX IF NOT EXISTS}
+    :param dialect: Диалект подключения
+    """
+    indexes = {}
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if _applies_to(index, dialect.name):
+                indexes[index.name] = str(
+                    CreateIndex(index, if_not_exists=True).compile(dialect=dialect)
+                )
+    if dialect.name == "postgresql":
+        indexes[SEARCH_DOCUMENT_INDEX] = SEARCH_DOCUMENT_INDEX_SQL
+    return indexes
+
+
+async def _invalid_indexes(conn: AsyncConnection) -> set[str]:
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс
+    if conn.dialect.name != "postgresql":
+        return set()
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+        )
+    )
+    return set(result.scalars())
+
+
+async def _create_declared_indexes(conn: AsyncConnection) -> None:
+    dialect_name = conn.dialect.name
+    if dialect_name == "postgresql":
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    existing = await conn.run_sync(_index_names)
+    invalid = await _invalid_indexes(conn)
+    for name, sql in declared_indexes(conn.dialect).items():
+        if name in invalid:
+            logger.warning("Индекс %s невалиден, строится заново", name)
+            await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+        elif name in existing:
+            continue
+        logger.info("Создание индекса %s", name)
+        await conn.execute(text(_concurrently(sql, dialect_name)))
+
+
+MIGRATIONS = (
+    Migration(1, "create missing tables", _create_missing_tables),
+    Migration(
+        2,
+        "products.stock_shards, categories.product_count",
+        _add_stock_shards_and_product_count,
+    ),
+    Migration(
+        3,
+        "indexes for catalog, comments, purchases and search",
+        _create_declared_indexes,
+        transactional=False,
+    ),
+    Migration(4, "catalog_version table", _create_missing_tables),
+)
+
+
+async def _applied_versions(conn: AsyncConnection) -> set[int]:
+    await conn.run_sync(migration_metadata.create_all)
+    result = await conn.execute(select(schema_migrations.c.version))
+    return set(result.scalars())
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        insert(schema_migrations).values(
+            version=migration.version,
+            name=migration.name,
+            applied_at=datetime.now(timezone.utc),
+        )
+    )
+
+
+async def _upgrade(conn: AsyncConnection) -> list[int]:
+    # Всё на одном соединении: с пулом в одно соединение на воркер второе
+    # взять неоткуда, а CREATE INDEX CONCURRENTLY ждал бы снимки соседних сессий
+    async with conn.begin():
+        applied = await _applied_versions(conn)
+        tables = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_table_names()
+        )
+        if not applied and set(tables) == {schema_migrations.name}:
+            # Пустая база: схема создаётся целиком и помечается актуальной
+            await conn.run_sync(Base.metadata.create_all)
+            for migration in MIGRATIONS:
+                await _record(conn, migration)
+            logger.info("Схема создана, версия %d", MIGRATIONS[-1].version)
+            return [migration.version for migration in MIGRATIONS]
+
+    done = []
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        logger.info("Миграция %d: %s", migration.version, migration.name)
+        if migration.transactional:
+            async with conn.begin():
+                await migration.up(conn)
+                await _record(conn, migration)
+        else:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            try:
+                await migration.up(conn)
+            finally:
+                # В AUTOCOMMIT commit() лишь закрывает объект транзакции
+                await conn.commit()
+                await conn.execution_options(
+                    isolation_level=conn.dialect.default_isolation_level
+                )
+            async with conn.begin():
+                await _record(conn, migration)
+        done.append(migration.version)
+    return done
+
+
+async def _try_lock(conn: AsyncConnection) -> bool:
+    # Блокировка уровня сессии переживает commit; без ожидания: процесс,
+    # висящий в pg_advisory_lock, держал бы снимок, и CONCURRENTLY у
+    # владельца блокировки ждал бы его до бесконечности
+    acquired = await conn.scalar(
+        text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID}
+    )
+    await conn.commit()
+    return acquired
+
+
+async def _unlock(conn: AsyncConnection) -> None:
+    await conn.execute(
+        text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID}
+    )
+    await conn.commit()
+
+
+async def run_migrations() -> list[int]:
+    """
+    Применяет недостающие миграции по порядку версий
+    В PostgreSQL миграции применяет процесс, получивший advisory lock;
+    остальные не держат соединение и ждут, пока список неприменённых
+    миграций опустеет. serve.py применяет миграции до запуска воркеров,
+    так что в воркерах это ожидание — только страховка.
+    :return: Номера применённых этим процессом версий
+    """
+    if engine.dialect.name != "postgresql":
+        async with engine.connect() as conn:
+            return await _upgrade(conn)
+
+    deadline = asyncio.get_running_loop().time() + MIGRATION_WAIT_TIMEOUT
+    while True:
+        async with engine.connect() as conn:
+            if await _try_lock(conn):
+                try:
+                    return await _upgrade(conn)
+                finally:
+                    await _unlock(conn)
+        if not await pending_migrations():
+            return []
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError(
+                "Миграции не применены другим процессом за отведённое время"
+            )
+        await asyncio.sleep(MIGRATION_WAIT_INTERVAL)
+
+
+async def pending_migrations() -> list[int]:
+    """Номера неприменённых миграций"""
+    return [m["version"] for m in await migration_status() if not m["applied"]]
+
+
+def _recorded_versions(conn) -> set[int]:
+    # Только чтение: процесс, ждущий чужих миграций, не создаёт таблицу
+    # schema_migrations наперегонки с тем, кто их применяет
+    if not inspect(conn).has_table(schema_migrations.name):
+        return set()
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+async def migration_status() -> list[dict]:
+    """Список миграций с отметкой, применена ли каждая"""
+    async with engine.connect() as conn:
+        applied = await conn.run_sync(_recorded_versions)
+    return [
+        {
+            "version": migration.version,
+            "name": migration.name,
+            "applied": migration.version in applied,
+        }
+        for migration in MIGRATIONS
+    ]
+
+
+def _covered(columns: list[str], candidates: list[list[str]]) -> bool:
+    # Индекс подходит, если FK-колонки образуют его префикс
+    return any(
+        set(candidate[: len(columns)]) == set(columns) for candidate in candidates
+    )
+
+
+def _inspect_schema(conn) -> dict:
+    insp = inspect(conn)
+    unindexed = []
+    for table in insp.get_table_names():
+        candidates = [insp.get_pk_constraint(table)["constrained_columns"]]
+        candidates += [
+            index["column_names"]
+            for index in insp.get_indexes(table)
+            if None not in index["column_names"]
+        ]
+        candidates += [uc["column_names"] for uc in insp.get_unique_constraints(table)]
+        for fk in insp.get_foreign_keys(table):
+            if not _covered(fk["constrained_columns"], candidates):
+                unindexed.append(
+                    {
+                        "table": table,
+                        "columns": fk["constrained_columns"],
+                        "references": fk["referred_table"],
+                    }
+                )
+    return {"unindexed_foreign_keys": unindexed}
+
+
+async def audit_schema() -> dict:
+    """
+    Проверка схемы: внешние ключи без индекса, отсутствующие
+    и невалидные индексы, неприменённые миграции
+    :return: Отчёт; ok=False, если найдена хотя бы одна проблема
+    """
+    async with engine.connect() as conn:
+        report = await conn.run_sync(_inspect_schema)
+        existing = await conn.run_sync(_index_names)
+        report["missing_indexes"] = sorted(
+            set(declared_indexes(conn.dialect)) - existing
+        )
+        report["invalid_indexes"] = sorted(await _invalid_indexes(conn))
+    report["pending_migrations"] = await pending_migrations()
+    report["ok"] = not any(report.values())
+    return report
+
+
+def main() -> None:
+    """Управление схемой: python migrations.py upgrade|status|audit"""
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("command", choices=["upgrade", "status", "audit"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "upgrade":
+        print(f"Применены версии: {asyncio.run(run_migrations()) or 'нет'}")
+        return
+    if args.command == "status":
+        result = asyncio.run(migration_status())
+    else:
+        result = asyncio.run(audit_schema())
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    if args.command == "audit" and not result["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import ConfigDict, Field
 from pydantic.main import BaseModel
 
 
@@ -19,6 +23,21 @@ class AddToCart(BaseModel):
     quantity: int
 
 
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"] = "add"
+    product_id: int
+    quantity: int = 1
+
+
+class CartBatch(BaseModel):
+    user_id: int
+    operations: list[CartOperation] = Field(..., max_length=500)
+
+
+class CheckoutRequest(BaseModel):
+    user_id: int
+
+
 class ProductCreateSchema(BaseModel):
     name: str
     description: str
@@ -27,6 +46,10 @@ class ProductCreateSchema(BaseModel):
     category_ids: list[int] | None = None
 
 
+class StockShardingRequest(BaseModel):
+    shards: int = Field(..., ge=0, le=256)
+
+
 class CategoryCreate(BaseModel):
     name: str
     description: str
@@ -42,3 +65,144 @@ class CommentSchema(BaseModel):
     user_id: int  # ID менеджера магазина
     product_id: int
     parent_id: int | None = None
+
+
+class ProductFilterParams(BaseModel):
+    category_id: int | None = None
+    min_price: float | None = Field(default=None, ge=0)
+    max_price: float | None = Field(default=None, ge=0)
+    in_stock: bool = False
+
+
+class PageParams(BaseModel):
+    limit: int = Field(default=50, ge=1, le=500)
+    cursor: str | None = None
+    sort: Literal["id", "price", "name"] = "id"
+    order: Literal["asc", "desc"] = "asc"
+
+
+class ProductPageParams(ProductFilterParams, PageParams):
+    pass
+
+
+class CategoryProductsParams(PageParams):
+    in_stock: bool = False
+
+
+class CommentTreeParams(BaseModel):
+    limit: int = Field(default=20, ge=1, le=100)
+    after: int | None = None
+    max_depth: int = Field(default=5, ge=0, le=20)
+
+
+# Схемы ответов: эндпоинты отдают только перечисленные поля,
+# ORM-объекты читаются по атрибутам (from_attributes)
+
+
+class UserPublic(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    full_name: str | None = None
+    email: str
+    disabled: bool
+
+
+class CategoryRef(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+
+
+class CategoryOut(CategoryRef):
+    description: str | None = None
+    product_count: int = 0
+
+
+class ProductOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    description: str
+    price: float
+    stock: int
+
+
+class ProductDetail(ProductOut):
+    categories: list[CategoryRef] = []
+
+
+class ProductPage(BaseModel):
+    items: list[ProductOut]
+    next_cursor: str | None = None
+
+
+class ProductSearchHit(ProductOut):
+    score: float
+
+
+class ProductSearchPage(BaseModel):
+    items: list[ProductSearchHit]
+
+
+class CartItemOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: int
+    product_id: int
+    quantity: int
+
+
+class PurchaseOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: int
+    product_id: int
+    quantity: int
+    purchase_date: datetime | None = None
+
+
+# Ответы корзины и оформления: status=success с данными или status=error
+# с message; пустые поля не выводятся (response_model_exclude_none)
+class CartBatchResult(BaseModel):
+    status: str
+    items: list[CartItemOut] | None = None
+    message: str | None = None
+
+
+class CheckoutResult(BaseModel):
+    status: str
+    items: list[PurchaseOut] | None = None
+    total: float | None = None
+    message: str | None = None
+
+
+class CommentOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    text: str
+    created_at: datetime | None = None
+    user_id: int
+    product_id: int
+    parent_id: int | None = None
+
+
+class CommentNode(BaseModel):
+    id: int
+    text: str
+    created_at: datetime | None = None
+    user_id: int
+    parent_id: int | None = None
+    depth: int
+    replies: list["CommentNode"] = []
+
+
+class CommentTreePage(BaseModel):
+    items: list[CommentNode]
+    next_cursor: int | None = None
@@ -0,0 +1,193 @@
+import bisect
+import difflib
+import re
+from collections import defaultdict
+from typing import Protocol
+
+from sqlalchemy import DDL, Index, event, func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import PRODUCT_COLUMNS, Base, Product, catalog_cache
+from instrumentation import traced
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Выражение должно совпадать с индексом посимвольно, поэтому без bind-параметров
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+search_document = func.to_tsvector(
+    SEARCH_CONFIG,
+    Product.name.concat(literal_column("' '")).concat(Product.description),
+)
+
+# Индекс с чисто функциональным выражением не привязывается к таблице сам,
+# поэтому создаётся DDL-событием (и миграциями); выражение совпадает с search_document
+SEARCH_DOCUMENT_INDEX = "ix_products_search_document"
+SEARCH_DOCUMENT_INDEX_SQL = (
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_DOCUMENT_INDEX} ON products "
+    "USING gin (to_tsvector('simple'::regconfig, name || ' ' || description))"
+)
+event.listen(
+    Product.__table__,
+    "after_create",
+    DDL(SEARCH_DOCUMENT_INDEX_SQL).execute_if(dialect="postgresql"),
+)
+Index(
+    "ix_products_name_trgm",
+    Product.name,
+    postgresql_using="gin",
+    postgresql_ops={"name": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchBackend(Protocol):
+    async def search(
+        self, db: AsyncSession, q: str, limit: int, offset: int, prefix: bool
+    ) -> list[dict]: ...
+
+
+class PostgresSearch:
+    """Полнотекстовый поиск по tsvector (GIN) с нечётким совпадением по триграммам"""
+
+    async def search(
+        self, db: AsyncSession, q: str, limit: int, offset: int, prefix: bool
+    ) -> list[dict]:
+        tokens = tokenize(q)
+        if not tokens:
+            return []
+        terms = [f"'{token}'" for token in tokens]
+        if prefix:
+            terms[-1] += ":*"
+        query = func.to_tsquery(SEARCH_CONFIG, " & ".join(terms))
+        phrase = " ".join(tokens)
+
+        score = (
+            func.ts_rank(search_document, query) + func.similarity(Product.name, phrase)
+        ).label("score")
+        result = await db.execute(
+            select(*PRODUCT_COLUMNS, score)
+            .where(or_(search_document.op("@@")(query), Product.name.op("%")(phrase)))
+            .order_by(score.desc(), Product.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return [dict(row) for row in result.mappings()]
+
+
+class InMemorySearchIndex:
+    """
+    Инвертированный индекс в памяти процесса для SQLite и тестов
+    Совпадение в названии весит больше, чем в описании; последний токен
+    запроса может быть префиксом, а неизвестные токены ищутся нечётко.
+    """
+
+    NAME_WEIGHT = 2.0
+    DESCRIPTION_WEIGHT = 1.0
+    FUZZY_CUTOFF = 0.75
+
+    def __init__(self, products: list[dict]):
+        self.products = {p["id"]: p for p in products}
+        self.postings: dict[str, dict[int, float]] = defaultdict(dict)
+        for product in products:
+            for field, weight in (
+                ("name", self.NAME_WEIGHT),
+                ("description", self.DESCRIPTION_WEIGHT),
+            ):
+                for token in tokenize(product[field] or ""):
+                    scores = self.postings[token]
+                    scores[product["id"]] = scores.get(product["id"], 0.0) + weight
+        self.vocabulary = sorted(self.postings)
+
+    def _expand(self, token: str, prefix: bool) -> list[tuple[str, float]]:
+        if prefix:
+            start = bisect.bisect_left(self.vocabulary, token)
+            matches = []
+            for word in self.vocabulary[start:]:
+                if not word.startswith(token):
+                    break
+                matches.append((word, 1.0 if word == token else 0.8))
+            if matches:
+                return matches
+        elif token in self.postings:
+            return [(token, 1.0)]
+        return [
+            (word, 0.5)
+            for word in difflib.get_close_matches(
+                token, self.vocabulary, n=3, cutoff=self.FUZZY_CUTOFF
+            )
+        ]
+
+    def search(self, q: str, limit: int, offset: int, prefix: bool) -> list[dict]:
+        tokens = tokenize(q)
+        if not tokens:
+            return []
+        scores: dict[int, float] | None = None
+        for i, token in enumerate(tokens):
+            token_scores: dict[int, float] = {}
+            expanded = self._expand(token, prefix and i == len(tokens) - 1)
+            for word, factor in expanded:
+                for product_id, weight in self.postings[word].items():
+                    token_scores[product_id] = max(
+                        token_scores.get(product_id, 0.0), weight * factor
+                    )
+            # Все токены запроса должны совпасть (как & в tsquery)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    pid: s + token_scores[pid]
+                    for pid, s in scores.items()
+                    if pid in token_scores
+                }
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            {**self.products[product_id], "score": score}
+            for product_id, score in ranked[offset : offset + limit]
+        ]
+
+
+class InMemorySearch:
+    """Обёртка над InMemorySearchIndex: индекс живёт в кеше каталога и
+    перестраивается после любой записи в каталог"""
+
+    async def search(
+        self, db: AsyncSession, q: str, limit: int, offset: int, prefix: bool
+    ) -> list[dict]:
+        async def build() -> InMemorySearchIndex:
+            result = await db.execute(select(*PRODUCT_COLUMNS))
+            return InMemorySearchIndex([dict(row) for row in result.mappings()])
+
+        index = await catalog_cache.get_or_load("search:index", build)
+        return index.search(q, limit, offset, prefix)
+
+
+def get_search_backend(db: AsyncSession) -> SearchBackend:
+    # Не get_bind(): без выражения RoutingSession считает это записью и
+    # переключает сессию на primary. Диалект у реплик тот же, что у primary
+    if db.bind.dialect.name == "postgresql":
+        return PostgresSearch()
+    return InMemorySearch()
+
+
+@traced
+async def search_products(
+    db: AsyncSession, q: str, limit: int = 20, offset: int = 0, prefix: bool = True
+) -> list[dict]:
+    """
+    Ищет товары по названию и описанию, лучшие совпадения первыми
+    :param db: Асинхронная сессия
+    :param q: Поисковый запрос
+    :param limit: Размер страницы
+    :param offset: Смещение
+    :param prefix: Считать последний токен префиксом (автодополнение)
+    :return: Товары со значением релевантности score
+    """
+    return await get_search_backend(db).search(db, q, limit, offset, prefix)
@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+import uvicorn
+
+from config import settings
+
+
+async def _migrate() -> None:
+    # Импорт здесь: без миграций при старте серверу не нужен движок БД
+    from db import engine
+    from migrations import run_migrations
+
+    try:
+        await run_migrations()
+    finally:
+        # Соединения этого event loop воркерам не достанутся
+        await engine.dispose()
+
+
+def main() -> None:
+    """
+    Production-запуск: WEB_WORKERS процессов uvicorn на одном сокете
+    Каждый воркер — отдельный процесс со своими кешами и пулом соединений.
+    SIGHUP перезапускает воркеры по одному (остальные продолжают обслуживать
+    запросы), SIGTERM — плавная остановка с ожиданием текущих запросов.
+    """
+    workers = settings.web_workers
+    if settings.DB_MIGRATE_ON_STARTUP:
+        # Миграции один раз до запуска воркеров: иначе каждый воркер
+        # применял бы их сам, в SQLite — без всякой блокировки
+        asyncio.run(_migrate())
+        os.environ["DB_MIGRATE_ON_STARTUP"] = "0"
+    # Воркеры читают настройки заново; число процессов передаётся через
+    # окружение, чтобы каждый взял свою долю DB_CONNECTION_BUDGET
+    os.environ["WEB_WORKERS"] = str(workers)
+    uvicorn.run(
+        "main:app",
+        host=settings.WEB_HOST,
+        port=settings.WEB_PORT,
+        workers=workers,
+        timeout_graceful_shutdown=settings.WEB_GRACEFUL_SHUTDOWN_SECONDS,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
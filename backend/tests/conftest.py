@@ -0,0 +1,96 @@
+import itertools
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+# Настройки читаются при первом обращении к config.settings, поэтому
+# окружение задаётся до импорта модулей приложения. По умолчанию — временная
+# SQLite; TEST_DATABASE_URL (например, пустая база PostgreSQL) нужен
+# тестам, которые проверяют блокировки строк
+DATABASE = Path(tempfile.mkdtemp(prefix="backend-tests-")) / "test.db"
+os.environ.update(
+    DATABASE_URL=os.environ.get("TEST_DATABASE_URL", f"sqlite+aiosqlite:///{DATABASE}"),
+    SECRET_KEY="test-secret-key",
+    ALGORITHM="HS256",
+    ACCESS_TOKEN_EXPIRE_MINUTES="30",
+    REFRESH_TOKEN_EXPIRE_DAYS="7",
+    ANALYTICS_REFRESH_INTERVAL="0",
+    STARTUP_WARMUP="0",
+)
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import db  # noqa: E402
+import main  # noqa: E402
+
+_names = itertools.count(1)
+# База TEST_DATABASE_URL переживает запуск: имена не должны повторяться
+_run = uuid.uuid4().hex[:8]
+
+
+def unique(prefix: str) -> str:
+    """Уникальное имя: база общая для всех тестов сессии"""
+    return f"{prefix}-{_run}-{next(_names)}"
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client(anyio_backend):
+    # Lifespan один на сессию: миграции, пул потоков bcrypt, фоновые задачи
+    async with main.app.router.lifespan_context(main.app):
+        transport = ASGITransport(app=main.app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Собирает SQL-запросы к движку (по умолчанию — к primary)
+    :return: Список текстов выполненных запросов
+    """
+    engine = (engine or db.engine).sync_engine
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+async def create_user() -> int:
+    async with db.AsyncSessionLocal() as session:
+        user = db.User(
+            username=unique("user"), email="user@example.com", hashed_password="x"
+        )
+        session.add(user)
+        await session.commit()
+        return user.id
+
+
+async def create_product(client: AsyncClient, stock: int = 100, **fields) -> dict:
+    response = await client.post(
+        "/products/",
+        json={
+            "name": unique("product"),
+            "description": "описание",
+            "price": 10,
+            "stock": stock,
+            **fields,
+        },
+    )
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,76 @@
+"""
+Параллельные оформления заказа не продают товар сверх остатка
+
+На SQLite запись сериализуется целиком, поэтому тест имеет смысл только
+с блокировками строк: запускается с TEST_DATABASE_URL на PostgreSQL.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+import db
+from conftest import create_product, create_user
+
+pytestmark = [
+    pytest.mark.anyio,
+    pytest.mark.skipif(
+        db.engine.dialect.name != "postgresql",
+        reason="нужен PostgreSQL (TEST_DATABASE_URL)",
+    ),
+]
+
+STOCK = 5
+BUYERS = 20
+
+
+@pytest.mark.parametrize("shards", [0, 3])
+async def test_concurrent_checkouts_do_not_oversell(client, shards):
+    product = await create_product(client, stock=STOCK)
+    if shards:
+        response = await client.put(
+            f"/products/{product['id']}/stock-shards", json={"shards": shards}
+        )
+        assert response.status_code == 200
+    users = [await create_user() for _ in range(BUYERS)]
+    for user_id in users:
+        response = await client.post(
+            "/cart/batch",
+            json={
+                "user_id": user_id,
+                "operations": [{"product_id": product["id"], "quantity": 1}],
+            },
+        )
+        assert response.json()["status"] == "success"
+
+    responses = await asyncio.gather(
+        *(client.post("/checkout", json={"user_id": u}) for u in users)
+    )
+
+    results = [response.json() for response in responses]
+    winners = [r for r in results if r["status"] == "success"]
+    losers = [r for r in results if r["status"] != "success"]
+    assert len(winners) == STOCK
+    assert all(r["message"].startswith("Недостаточно товара на складе") for r in losers)
+
+    async with db.AsyncSessionLocal() as session:
+        stock = await session.scalar(
+            select(db.product_stock).where(db.Product.id == product["id"])
+        )
+        shard_stocks = list(
+            await session.scalars(
+                select(db.ProductStockShard.stock).where(
+                    db.ProductStockShard.product_id == product["id"]
+                )
+            )
+        )
+        sold = await session.scalar(
+            select(func.sum(db.Purchased.quantity)).where(
+                db.Purchased.product_id == product["id"]
+            )
+        )
+    assert stock == 0
+    assert len(shard_stocks) == shards
+    assert all(s >= 0 for s in shard_stocks)
+    assert sold == STOCK
@@ -0,0 +1,77 @@
+"""
+Создание комментариев: несуществующие ссылки дают 404, а не 500
+"""
+
+import pytest
+
+from conftest import create_product, create_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def _comment(client, user_id: int, product_id: int, parent_id=None):
+    return await client.post(
+        "/comments",
+        json={
+            "text": "текст",
+            "user_id": user_id,
+            "product_id": product_id,
+            "parent_id": parent_id,
+        },
+    )
+
+
+async def test_comment_and_reply(client):
+    product = await create_product(client)
+    user_id = await create_user()
+    root = await _comment(client, user_id, product["id"])
+    assert root.status_code == 200
+    reply = await _comment(client, user_id, product["id"], root.json()["id"])
+    assert reply.status_code == 200
+    assert reply.json()["parent_id"] == root.json()["id"]
+
+
+async def test_unknown_product_or_parent_is_404(client):
+    product = await create_product(client)
+    user_id = await create_user()
+    response = await _comment(client, user_id, 10**9)
+    assert response.status_code == 404
+    response = await _comment(client, user_id, product["id"], 10**9)
+    assert response.status_code == 404
+
+
+async def test_parent_from_another_product_is_404(client):
+    product, other = await create_product(client), await create_product(client)
+    user_id = await create_user()
+    parent = (await _comment(client, user_id, other["id"])).json()["id"]
+    response = await _comment(client, user_id, product["id"], parent)
+    assert response.status_code == 404
+    assert (await client.get(f"/products/{product['id']}/comments")).json()[
+        "items"
+    ] == []
+
+
+async def test_comment_pages(client):
+    product = await create_product(client)
+    user_id = await create_user()
+    roots = []
+    for _ in range(3):
+        root = (await _comment(client, user_id, product["id"])).json()["id"]
+        await _comment(client, user_id, product["id"], root)
+        roots.append(root)
+    url = f"/products/{product['id']}/comments"
+
+    first = (await client.get(url, params={"limit": 2})).json()
+    assert [item["id"] for item in first["items"]] == roots[:2]
+    assert all(len(item["replies"]) == 1 for item in first["items"])
+    assert first["next_cursor"] == roots[1]
+
+    params = {"limit": 2, "after": first["next_cursor"]}
+    last = (await client.get(url, params=params)).json()
+    assert [item["id"] for item in last["items"]] == roots[2:]
+    assert last["next_cursor"] is None
+
+    # Ровно полная последняя страница тоже без курсора
+    full = (await client.get(url, params={"limit": 3})).json()
+    assert len(full["items"]) == 3
+    assert full["next_cursor"] is None
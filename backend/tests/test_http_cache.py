@@ -0,0 +1,36 @@
+import pytest
+
+import db
+from config import settings
+from conftest import create_product, unique
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_new_version_from_other_worker_drops_cached_catalog(client):
+    await create_product(client)
+    first = await client.get("/products/all")
+    assert first.status_code == 200
+
+    # Запись «в другом воркере»: кеш этого процесса не сброшен, меняется
+    # только версия в БД
+    async with db.AsyncSessionLocal() as session:
+        product = db.Product(
+            name=unique("product"), description="описание", price=10, stock=1
+        )
+        session.add(product)
+        await db.bump_catalog_version(session)
+        await session.commit()
+    # Истёк CATALOG_VERSION_TTL
+    db.catalog_version_cache.discard(db.CATALOG_VERSION_KEY)
+
+    second = await client.get(
+        "/products/all", headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert second.status_code == 200
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert product.id in [item["id"] for item in second.json()]
+
+
+def test_catalog_cache_ttl_within_stock_staleness():
+    assert db.catalog_cache.local.ttl <= settings.CATALOG_STOCK_STALENESS_SECONDS
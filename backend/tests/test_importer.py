@@ -0,0 +1,136 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+import db
+from conftest import create_product, unique
+
+pytestmark = pytest.mark.anyio
+
+
+async def _import(client, rows: list, **params) -> dict:
+    body = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+    return await _import_raw(client, body, **params)
+
+
+async def _import_raw(client, body: str, **params) -> dict:
+    response = await client.post(
+        "/products/import",
+        params=params,
+        files={"file": ("products.ndjson", body.encode(), "application/x-ndjson")},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def _stock(product_id: int) -> int:
+    async with db.AsyncSessionLocal() as session:
+        return await session.scalar(
+            select(db.product_stock).where(db.Product.id == product_id)
+        )
+
+
+async def test_import_spreads_stock_over_shards(client):
+    product = await create_product(client, stock=5)
+    response = await client.put(
+        f"/products/{product['id']}/stock-shards", json={"shards": 3}
+    )
+    assert response.status_code == 200
+
+    report = await _import(
+        client, [{"name": product["name"], "price": 10, "stock": 10}]
+    )
+    assert report["imported"] == 1
+    assert await _stock(product["id"]) == 10
+
+    response = await client.put(
+        f"/products/{product['id']}/stock-shards", json={"shards": 0}
+    )
+    assert response.json()["stock"] == 10
+    assert await _stock(product["id"]) == 10
+
+
+async def _products(names: list[str]) -> dict[str, dict]:
+    async with db.AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(*db.PRODUCT_COLUMNS).where(db.Product.name.in_(names))
+        )
+        return {row["name"]: dict(row) for row in result.mappings()}
+
+
+async def test_bad_rows_are_reported_and_skipped(client):
+    good = unique("import")
+    body = "\n".join(
+        [
+            json.dumps({"name": unique("import"), "price": 1, "category_ids": [None]}),
+            json.dumps({"name": unique("import"), "price": 1, "categories": 5}),
+            json.dumps({"name": unique("import"), "price": 1, "category_ids": ["x"]}),
+            json.dumps({"name": unique("import"), "price": 1, "categories": [[1]]}),
+            json.dumps(
+                {"name": unique("import"), "price": 1, "category_ids": [999999]}
+            ),
+            json.dumps({"name": unique("import"), "price": -1}),
+            json.dumps({"price": 1}),
+            "{не json",
+            "[1, 2]",
+            json.dumps({"name": good, "price": 1, "stock": 3}),
+        ]
+    )
+    report = await _import_raw(client, body)
+
+    assert report["processed"] == 10
+    assert report["imported"] == 1
+    assert [error["line"] for error in report["errors"]] == list(range(1, 10))
+    assert list(await _products([good])) == [good]
+
+
+async def test_import_updates_existing_products(client):
+    category = (
+        await client.post(
+            "/categories/", json={"name": unique("category"), "description": ""}
+        )
+    ).json()
+    name = unique("import")
+    await _import(client, [{"name": name, "price": 5, "stock": 1}])
+    report = await _import(
+        client,
+        [
+            {
+                "name": name,
+                "description": "новое",
+                "price": 7,
+                "stock": 4,
+                "categories": category["name"],
+            }
+        ],
+    )
+
+    assert report == {"processed": 1, "imported": 1, "failed": 0, "errors": []}
+    product = (await _products([name]))[name]
+    assert (product["description"], product["price"], product["stock"]) == (
+        "новое",
+        7,
+        4,
+    )
+    categories = (await client.get("/categories")).json()
+    assert (
+        next(c for c in categories if c["id"] == category["id"])["product_count"] == 1
+    )
+
+
+async def test_import_in_chunks(client):
+    names = [unique("import") for _ in range(5)]
+    rows = [{"name": name, "price": 1, "stock": 1} for name in names]
+    rows.insert(2, {"name": names[0], "price": 2, "stock": 9})
+    rows.insert(4, {"name": unique("import"), "price": 0})
+
+    report = await _import(client, rows, chunk_size=2)
+
+    assert report["processed"] == 7
+    assert report["imported"] == 6
+    assert [error["line"] for error in report["errors"]] == [5]
+    products = await _products(names)
+    assert sorted(products) == sorted(names)
+    # Повтор имени в другой пачке — обычное обновление
+    assert products[names[0]]["stock"] == 9
@@ -0,0 +1,43 @@
+"""
+Метрики пула: ожидание очереди не включает открытие нового соединения
+"""
+
+import time
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import db
+
+pytestmark = pytest.mark.anyio
+
+CONNECT_DELAY = 0.2
+
+
+async def test_connect_time_is_not_pool_wait(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=db.InstrumentedPool,
+        pool_size=1,
+        max_overflow=0,
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def slow_connect(dbapi_connection, connection_record):
+        time.sleep(CONNECT_DELAY)
+
+    metrics = db.pool_metrics
+    wait, connect = metrics.wait_seconds.sum, metrics.connect_seconds.sum
+    connects = metrics.connect_seconds.count
+    try:
+        for _ in range(2):
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+    finally:
+        await engine.dispose()
+
+    # Открыто одно соединение, второй раз оно взято из очереди
+    assert metrics.connect_seconds.count - connects == 1
+    assert metrics.connect_seconds.sum - connect >= CONNECT_DELAY
+    assert metrics.wait_seconds.sum - wait < CONNECT_DELAY / 2
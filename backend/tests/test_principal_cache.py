@@ -0,0 +1,36 @@
+import pytest
+
+import db
+from conftest import create_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_principal_read_between_flush_and_commit_is_not_kept(client):
+    user_id = await create_user()
+    async with db.AsyncSessionLocal() as writer:
+        user = await writer.get(db.User, user_id)
+        user.disabled = True
+        await writer.flush()
+
+        # Чтение между flush и commit видит ещё старую строку и кеширует её
+        async with db.AsyncSessionLocal() as reader:
+            stale = await db.get_principal(reader, user.username)
+        assert stale["disabled"] is False
+
+        await writer.commit()
+
+    async with db.AsyncSessionLocal() as reader:
+        principal = await db.get_principal(reader, user.username)
+    assert principal["disabled"] is True
+
+
+async def test_rolled_back_change_keeps_nothing_pending(client):
+    user_id = await create_user()
+    async with db.AsyncSessionLocal() as session:
+        user = await session.get(db.User, user_id)
+        user.disabled = True
+        await session.flush()
+        assert session.info[db.FORGET_PRINCIPALS_KEY]
+        await session.rollback()
+        assert db.FORGET_PRINCIPALS_KEY not in session.info
@@ -0,0 +1,155 @@
+"""
+Число SQL-запросов на эндпоинт не должно расти с размером данных (N+1)
+"""
+
+import pytest
+
+from conftest import count_queries, create_product, create_user, unique
+
+pytestmark = pytest.mark.anyio
+
+
+async def _cart_batch(client, user_id: int, product_ids: list[int]) -> list[str]:
+    operations = [{"product_id": p, "quantity": 1} for p in product_ids]
+    with count_queries() as statements:
+        response = await client.post(
+            "/cart/batch", json={"user_id": user_id, "operations": operations}
+        )
+    assert response.json()["status"] == "success"
+    return statements
+
+
+async def _checkout(client, user_id: int) -> tuple[dict, list[str]]:
+    with count_queries() as statements:
+        response = await client.post("/checkout", json={"user_id": user_id})
+    assert response.status_code == 200
+    return response.json(), statements
+
+
+async def test_cart_batch_and_checkout_do_not_scale_with_items(client):
+    one = [(await create_product(client))["id"]]
+    many = [(await create_product(client))["id"] for _ in range(5)]
+    user_one, user_many = await create_user(), await create_user()
+
+    batch_one = await _cart_batch(client, user_one, one)
+    batch_many = await _cart_batch(client, user_many, many)
+    assert len(batch_many) == len(batch_one)
+
+    _, checkout_one = await _checkout(client, user_one)
+    order_many, checkout_many = await _checkout(client, user_many)
+    assert len(checkout_many) == len(checkout_one)
+    assert order_many["status"] == "success"
+    assert {item["product_id"] for item in order_many["items"]} == set(many)
+    assert order_many["total"] == 50
+
+
+async def test_cart_batch_response_schema(client):
+    product = await create_product(client)
+    user_id = await create_user()
+    response = await client.post(
+        "/cart/batch",
+        json={
+            "user_id": user_id,
+            "operations": [{"product_id": product["id"], "quantity": 2}],
+        },
+    )
+    body = response.json()
+    assert body["status"] == "success"
+    assert "message" not in body
+    assert [set(item) for item in body["items"]] == [
+        {"id", "user_id", "product_id", "quantity"}
+    ]
+
+
+async def test_checkout_error_has_only_message(client):
+    response = await client.post("/checkout", json={"user_id": await create_user()})
+    assert response.json() == {"status": "error", "message": "Корзина пуста"}
+
+
+async def test_category_patch_does_not_scale_with_categories(client):
+    categories = []
+    for _ in range(5):
+        response = await client.post(
+            "/categories/", json={"name": unique("category"), "description": "d"}
+        )
+        categories.append(response.json()["id"])
+
+    counts = []
+    for category_ids in (categories[:1], categories):
+        product = await create_product(client)
+        with count_queries() as statements:
+            response = await client.patch(
+                f"/products/{product['id']}/categories",
+                json={"category_ids": category_ids},
+            )
+        assert [c["id"] for c in response.json()["categories"]] == category_ids
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+async def test_comment_tree_is_one_query(client):
+    product = await create_product(client)
+    user_id = await create_user()
+    parent = None
+    for _ in range(4):
+        response = await client.post(
+            "/comments",
+            json={
+                "text": "текст",
+                "user_id": user_id,
+                "product_id": product["id"],
+                "parent_id": parent,
+            },
+        )
+        parent = response.json()["id"]
+
+    # Первый запрос кладёт товар в кеш каталога; дальше — только дерево
+    await client.get(f"/products/{product['id']}/comments")
+    with count_queries() as statements:
+        response = await client.get(f"/products/{product['id']}/comments")
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+async def test_product_page_does_not_scale_with_page_size(client):
+    response = await client.post(
+        "/categories/", json={"name": unique("category"), "description": "d"}
+    )
+    category_id = response.json()["id"]
+    for _ in range(5):
+        product = await create_product(client)
+        await client.patch(
+            f"/products/{product['id']}/categories",
+            json={"category_ids": [category_id]},
+        )
+
+    # Первый запрос прогревает кеш каталога
+    await client.get("/products", params={"category_id": category_id})
+    counts = []
+    for limit in (1, 5):
+        with count_queries() as statements:
+            response = await client.get(
+                "/products", params={"category_id": category_id, "limit": limit}
+            )
+        assert len(response.json()["items"]) == limit
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+async def test_categories_do_not_scale_with_categories(client):
+    counts = []
+    for _ in range(2):
+        for _ in range(3):
+            await client.post(
+                "/categories/", json={"name": unique("category"), "description": "d"}
+            )
+        with count_queries() as statements:
+            response = await client.get("/categories")
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+    # Без записей между запросами список отдаётся из кеша каталога
+    with count_queries() as statements:
+        await client.get("/categories")
+    assert statements == []
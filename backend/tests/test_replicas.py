@@ -0,0 +1,87 @@
+import pytest
+
+import db
+from cache import MISSING
+from conftest import count_queries, create_product, create_user, unique
+from search import get_search_backend
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def replica(monkeypatch):
+    # Реплика — та же база через отдельный движок: запросы к ней
+    # видны отдельно от запросов к primary
+    replicas = db.ReplicaSet([db.DATABASE_URL])
+    monkeypatch.setattr(db, "replicas", replicas)
+    yield replicas.engines[0]
+    await replicas.engines[0].dispose()
+
+
+async def test_search_backend_choice_keeps_session_on_replica(replica):
+    async with db.AsyncSessionLocal(info={"replica": replica}) as session:
+        get_search_backend(session)
+        assert not session.info.get("primary")
+
+
+async def test_search_runs_on_replica(client, replica):
+    product = await create_product(client, name=unique("репликапоиск"))
+    with (
+        count_queries() as primary,
+        count_queries(replica) as replica_statements,
+    ):
+        response = await client.get("/products/search", params={"q": product["name"]})
+
+    assert response.status_code == 200
+    assert product["id"] in [item["id"] for item in response.json()["items"]]
+    assert any("FROM products" in s for s in replica_statements)
+    # На primary — только версия каталога для ETag
+    assert not any("FROM products" in s for s in primary)
+
+
+async def test_profile_from_replica_does_not_fill_auth_cache(client, replica):
+    async with db.AsyncSessionLocal() as session:
+        user = db.User(
+            username=unique("user"), email="user@example.com", hashed_password="x"
+        )
+        session.add(user)
+        await session.commit()
+    key = f"user:{user.username}"
+
+    with count_queries(replica) as replica_statements:
+        response = await client.get(f"/users/{user.username}")
+
+    assert response.json()["username"] == user.username
+    assert any("FROM users" in s for s in replica_statements)
+    # Строка с реплики могла отстать: в кеш аутентификации она не попадает
+    assert db.principal_cache.local.get(key) is MISSING
+
+
+async def test_missing_product_on_replica_is_not_cached(client, replica):
+    product_id = 10**9
+    response = await client.get(f"/products/{product_id}/comments")
+
+    assert response.status_code == 404
+    assert db.catalog_cache.local.get(f"product:{product_id}") is MISSING
+
+
+async def test_writes_ignore_cached_missing_product(client):
+    product = await create_product(client, stock=1)
+    # «Товара нет» в кеше: проба до создания или отставшая реплика
+    db.catalog_cache.local.set(f"product:{product['id']}", None)
+
+    response = await client.patch(
+        f"/products/{product['id']}/categories", json={"category_ids": []}
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == product["id"]
+
+    response = await client.post(
+        "/cart/add",
+        json={
+            "user_id": await create_user(),
+            "product_id": product["id"],
+            "quantity": 5,
+        },
+    )
+    assert response.json()["message"] == "Недостаточно товара на складе"
@@ -1,8 +1,11 @@
+import asyncio
 import logging
 import os
+from dataclasses import dataclass
 from pathlib import Path
 
-from telegram import Update
+from telegram import PassportData, PassportFile, Update
+from telegram.error import NetworkError
 from telegram.ext import Application, ContextTypes, MessageHandler, filters
 from dotenv import load_dotenv
 
@@ -20,6 +23,127 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
+# Загрузка файлов паспорта: каталог, число одновременных загрузок,
+# таймаут одной попытки (с) и число повторов после неудачной попытки
+DOWNLOAD_DIR = Path(os.getenv("DOWNLOAD_DIR", "downloads"))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "30"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "2"))
+DOWNLOAD_RETRY_DELAY = 1.0
+
+# Общий для всех обработчиков: ограничивает число загрузок в процессе
+download_semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+ID_DOCUMENTS = ("passport", "driver_license", "identity_card", "internal_passport")
+ADDRESS_DOCUMENTS = (
+    "utility_bill",
+    "bank_statement",
+    "rental_agreement",
+    "passport_registration",
+    "temporary_registration",
+)
+
+
+@dataclass
+class Download:
+    """Файл паспорта и каталог, в который он сохраняется"""
+
+    file: PassportFile
+    directory: Path
+    name: str
+
+
+def collect_downloads(passport_data: PassportData, user_dir: Path) -> list[Download]:
+    """
+    Список файлов всех элементов паспорта
+    :param passport_data: Расшифрованные данные паспорта
+    :param user_dir: Каталог пользователя
+    """
+    downloads = []
+    for data in passport_data.decrypted_data:
+        directory = user_dir / data.type
+        if data.type in ADDRESS_DOCUMENTS:
+            for i, file in enumerate(data.files or ()):
+                downloads.append(Download(file, directory, f"file_{i}"))
+        if data.type in ID_DOCUMENTS and data.front_side:
+            downloads.append(Download(data.front_side, directory, "front_side"))
+        if data.type in ("driver_license", "identity_card") and data.reverse_side:
+            downloads.append(Download(data.reverse_side, directory, "reverse_side"))
+        if data.type in ID_DOCUMENTS and data.selfie:
+            downloads.append(Download(data.selfie, directory, "selfie"))
+        if data.translation and data.type in ID_DOCUMENTS + ADDRESS_DOCUMENTS:
+            for i, file in enumerate(data.translation):
+                downloads.append(Download(file, directory, f"translation_{i}"))
+    return downloads
+
+
+async def _download_once(download: Download) -> Path:
+    file = await download.file.get_file()
+    suffix = Path(file.file_path or "").suffix
+    target = download.directory / f"{download.name}{suffix}"
+    # Недокачанный файл не должен выглядеть готовым: пишем во временный
+    # и переименовываем после расшифровки
+    partial = target.with_name(target.name + ".part")
+    await file.download_to_drive(partial)
+    partial.replace(target)
+    return target
+
+
+async def download_file(download: Download) -> Path:
+    """
+    Загружает файл с таймаутом на попытку и повторами при сетевых ошибках
+    :return: Путь к сохранённому файлу
+    """
+    download.directory.mkdir(parents=True, exist_ok=True)
+    attempt = 0
+    while True:
+        try:
+            async with download_semaphore:
+                async with asyncio.timeout(DOWNLOAD_TIMEOUT):
+                    return await _download_once(download)
+        except (TimeoutError, NetworkError) as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            logger.warning(
+                "Загрузка %s/%s не удалась (%s), повтор %d",
+                download.directory.name,
+                download.name,
+                e,
+                attempt + 1,
+            )
+            # Пауза вне семафора: слот отдаётся другим файлам
+            await asyncio.sleep(DOWNLOAD_RETRY_DELAY * 2**attempt)
+            attempt += 1
+
+
+async def download_passport_files(
+    passport_data: PassportData, user_id: int
+) -> list[Path]:
+    """
+    Загружает все файлы паспорта параллельно в DOWNLOAD_DIR/<user_id>/<тип>/
+    :param passport_data: Расшифрованные данные паспорта
+    :param user_id: Telegram id отправителя
+    :return: Пути сохранённых файлов; файлы, не загруженные после всех
+        повторов, пропускаются и записываются в журнал
+    """
+    downloads = collect_downloads(passport_data, DOWNLOAD_DIR / str(user_id))
+    results = await asyncio.gather(
+        *(download_file(download) for download in downloads), return_exceptions=True
+    )
+    saved = []
+    for download, result in zip(downloads, results):
+        if isinstance(result, BaseException):
+            logger.error(
+                "Не удалось загрузить %s/%s: %r",
+                download.directory.name,
+                download.name,
+                result,
+            )
+        else:
+            saved.append(result)
+    return saved
+
+
 async def msg(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Downloads and prints the received passport data."""
     # Retrieve passport data
@@ -35,69 +159,18 @@ async def msg(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Print the decrypted credential data
     # For all elements
     # Print their decrypted data
-    # Files will be downloaded to current directory
     for data in passport_data.decrypted_data:  # This is where the data gets decrypted
         if data.type == "phone_number":
             logger.info("Phone: %s", data.phone_number)
         elif data.type == "email":
             logger.info("Email: %s", data.email)
-        if data.type in (
-            "personal_details",
-            "passport",
-            "driver_license",
-            "identity_card",
-            "internal_passport",
-            "address",
-        ):
-            logger.info(data.type, data.data)
-        if data.type in (
-            "utility_bill",
-            "bank_statement",
-            "rental_agreement",
-            "passport_registration",
-            "temporary_registration",
-        ):
-            logger.info(data.type, len(data.files), "files")
-            for file in data.files:
-                actual_file = await file.get_file()
-                logger.info(actual_file)
-                await actual_file.download_to_drive()
-        if (
-            data.type
-            in ("passport", "driver_license", "identity_card", "internal_passport")
-            and data.front_side
-        ):
-            front_file = await data.front_side.get_file()
-            logger.info(data.type, front_file)
-            await front_file.download_to_drive()
-        if data.type in ("driver_license" and "identity_card") and data.reverse_side:
-            reverse_file = await data.reverse_side.get_file()
-            logger.info(data.type, reverse_file)
-            await reverse_file.download_to_drive()
-        if (
-            data.type
-            in ("passport", "driver_license", "identity_card", "internal_passport")
-            and data.selfie
-        ):
-            selfie_file = await data.selfie.get_file()
-            logger.info(data.type, selfie_file)
-            await selfie_file.download_to_drive()
-        if data.translation and data.type in (
-            "passport",
-            "driver_license",
-            "identity_card",
-            "internal_passport",
-            "utility_bill",
-            "bank_statement",
-            "rental_agreement",
-            "passport_registration",
-            "temporary_registration",
-        ):
-            logger.info(data.type, len(data.translation), "translation")
-            for file in data.translation:
-                actual_file = await file.get_file()
-                logger.info(actual_file)
-                await actual_file.download_to_drive()
+        if data.type in ID_DOCUMENTS + ("personal_details", "address"):
+            logger.info("%s: %s", data.type, data.data)
+
+    # Files are downloaded concurrently to DOWNLOAD_DIR/<user_id>/<type>/
+    user_id = update.effective_user.id if update.effective_user else 0
+    saved = await download_passport_files(passport_data, user_id)
+    logger.info("Сохранено файлов: %d", len(saved))
 
 
 def main() -> None:
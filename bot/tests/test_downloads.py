@@ -0,0 +1,192 @@
+"""
+Загрузка файлов паспорта против поддельного Bot API на локальном HTTP-сервере
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+import pytest
+from telegram import Bot, PassportFile
+from telegram.request import HTTPXRequest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+TOKEN = "123:fake"
+DELAY = 0.2
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    """getMe, getFile и отдача файлов; считает одновременные загрузки"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeTelegramHandler)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        # file_id -> сколько первых попыток отдать с ошибкой 502
+        self.failures: dict[str, int] = {}
+        self.requests: dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    server: FakeTelegram
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, result: dict) -> None:
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self._reply(200, body, "application/json")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        params = {
+            key: values[0]
+            for key, values in parse_qs(self.rfile.read(length).decode()).items()
+        }
+        method = self.path.rsplit("/", 1)[-1]
+        if method == "getMe":
+            self._ok(
+                {
+                    "id": 123,
+                    "is_bot": True,
+                    "first_name": "Fake",
+                    "username": "fake_bot",
+                }
+            )
+        elif method == "getFile":
+            file_id = params["file_id"].strip('"')
+            self._ok(
+                {
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "file_size": len(file_id),
+                    "file_path": f"passport/{file_id}.jpg",
+                }
+            )
+        else:
+            self._reply(404, b"{}", "application/json")
+
+    def do_GET(self):
+        file_id = self.path.rsplit("/", 1)[-1].removesuffix(".jpg")
+        server = self.server
+        with server.lock:
+            server.requests[file_id] = server.requests.get(file_id, 0) + 1
+            attempt = server.requests[file_id]
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(DELAY)
+            if attempt <= server.failures.get(file_id, 0):
+                # Как Bot API: тело ошибки в JSON, иначе PTB не распознает 502
+                body = {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+                self._reply(502, json.dumps(body).encode(), "application/json")
+            else:
+                self._reply(200, file_id.encode(), "image/jpeg")
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def server():
+    server = FakeTelegram()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+async def bot(server):
+    bot = Bot(
+        TOKEN,
+        base_url=f"{server.url}/bot",
+        base_file_url=f"{server.url}/file/bot",
+        # Как у Application.builder(): пул на 256 соединений, а не на одно
+        request=HTTPXRequest(connection_pool_size=256),
+    )
+    async with bot:
+        yield bot
+
+
+@pytest.fixture(autouse=True)
+def download_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DOWNLOAD_DIR", tmp_path)
+    monkeypatch.setattr(main, "DOWNLOAD_RETRY_DELAY", 0.01)
+    monkeypatch.setattr(main, "download_semaphore", main.asyncio.Semaphore(3))
+
+
+def _passport(bot: Bot, file_ids: list[str]):
+    files = []
+    for file_id in file_ids:
+        file = PassportFile(file_id, file_id, file_date=0, file_size=len(file_id))
+        file.set_bot(bot)
+        files.append(file)
+    element = SimpleNamespace(
+        type="utility_bill",
+        files=files,
+        front_side=None,
+        reverse_side=None,
+        selfie=None,
+        translation=None,
+    )
+    return SimpleNamespace(decrypted_data=[element])
+
+
+async def test_downloads_run_concurrently_within_limit(bot, server, tmp_path):
+    file_ids = [f"doc{i}" for i in range(6)]
+    started = time.perf_counter()
+    saved = await main.download_passport_files(_passport(bot, file_ids), user_id=42)
+    elapsed = time.perf_counter() - started
+
+    assert sorted(path.read_bytes().decode() for path in saved) == file_ids
+    assert {path.parent for path in saved} == {tmp_path / "42" / "utility_bill"}
+    assert not list(tmp_path.rglob("*.part"))
+    assert server.max_active == 3
+    # Шесть файлов по DELAY при трёх одновременных — два «раунда», а не шесть
+    assert elapsed < len(file_ids) * DELAY
+
+
+async def test_network_error_is_retried(bot, server):
+    server.failures["flaky"] = 1
+    saved = await main.download_passport_files(_passport(bot, ["flaky"]), user_id=1)
+
+    assert [path.read_bytes() for path in saved] == [b"flaky"]
+    assert server.requests["flaky"] == 2
+
+
+async def test_failed_file_does_not_block_others(bot, server, monkeypatch):
+    monkeypatch.setattr(main, "DOWNLOAD_RETRIES", 1)
+    server.failures["broken"] = 10
+    saved = await main.download_passport_files(
+        _passport(bot, ["ok1", "broken", "ok2"]), user_id=1
+    )
+
+    assert sorted(path.name for path in saved) == ["file_0.jpg", "file_2.jpg"]
+    assert server.requests["broken"] == 2